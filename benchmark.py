@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import codecs
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import translations4wsd as en
+import translations4wsd_mwsd as mwsd
+from t4wsd import bundle
+from t4wsd.readers import iter_lines, glob_sources
+from t4wsd.scorer import evaluate as evaluate_answers
+from t4wsd.scoring import Batch, ranked_batch, get_p_trans, hard_decisions, soft_decisions, answers
+
+'''
+# Benchmark suite
+
+Every base system under base_outputs/ (ALL) and mwsd_base_outputs/ (tst files) is run stage by stage:
+
+    compile       ranked output -> bundle (cold, on a scaled copy of the file)
+    load          compiled bundle -> Batch                                                 (get_p_wsd)
+    constraints   mappings -> ConstraintIndex per language                                (load_trans_sense_constraint)
+    p_freq        per-pair sense frequency prior (systems that use it)
+    p_trans       smoothed translation expert                                              (get_p_trans)
+    soft          SoftConstraint decisions (all experts combined)
+    hard          HardConstraint decisions
+    evaluate      answers -> P / R / F1                                                    (evaluate_wsd)
+
+At scale k the base output is repeated k times (the copies keep the instance ids, so every copy is constrained).
+Each stage reports its best time over --repeat runs, instances/s and the peak memory it allocates (tracemalloc,
+in a separate untimed run); each (system, scale) case runs in its own forked process, whose max RSS is reported too.
+
+Results are appended to a JSONL history (one line per run, with the git commit); a run is compared with a previous
+one (--baseline) and fails when a stage is slower by more than --threshold.
+'''
+
+STAGES = ["compile", "load", "constraints", "p_freq", "p_trans", "soft", "hard", "evaluate"]
+COPY_MARK = "#" # separates an instance id from its copy number in scaled files
+
+
+def iter_cases(tasks, systems):
+
+    # (task, system, test, lang, ranked base output) of every base system
+    if "en" in tasks:
+        for f_path in glob_sources("base_outputs/ALL.*.ranked.out"):
+            system_name = f_path.split("/")[-1][len("ALL."):-len(".ranked.out")]
+            if not systems or system_name in systems:
+                yield {"task": "en", "system": system_name, "test": "ALL", "lang": "", "file": f_path}
+
+    if "mwsd" in tasks:
+        for f_path in glob_sources("mwsd_base_outputs/*.ranked.tst.out"):
+            test_name, lang, system_name = f_path.split("/")[-1][:-len(".ranked.tst.out")].split(".", 2)
+            if not systems or system_name in systems or system_name.split(".")[0] in systems:
+                yield {"task": "mwsd", "system": system_name, "test": test_name, "lang": lang, "file": f_path}
+
+
+def write_scaled(f_path, scale, out_path):
+
+    # the ranked output repeated scale times, ids of copy r > 0 suffixed with "#r"
+    lines = [line for line in iter_lines(f_path) if line.strip()]
+
+    with codecs.open(out_path, "w", encoding="utf-8") as newf:
+        for r in range(scale):
+            suffix = COPY_MARK + str(r) if r else ""
+            for line in lines:
+                i_id, rest = line.split("\t", 1)
+                newf.write(i_id + suffix + "\t" + rest + "\n")
+
+
+def parameters_of(case):
+
+    # (a, b, c, t_smoothing, s_smoothing or CluBERT lemma distributions) of the SoftConstraint run
+    if case["task"] == "en":
+        parameters = en.PARAMETERS[case["system"]]
+        return parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"], parameters["s_smoothing"]
+
+    test_case = case["test"] + " " + case["lang"].upper()
+    clubert_path = "clubert_v1.0/" + case["lang"] + "/lexemes_distributions.bnid.txt"
+    if os.path.exists(clubert_path) and case["system"] + ".clubert" in mwsd.PARAMETERS:
+        parameters = mwsd.PARAMETERS[case["system"] + ".clubert"][test_case]
+        return parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"], clubert_path
+
+    parameters = mwsd.PARAMETERS[case["system"]][test_case]
+
+    return parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"], None
+
+
+def run_stages(case, scaled_path, traced=False):
+
+    # {stage: seconds} (or, traced, {stage: peak bytes allocated}) of one pass over the stages, and the number of instances / pairs
+    measures = {}
+
+    def timed(stage, fn, *args):
+        if traced:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            result = fn(*args)
+            measures[stage] = tracemalloc.get_traced_memory()[1] - current
+            return result
+        start = time.perf_counter()
+        result = fn(*args)
+        measures[stage] = time.perf_counter() - start
+        return result
+
+    def load():
+        return ranked_batch([bundle.load_ranked(scaled_path)])
+
+    def load_constraints():
+        if case["task"] == "en":
+            return [en.load_trans_sense_constraint(case["test"], lang) for lang in en.MAPPING_NAMES]
+        return [mwsd.load_trans_sense_constraint(case["test"], mapping_path) for mapping_path in mwsd.get_mapping_path_list(case["test"], case["lang"])]
+
+    a, b, c, t_smoothing, prior = parameters_of(case)
+
+    def pair_p_freq(batch):
+        if case["task"] == "en":
+            return en.get_pair_p_freq(batch, en.get_p_freq(prior))
+        id_lemma_map = mwsd.load_id_lemma_map("mwsd_mappings/" + case["test"] + "_" + case["lang"] + "_lemma_bnsyn_mapping.txt")
+        return mwsd.get_pair_p_freq(batch, mwsd.get_p_freq(prior, id_lemma_map))
+
+    def evaluate(batch, best):
+        if case["task"] == "en":
+            key_file = "gold_keys/" + case["test"] + ".gold.key.txt"
+        else:
+            key_file = mwsd.get_key_file(case["test"], "tst", case["lang"])
+        return evaluate_answers(key_file, answers(batch, best))
+
+    zero_sum_one = case["task"] == "mwsd"
+    timed("compile", bundle.ensure_compiled, scaled_path, "ranked", None, True)
+    scaled = timed("load", load)
+    # copies keep the instance id, so they find their constraints, p_freq and gold senses
+    batch = Batch([i_id.split(COPY_MARK)[0] for i_id in scaled.ids], scaled.offsets, scaled.sense_ids, scaled.p_wsd, scaled.vocab)
+    t_s_constraints = timed("constraints", load_constraints)
+    p_freq = timed("p_freq", pair_p_freq, batch) if c and prior else None
+    timed("p_trans", get_p_trans, batch, t_s_constraints, t_smoothing, zero_sum_one)
+    best = timed("soft", soft_decisions, batch, t_s_constraints, p_freq, a, b, c, t_smoothing, zero_sum_one)
+    timed("hard", hard_decisions, batch, t_s_constraints)
+    timed("evaluate", evaluate, batch, best)
+
+    return measures, len(batch), len(batch.sense_ids)
+
+
+def run_case(job):
+
+    # rows of one (system, scale) case; runs in its own process
+    case, scale, repeat = job
+    tmp_dir = tempfile.mkdtemp(prefix="t4wsd-bench-")
+    scaled_path = os.path.join(tmp_dir, os.path.basename(case["file"]))
+    try:
+        write_scaled(case["file"], scale, scaled_path)
+
+        best_times = {}
+        for _ in range(repeat):
+            times, n_instances, n_pairs = run_stages(case, scaled_path)
+            for stage, seconds in times.items():
+                best_times[stage] = min(seconds, best_times.get(stage, seconds))
+
+        # allocation peaks of every stage, in a separate run (tracing slows the stages down)
+        tracemalloc.start()
+        try:
+            peaks, _, _ = run_stages(case, scaled_path, traced=True)
+        finally:
+            tracemalloc.stop()
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    finally:
+        shutil.rmtree(bundle.artifact_dir(scaled_path), ignore_errors=True)
+        try:
+            os.removedirs(os.path.dirname(bundle.artifact_dir(scaled_path)))
+        except OSError:
+            pass
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    rows = []
+    for stage in STAGES:
+        if stage not in best_times:
+            continue
+        seconds = best_times[stage]
+        rows.append({"task": case["task"], "system": case["system"], "test": case["test"], "lang": case["lang"], "scale": scale, "stage": stage,
+                     "instances": n_instances, "pairs": n_pairs, "seconds": seconds,
+                     "instances_per_s": n_instances / seconds if seconds > 0 else None,
+                     "peak_mb": peaks.get(stage, 0) / 1048576.0, "max_rss_mb": max_rss_mb})
+
+    return rows
+
+
+def run_benchmark(cases, scales, repeat):
+
+    # rows of every (system, scale) case, each case in a fresh forked process (so max RSS is its own)
+    jobs = [(case, scale, repeat) for scale in scales for case in cases]
+    rows = []
+    if "fork" in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context("fork").Pool(1, maxtasksperchild=1) as pool:
+            for case_rows in pool.imap(run_case, jobs):
+                rows.extend(case_rows)
+                sys.stderr.write(case_rows[0]["system"] + " " + case_rows[0]["test"] + " " + case_rows[0]["lang"] + " x" + str(case_rows[0]["scale"]) + ": %.2fs\n" % sum(row["seconds"] for row in case_rows))
+    else:
+        for job in jobs:
+            rows.extend(run_case(job))
+
+    return rows
+
+
+def git_commit():
+
+    # (commit, whether the tree has uncommitted changes); ("", False) outside a git checkout
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return "", False
+
+    return commit, bool(status.strip())
+
+
+def load_history(history_path):
+
+    history = []
+    if os.path.exists(history_path):
+        with open(history_path) as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+
+    return history
+
+
+def find_baseline(history, baseline):
+
+    # "last": the latest run on this host; anything else: the latest run whose commit starts with it
+    host = platform.node()
+    for run in reversed(history):
+        if baseline == "last" and run.get("host") == host:
+            return run
+        if baseline != "last" and run.get("commit", "").startswith(baseline):
+            return run
+
+    return None
+
+
+def row_key(row):
+
+    return (row["task"], row["system"], row["test"], row["lang"], row["scale"], row["stage"])
+
+
+def compare(rows, baseline_rows, threshold, min_seconds):
+
+    # rows slower than the baseline by more than threshold (stages under min_seconds in the baseline are noise)
+    baseline_seconds = {row_key(row): row["seconds"] for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        before = baseline_seconds.get(row_key(row))
+        row["baseline_seconds"] = before
+        if before is None or before < min_seconds:
+            continue
+        if row["seconds"] > before * (1.0 + threshold):
+            regressions.append(row)
+
+    return regressions
+
+
+def print_table(rows):
+
+    print("system\ttest\tlang\tscale\tstage\tinstances\tseconds\tinstances/s\tpeak MB\tmax RSS MB\tvs baseline")
+    for row in rows:
+        ratio = ""
+        if row.get("baseline_seconds"):
+            ratio = "%.2fx" % (row["seconds"] / row["baseline_seconds"])
+        print("\t".join([row["system"], row["test"], row["lang"], str(row["scale"]), row["stage"], str(row["instances"]),
+                         "%.4f" % row["seconds"], "%.0f" % row["instances_per_s"] if row["instances_per_s"] else "-",
+                         "%.1f" % row["peak_mb"], "%.1f" % row["max_rss_mb"], ratio]))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the load, constraint, scoring and evaluation stages on every base system")
+
+    parser.add_argument("--task", default="en,mwsd", help="comma-separated tasks (en, mwsd; default: en,mwsd)")
+    parser.add_argument("-s", "--system", default="", help="comma-separated base systems (default: every system in base_outputs/ and mwsd_base_outputs/)")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated input scales, the base output repeated k times (default: 1,10,100; e.g. 1,10,100,1000)")
+    parser.add_argument("--repeat", default=3, type=int, help="runs per case, the best time of each stage is kept (default: 3)")
+    parser.add_argument("-H", "--history", default="benchmark_history.jsonl", help="JSONL file the results are appended to (default: benchmark_history.jsonl)")
+    parser.add_argument("--baseline", default="last", help="run to compare with: last (latest run on this host) or a commit prefix (default: last)")
+    parser.add_argument("--threshold", default=0.25, type=float, help="fail when a stage is slower than the baseline by more than this fraction (default: 0.25)")
+    parser.add_argument("--min-seconds", default=0.01, type=float, help="stages faster than this in the baseline are not checked (default: 0.01)")
+    parser.add_argument("--no-save", default=False, action="store_true", help="flag to not append this run to the history (default: False)")
+
+    args = parser.parse_args()
+
+    tasks = args.task.split(",")
+    systems = [s for s in args.system.split(",") if s]
+    scales = [int(k) for k in args.scales.split(",")]
+
+    cases = list(iter_cases(tasks, systems))
+    if not cases:
+        print("no base system matches!")
+        sys.exit(1)
+
+    rows = run_benchmark(cases, scales, args.repeat)
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, args.baseline)
+    regressions = compare(rows, baseline["results"], args.threshold, args.min_seconds) if baseline is not None else []
+
+    print_table(rows)
+
+    commit, dirty = git_commit()
+    if not args.no_save:
+        run = {"commit": commit, "dirty": dirty, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+               "python": platform.python_version(), "numpy": np.__version__, "scales": scales, "repeat": args.repeat,
+               "results": [{key: value for key, value in row.items() if key != "baseline_seconds"} for row in rows]}
+        with open(args.history, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+    if baseline is None:
+        sys.stderr.write("no baseline run to compare with in " + args.history + "\n")
+        return
+
+    sys.stderr.write("compared with " + (baseline["commit"][:12] or "(no commit)") + " of " + baseline["time"] + "\n")
+    if regressions:
+        for row in regressions:
+            sys.stderr.write("regression: " + row["system"] + " " + row["test"] + " " + row["lang"] + " x" + str(row["scale"]) + " " + row["stage"]
+                             + ": %.4fs -> %.4fs\n" % (row["baseline_seconds"], row["seconds"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from t4wsd import bundle
+from t4wsd.loader import compile_sources, stale_sources, default_workers
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compile base outputs, mappings, gold keys and index.sense into the memory-mapped data bundle.")
+
+    parser.add_argument("files", nargs="*", help="source files to compile (default: everything under " + ", ".join(bundle.SOURCE_DIRS) + ", and index.sense)")
+    parser.add_argument("-f", "--force", default=False, action="store_true", help="rebuild even if the compiled bundle is up to date (default: False)")
+    parser.add_argument("-j", "--jobs", default=default_workers(), type=int, help="worker processes; files larger than --chunk-mb are parsed in chunks side by side, 1 compiles in this process (default: number of CPUs)")
+    parser.add_argument("--chunk-mb", default=bundle.CHUNK_BYTES >> 20, type=float, help="size of the chunks a large file is cut into, in MB (default: " + str(bundle.CHUNK_BYTES >> 20) + ")")
+
+    args = parser.parse_args()
+
+    if args.files:
+        sources = [(file_path,) + bundle.source_kind(file_path) for file_path in args.files]
+    else:
+        sources = list(bundle.iter_sources())
+
+    for file_path, kind, n_fields in sources:
+        if kind is None:
+            print("skip (unknown format): " + file_path)
+    sources = [source for source in sources if source[1] is not None]
+
+    if args.jobs > 1: # compiled by the pool, then only their manifests are read below
+        if args.force:
+            stale = [(bundle.resolve_path(file_path), kind, n_fields) for file_path, kind, n_fields in sources]
+        else:
+            stale = stale_sources([file_path for file_path, _, _ in sources])
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            compile_sources(pool, stale, int(args.chunk_mb * (1 << 20)), args.force)
+
+    for file_path, kind, n_fields in sources:
+        manifest = bundle.ensure_compiled(file_path, kind, n_fields, force=args.force and args.jobs <= 1)
+        print(kind + "\t" + file_path + "\t" + manifest["sha1"])
+
+
+if __name__ == "__main__":
+    main()
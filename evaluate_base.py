@@ -1,52 +1,44 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import codecs
 from collections import defaultdict
 import sys
 import argparse
-import subprocess
+
+from t4wsd import bundle
+from t4wsd.bundle import iter_ranked
+from t4wsd.scorer import report
 
 
 def get_base_output(system_name, test_name):
 
     f_path = "base_outputs/ALL." + system_name + ".ranked.out"
 
-    with codecs.open(f_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    # only the rows of the data set are read (partition index of the bundle)
+    ranked = bundle.load_ranked(f_path)
+    rows = None if test_name == "ALL" else bundle.partition_rows(ranked, test_name)
 
     out = {}
-    for line in lines:
-        line = line.rstrip("\n")
-        full_i_id = line.split("\t")[0]
+    for full_i_id, ranked_sense_scores in iter_ranked(ranked, rows):
         test_id = full_i_id.split(".")[0]
         i_id = ".".join(full_i_id.split(".")[1:])
+        prediction = ranked_sense_scores[0][0]
 
         if test_name == "ALL":
-            ranked_sense_scores = line.split("\t")[1:]
-            prediction = ranked_sense_scores[0].split(" ")[0]
             out[full_i_id] = prediction
 
         if test_name != "ALL" and test_id == test_name:
-            ranked_sense_scores = line.split("\t")[1:]
-            prediction = ranked_sense_scores[0].split(" ")[0]
             out[i_id] = prediction
 
     return out
 
 
-def run_scorer(test_name):
+def run_scorer(test_name, out, java_scorer=False):
 
     key_file = "gold_keys/" + test_name + ".gold.key.txt"
 
-    #cmd1 = "javac Scorer.java"
-    #subprocess.run(cmd1, shell=True)
-    cmd2 = "java Scorer " + key_file + " tmp.out"
-
-    out1 = subprocess.check_output(cmd2)
-    out2 = out1.decode()
-
-    print(out2.rstrip("\r\n"))
+    # scored in-process; java_scorer cross-checks with Scorer.java (through a private temporary file)
+    report(key_file, out, java_scorer=java_scorer)
 
 
 def main():
@@ -55,22 +47,13 @@ def main():
 
     parser.add_argument("-s", "--system", default="", help="name of the base WSD system (babelfy_plain, babelfy_full, ukb_plain, ukb_full, ims, lmms)")
     parser.add_argument("-t", "--test", default="", help="name of test data set (senseval2, senseval3, semeval2007, semeval2013, semeval2015, ALL)") 
+    parser.add_argument("--java-scorer", default=False, action="store_true", help="flag to score with Scorer.java instead of the in-process scorer, as a cross-check (default: False)")
 
     args = parser.parse_args() 
 
     out = get_base_output(args.system, args.test)
 
-    newf = codecs.open("tmp.out", "w", encoding="utf-8")
-    for i_id, sense in out.items():
-        line = i_id + " " + sense + "\n"
-        newf.write(line)
-
-    newf.close()
-
-    run_scorer(args.test)
-
-    rm_cmd = "rm -f tmp.out"
-    subprocess.run(rm_cmd, shell=True)
+    run_scorer(args.test, out, args.java_scorer)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import codecs
 from collections import defaultdict
 import sys
 import argparse
-import subprocess
+
+from t4wsd import bundle
+from t4wsd.bundle import iter_ranked
+from t4wsd.scorer import report
 
 
 def get_base_output(system_name, test_name, lang, t_type):
@@ -15,49 +17,28 @@ def get_base_output(system_name, test_name, lang, t_type):
     else:
         f_path = "mwsd_base_outputs/" + test_name + "." + lang.lower() + "." + system_name + ".ranked." + t_type + ".out"
 
-    with codecs.open(f_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
     out = {}
-    for line in lines:
-        line = line.rstrip("\n")
-        i_id = line.split("\t")[0]
-        ranked_sense_scores = line.split("\t")[1:]
-        prediction = ranked_sense_scores[0].split(" ")[0]
-        out[i_id] = prediction
+    for i_id, ranked_sense_scores in iter_ranked(bundle.load_ranked(f_path)):
+        out[i_id] = ranked_sense_scores[0][0]
 
     if t_type == "all": 
         f_path = "mwsd_base_outputs/" + test_name + "." + lang + "." + system_name + ".ranked.tst.out" # add remaining instances
         
-        with codecs.open(f_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            line = line.rstrip("\n")
-            i_id = line.split("\t")[0]
-            ranked_sense_scores = line.split("\t")[1:]
-            prediction = ranked_sense_scores[0].split(" ")[0]
-            out[i_id] = prediction
-
+        for i_id, ranked_sense_scores in iter_ranked(bundle.load_ranked(f_path)):
+            out[i_id] = ranked_sense_scores[0][0]
 
     return out
 
 
-def run_scorer(test_name, lang, t_type):
+def run_scorer(test_name, lang, t_type, out, java_scorer=False):
 
     if t_type == "all":
         key_file = "mwsd_gold_keys/" + test_name + "_" + lang.lower() + ".gold.key.txt"
     else:
         key_file = "mwsd_gold_keys/" + test_name + "_" + lang.lower() + ".gold." + t_type + ".key"
 
-    #cmd1 = "javac Scorer.java"
-    #subprocess.run(cmd1, shell=True)
-    cmd2 = "java Scorer " + key_file + " tmp.out"
-
-    out1 = subprocess.check_output(cmd2)
-    out2 = out1.decode()
-
-    print(out2.rstrip("\r\n"))
+    # scored in-process; java_scorer cross-checks with Scorer.java (through a private temporary file)
+    report(key_file, out, java_scorer=java_scorer)
 
 
 def main():
@@ -68,22 +49,13 @@ def main():
     parser.add_argument("-t", "--test", default="", help="name of test data set (semeval2013, semeval2015)") 
     parser.add_argument("-l", "--lang", default="", help="test language (de, es, fr, it)")
     parser.add_argument("--type", default="", help="type of the test file (dev, tst, all)")
+    parser.add_argument("--java-scorer", default=False, action="store_true", help="flag to score with Scorer.java instead of the in-process scorer, as a cross-check (default: False)")
 
     args = parser.parse_args() 
 
     out = get_base_output(args.system, args.test, args.lang, args.type)
 
-    newf = codecs.open("tmp.out", "w", encoding="utf-8")
-    for i_id, sense in out.items():
-        line = i_id + " " + sense + "\n"
-        newf.write(line)
-
-    newf.close()
-
-    run_scorer(args.test, args.lang, args.type)
-
-    rm_cmd = "rm -f tmp.out"
-    subprocess.run(rm_cmd, shell=True)
+    run_scorer(args.test, args.lang, args.type, out, args.java_scorer)
 
 
 if __name__ == "__main__":
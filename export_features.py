@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import os
+import time
+
+from t4wsd import features
+from t4wsd.api import EnglishWSD, MultilingualWSD
+
+'''
+# Feature export
+
+Writes the (instance, candidate sense) feature table of a base system (t4wsd/features.py) under features/:
+
+    python export_features.py -s ims -t ALL                                      -> features/ALL.ims.npz
+    python export_features.py --task mwsd -s sensembert -t semeval2013 -l de    -> features/semeval2013.de.sensembert.tst.npz
+
+Parquet (.parquet) is written instead when pyarrow is installed, or with --format parquet. A table whose sources
+and options did not change is kept (--force rebuilds it).
+'''
+
+
+def default_name(args, system_name):
+
+    if args.task == "en":
+        return args.test + "." + system_name
+    return args.test + "." + args.lang + "." + system_name + "." + args.type
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export the (instance, candidate sense) feature table of a base WSD system")
+
+    parser.add_argument("--task", default="en", help="en (English all-words WSD) or mwsd (multilingual WSD) (default: en)")
+    parser.add_argument("-s", "--system", default="", help="name of the base WSD system (en: babelfy_plain, babelfy_full, ukb_plain, ukb_full, ims, lmms; mwsd: ims, sensembert)")
+    parser.add_argument("-t", "--test", default="ALL", help="name of test data set (en: senseval2, ..., semeval2015, ALL; mwsd: semeval2013, semeval2015) (default: ALL)")
+    parser.add_argument("-l", "--lang", default="", help="test language for mwsd (de, es, fr, it)")
+    parser.add_argument("--type", default="tst", help="type of the mwsd test file (dev, tst, all) (default: tst)")
+    parser.add_argument("--temb", default=False, action="store_true", help="flag to export the t_emb output of SensEmBERT (mwsd, default: False)")
+    parser.add_argument("-L", "--langs", default="FR,DE,RU", help="comma-separated pivot languages for en (default: FR,DE,RU)")
+    parser.add_argument("-o", "--out", default="", help="output file, .npz or .parquet (default: features/<test>.<system>.<format>, mwsd: features/<test>.<lang>.<system>.<type>.<format>)")
+    parser.add_argument("--format", default=None, choices=features.FORMATS, help="npz or parquet (default: parquet when pyarrow is installed, else npz)")
+    parser.add_argument("--force", default=False, action="store_true", help="flag to rebuild the table even if its sources did not change (default: False)")
+
+    args = parser.parse_args()
+
+    if args.task not in ("en", "mwsd"):
+        parser.error("--task must be en or mwsd")
+    if not args.system or (args.task == "mwsd" and (not args.lang or args.test == "ALL")):
+        parser.error("-s is needed, and -t and -l with --task mwsd")
+
+    system_name = args.system + ".temb" if args.temb else args.system
+    out_format = args.format or features.default_format()
+    out_path = args.out or os.path.join("features", default_name(args, system_name) + "." + out_format)
+
+    if out_path.endswith(".parquet") and features.pyarrow is None:
+        parser.error("writing Parquet needs the pyarrow package (pip install pyarrow), or use --format npz")
+
+    start = time.perf_counter()
+    if args.task == "en":
+        en = EnglishWSD(langs=args.langs.split(","))
+        meta = features.english_meta(en, system_name, args.test)
+        build = lambda: features.english_features(en, system_name, args.test)
+    else:
+        mwsd = MultilingualWSD()
+        meta = features.multilingual_meta(mwsd, system_name, args.test, args.lang, args.type)
+        build = lambda: features.multilingual_features(mwsd, system_name, args.test, args.lang, args.type)
+
+    if not args.force and features.load_meta(out_path) == meta:
+        print(out_path + " is up to date")
+        return
+
+    columns = build()
+    features.save_features(out_path, columns, meta)
+    print(out_path + ": " + str(len(columns["i_id"])) + " rows, " + str(len(columns)) + " columns (" + str(round(time.perf_counter() - start, 2)) + " s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import codecs
+import os
+
+from t4wsd import synth
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of any size, resampled from the ranked outputs, mappings and gold keys of this repository.")
+
+    parser.add_argument("-d", "--out-dir", default="synthetic", help="directory of the synthetic corpus, laid out like this repository (default: synthetic)")
+    parser.add_argument("--src", default=".", help="repository the distributions are learned from (default: .)")
+    parser.add_argument("--scale", default=10.0, type=float, help="size of the synthetic corpus relative to the real one (default: 10)")
+    parser.add_argument("--seed", default=0, type=int, help="random seed; the same seed gives the same corpus (default: 0)")
+    parser.add_argument("--task", default="en,mwsd", help="comma-separated corpora to generate (en, mwsd; default: en,mwsd)")
+    parser.add_argument("--stats", default=False, action="store_true", help="flag to print the distributions of the real and synthetic files (default: False)")
+
+    args = parser.parse_args()
+
+    tasks = args.task.split(",")
+    corpora = []
+    if "en" in tasks:
+        corpora.append(synth.en_corpus(args.src))
+    if "mwsd" in tasks:
+        corpora.extend(synth.mwsd_corpora(args.src))
+
+    for sub_dir in ("outputs", "mwsd_outputs"):
+        os.makedirs(os.path.join(args.out_dir, sub_dir), exist_ok=True)
+
+    # index.sense entries of every lemma the English corpus mentions (p_freq)
+    prior_path = os.path.join(args.src, "index.sense")
+    prior_groups = None
+    prior_file = None
+    if "en" in tasks and os.path.exists(prior_path):
+        prior_groups = synth.read_prior_groups(prior_path)
+        prior_file = codecs.open(os.path.join(args.out_dir, "index.sense"), "w", encoding="utf-8")
+
+    try:
+        for corpus in corpora:
+            if not len(corpus):
+                continue
+            if corpus.name == "en":
+                n_instances = synth.generate(corpus, args.out_dir, args.scale, args.seed, prior_groups, prior_file)
+            else:
+                n_instances = synth.generate(corpus, args.out_dir, args.scale, args.seed)
+            print(corpus.name + ": " + str(n_instances) + " instances (" + str(len(corpus)) + " templates), " + str(len(corpus.files)) + " files")
+    finally:
+        if prior_file is not None:
+            prior_file.close()
+
+    if args.stats:
+        print("file\tkind\t" + "\t".join(["instances", "candidates", "monosemous", "top_score", "coverage"]) + "\t(real -> synthetic)")
+        for corpus in corpora:
+            for source in corpus.files:
+                if source.kind not in ("ranked", "mapping"):
+                    continue
+                real = synth.file_stats(os.path.join(args.src, source.rel_path), source.kind)
+                synthetic = synth.file_stats(os.path.join(args.out_dir, source.rel_path), source.kind)
+                values = []
+                for key in ["instances", "candidates", "monosemous", "top_score", "coverage"]:
+                    if key not in real:
+                        values.append("-")
+                    elif key == "instances":
+                        values.append(str(real[key]) + " -> " + str(synthetic[key]))
+                    else:
+                        values.append("%.3f -> %.3f" % (real[key], synthetic[key]))
+                print(source.rel_path + "\t" + source.kind + "\t" + "\t".join(values))
+
+
+if __name__ == "__main__":
+    main()
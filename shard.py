@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from t4wsd import shard
+from t4wsd.scorer import scores_from_counts, format_scores
+
+'''
+# Sharded execution
+
+translations4wsd.py / translations4wsd_mwsd.py on a corpus split by document into N shards (t4wsd/shard.py):
+
+    split   the repository's inputs into <shard dir>/shard-<k>/, kept while the sources and N do not change
+    run     the script with the same arguments in every shard directory, --jobs shards at a time
+            (each shard is an independent process; on a cluster every node runs the printed command of its shard,
+            then --merge-only merges their outputs)
+    merge   the shard outputs into outputs/ (mwsd_outputs/), the summed score counts printed as P / R / F1
+
+    python shard.py -n 8 -j 4 translations4wsd.py -s ims -t ALL -m soft -o ALL.ims.soft.out
+
+The merged output holds the lines of shard 0, then shard 1, ...; its <out>.stats.json the merged score counts,
+the counts of every shard and the summed engine counters. Each shard's log is <shard>/<out>.log.
+'''
+
+SCRIPTS = ["translations4wsd.py", "translations4wsd_mwsd.py"]
+
+
+def script_out(script_args):
+
+    # value of -o / --out in the script's arguments
+    for k, arg in enumerate(script_args):
+        if arg in ("-o", "--out") and k + 1 < len(script_args):
+            return script_args[k + 1]
+        if arg.startswith("--out="):
+            return arg[len("--out="):]
+
+    return ""
+
+
+def absolute_params(script_args):
+
+    # a -p / --params table given relative to the repository, as seen from a shard directory
+    script_args = list(script_args)
+    for k, arg in enumerate(script_args):
+        if arg in ("-p", "--params") and k + 1 < len(script_args):
+            script_args[k + 1] = os.path.abspath(script_args[k + 1])
+        elif arg.startswith("--params="):
+            script_args[k] = "--params=" + os.path.abspath(arg[len("--params="):])
+
+    return script_args
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run translations4wsd.py or translations4wsd_mwsd.py on a corpus split by document into shards, and merge the outputs and scores")
+
+    parser.add_argument("-n", "--shards", default=4, type=int, help="number of shards (default: 4)")
+    parser.add_argument("-d", "--shard-dir", default="shards", help="directory of the shard directories (default: shards)")
+    parser.add_argument("-j", "--jobs", default=os.cpu_count() or 1, type=int, help="shards run at the same time (default: number of CPUs)")
+    parser.add_argument("--split-only", default=False, action="store_true", help="flag to only split the inputs into the shard directories (default: False)")
+    parser.add_argument("--merge-only", default=False, action="store_true", help="flag to only merge the outputs the shards have written, e.g. on a cluster (default: False)")
+    parser.add_argument("--print-commands", default=False, action="store_true", help="flag to print the command of every shard (cwd, then command) instead of running them, e.g. to submit them to a cluster (default: False)")
+    parser.add_argument("script", nargs="?", default="", help="script run in every shard (translations4wsd.py or translations4wsd_mwsd.py)")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER, help="arguments of the script (-m hard or soft, with -o)")
+
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if not args.split_only:
+        if os.path.basename(args.script) not in SCRIPTS:
+            parser.error("script must be one of " + ", ".join(SCRIPTS))
+        if not script_out(args.script_args):
+            parser.error("the script needs -o / --out, the name of the output merged under outputs/ (mwsd_outputs/)")
+
+    if args.merge_only:
+        shard_paths = shard.shard_paths(args.shard_dir, args.shards)
+    else:
+        shard_paths = shard.split(".", args.shard_dir, args.shards)
+    if args.split_only:
+        return
+
+    command = shard.shard_command(args.script, absolute_params(args.script_args))
+    out_dir = "mwsd_outputs" if "mwsd" in os.path.basename(args.script) else "outputs"
+    out_name = script_out(args.script_args)
+
+    if args.print_commands:
+        for shard_path in shard_paths:
+            print(os.path.abspath(shard_path) + "\t" + " ".join(command))
+        return
+
+    log_paths = [os.path.join(shard_path, out_name + ".log") for shard_path in shard_paths]
+    if not args.merge_only:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            codes = list(pool.map(shard.run_shard, shard_paths, [command] * len(shard_paths), log_paths))
+
+        failed = [log_path for log_path, code in zip(log_paths, codes) if code != 0]
+        if failed:
+            sys.exit("failed shards, see " + ", ".join(failed))
+
+    out_paths = [os.path.join(shard_path, out_dir, out_name) for shard_path in shard_paths]
+    try:
+        merged = shard.merge(out_paths, os.path.join(out_dir, out_name))
+    except (OSError, ValueError) as e:
+        sys.exit(str(e) + " (every shard is merged from its output and <out>.stats.json, which --no-stats leaves out)")
+
+    score = merged["score"]
+    if score is None:
+        refused = [log_path for log_path, shard_score in zip(log_paths, merged["shard_scores"]) if shard_score is None]
+        sys.exit("outputs merged, not scored: the scorer refused the answers of " + ", ".join(refused))
+    print(format_scores(*scores_from_counts(score["ok"], score["notok"], score["gold"])))
+
+
+if __name__ == "__main__":
+    main()
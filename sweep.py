@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import codecs
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+import translations4wsd as en
+import translations4wsd_mwsd as mwsd
+from t4wsd.output import AtomicWriter, write_predictions
+from t4wsd.priors import PriorStore
+from t4wsd.scorer import ScorerError, load_key, score, java_percent
+from t4wsd.scoring import hard_decisions, soft_decisions, answers
+
+'''
+# Experiment sweep
+
+Every configuration of a matrix of (task, system, test set, language, type, method, clubert, temb) in one run:
+
+    parent:   base outputs, constraints, p_freq and gold keys of all configurations are loaded once
+    workers:  a pool of forked processes inherits them (read-only, shared page by page with the parent)
+              and reranks, writes and scores one configuration at a time
+
+Each configuration writes its own output (named like the files under outputs/ and mwsd_outputs/) under --out-dir,
+and one results table (results.tsv) collects P / R / F1 of every configuration.
+'''
+
+EN_SYSTEMS = ["babelfy_plain", "babelfy_full", "ukb_plain", "ukb_full", "ims", "lmms"]
+EN_TESTS = ["senseval2", "senseval3", "semeval2007", "semeval2013", "semeval2015", "ALL"]
+EN_LANGS = ["FR", "DE", "RU"]
+
+MWSD_SYSTEMS = ["ims", "sensembert"]
+MWSD_TESTS = {"semeval2013": ["de", "es", "fr", "it"], "semeval2015": ["es", "it"]}
+
+METHODS = ["base", "hard", "soft"]
+COLUMNS = ["task", "system", "test", "lang", "type", "method", "clubert", "temb", "instances", "P", "R", "F1", "seconds", "out"]
+
+SHARED = {} # resources loaded by the parent, inherited by the forked workers
+
+
+def parse_list(value, choices):
+
+    # "a,b" -> ["a", "b"] in the order given; "" -> every choice
+    values = value.split(",") if value else choices
+
+    return [v for k, v in enumerate(values) if v and v not in values[:k]]
+
+
+def parse_flags(value):
+
+    # "off,on" -> [False, True]
+    flags = []
+    for v in value.split(","):
+        if v not in ("off", "on"):
+            raise ValueError("expected off and/or on, got " + v)
+        flags.append(v == "on")
+
+    return flags
+
+
+def expand_configs(args):
+
+    # every valid configuration of the matrix, in matrix order
+    tasks = parse_list(args.task, ["en", "mwsd"])
+    systems = parse_list(args.system, EN_SYSTEMS + MWSD_SYSTEMS)
+    tests = parse_list(args.test, EN_TESTS + list(MWSD_TESTS))
+    langs = parse_list(args.lang, ["de", "es", "fr", "it"])
+    t_types = parse_list(args.type, ["tst"])
+    methods = parse_list(args.method, METHODS)
+    clubert_flags = parse_flags(args.clubert)
+    temb_flags = parse_flags(args.temb)
+
+    configs = []
+    if "en" in tasks:
+        for system_name in systems:
+            for test_name in tests:
+                if system_name not in EN_SYSTEMS or test_name not in EN_TESTS:
+                    continue
+                for method in methods:
+                    configs.append({"task": "en", "system": system_name, "test": test_name, "lang": "", "type": "",
+                                    "method": method, "clubert": False, "temb": False})
+
+    if "mwsd" in tasks:
+        for system_name in systems:
+            for test_name in tests:
+                if system_name not in MWSD_SYSTEMS or test_name not in MWSD_TESTS:
+                    continue
+                for lang in langs:
+                    if lang not in MWSD_TESTS[test_name]:
+                        continue
+                    for t_type in t_types:
+                        for temb in temb_flags:
+                            if temb and system_name != "sensembert": # t_emb is only for sensembert
+                                continue
+                            for method in methods:
+                                for clubert in clubert_flags:
+                                    if clubert and method != "soft": # CluBERT is p_freq of SoftConstraint
+                                        continue
+                                    configs.append({"task": "mwsd", "system": system_name, "test": test_name, "lang": lang, "type": t_type,
+                                                    "method": method, "clubert": clubert, "temb": temb})
+
+    return configs
+
+
+def base_name(config):
+
+    # name of the base system, as used for the ranked outputs and the parameter tables
+    if config["temb"]:
+        return config["system"] + ".temb"
+
+    return config["system"]
+
+
+def out_name(config):
+
+    # named like the outputs in outputs/ and mwsd_outputs/ (semeval2013.de.sensembert.soft.clubert.temb.tst.out)
+    if config["task"] == "en":
+        return config["test"] + "." + config["system"] + "." + config["method"] + ".out"
+
+    name = config["test"] + "." + config["lang"] + "." + config["system"] + "." + config["method"]
+    if config["clubert"]:
+        name += ".clubert"
+    if config["temb"]:
+        name += ".temb"
+
+    return name + "." + config["type"] + ".out"
+
+
+def key_file(config):
+
+    if config["task"] == "en":
+        return "gold_keys/" + config["test"] + ".gold.key.txt"
+
+    return mwsd.get_key_file(config["test"], config["type"], config["lang"])
+
+
+def load_shared(configs, params_path=""):
+
+    # everything the configurations read, loaded once
+    batches = {}
+    constraints = {}
+    lemma_sense_freq = {}
+
+    for config in configs:
+        test_name = config["test"]
+        load_key(key_file(config))
+
+        if config["task"] == "en":
+            if (config["system"], test_name) not in batches:
+                batches[(config["system"], test_name)] = en.get_p_wsd(config["system"], test_name)
+            if config["method"] != "base" and ("en", test_name) not in constraints:
+                constraints[("en", test_name)] = [en.load_trans_sense_constraint(test_name, lang) for lang in EN_LANGS]
+            if config["method"] == "soft" and en.get_parameters(config["system"], test_name, params_path)["s_smoothing"]:
+                PriorStore.load("index.sense")
+            continue
+
+        lang = config["lang"]
+        batch_key = (base_name(config), test_name, lang, config["type"])
+        if batch_key not in batches:
+            batches[batch_key] = mwsd.get_p_wsd(base_name(config), test_name, lang, config["type"])
+        if config["method"] != "base" and ("mwsd", test_name, lang) not in constraints:
+            constraints[("mwsd", test_name, lang)] = [mwsd.load_trans_sense_constraint(test_name, mapping_path) for mapping_path in mwsd.get_mapping_path_list(test_name, lang)]
+        if config["clubert"] and (test_name, lang) not in lemma_sense_freq:
+            id_lemma_map = mwsd.load_id_lemma_map("mwsd_mappings/" + test_name + "_" + lang + "_lemma_bnsyn_mapping.txt")
+            lemma_sense_freq[(test_name, lang)] = mwsd.get_p_freq("clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt", id_lemma_map)
+
+    SHARED.update({"batches": batches, "constraints": constraints, "lemma_sense_freq": lemma_sense_freq, "params_path": params_path})
+
+
+def decide(config):
+
+    # (batch, index of the answer within each instance) of a configuration
+    test_name = config["test"]
+    params_path = SHARED["params_path"]
+
+    if config["task"] == "en":
+        batch = SHARED["batches"][(config["system"], test_name)]
+        t_s_constraints = SHARED["constraints"].get(("en", test_name))
+    else:
+        batch = SHARED["batches"][(base_name(config), test_name, config["lang"], config["type"])]
+        t_s_constraints = SHARED["constraints"].get(("mwsd", test_name, config["lang"]))
+
+    if config["method"] == "base":
+        return batch, np.zeros(len(batch), dtype=np.int64)
+
+    if config["method"] == "hard":
+        return batch, hard_decisions(batch, t_s_constraints)
+
+    if config["task"] == "en":
+        parameters = en.get_parameters(config["system"], test_name, params_path)
+        p_freq = None
+        if parameters["c"] and parameters["s_smoothing"]:
+            p_freq = en.get_pair_p_freq(batch, en.get_p_freq(parameters["s_smoothing"]))
+        best = soft_decisions(batch, t_s_constraints, p_freq, parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"])
+        return batch, best
+
+    system_name = base_name(config) + (".clubert" if config["clubert"] else "")
+    parameters = mwsd.get_parameters(system_name, test_name + " " + config["lang"].upper(), params_path)
+    p_freq = None
+    if parameters["c"] and config["clubert"]:
+        p_freq = mwsd.get_pair_p_freq(batch, SHARED["lemma_sense_freq"][(test_name, config["lang"])])
+    best = soft_decisions(batch, t_s_constraints, p_freq, parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"], zero_sum_one=True)
+
+    return batch, best
+
+
+def run_config(config):
+
+    # rerank, write and score one configuration -> row of the results table
+    start = time.time()
+    row = dict(config)
+    out_dir = os.path.join(SHARED["out_dir"], "outputs" if config["task"] == "en" else "mwsd_outputs")
+    row["out"] = os.path.join(out_dir, out_name(config))
+
+    batch, best = decide(config)
+    predictions = answers(batch, best)
+
+    with AtomicWriter(row["out"]) as newf:
+        write_predictions(newf, predictions)
+
+    try:
+        row["P"], row["R"], row["F1"] = score(load_key(key_file(config)), predictions)
+    except ScorerError as e:
+        sys.stderr.write(out_name(config) + ": " + str(e) + "\n")
+        row["P"] = row["R"] = row["F1"] = float("nan")
+    row["instances"] = len(batch)
+    row["seconds"] = time.time() - start
+
+    return row
+
+
+def run_sweep(configs, jobs):
+
+    # rows in configuration order; configurations are spread over jobs forked workers
+    if jobs > 1 and len(configs) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context("fork").Pool(min(jobs, len(configs))) as pool:
+            rows = []
+            for row in pool.imap(run_config, configs):
+                rows.append(row)
+                sys.stderr.write("[" + str(len(rows)) + "/" + str(len(configs)) + "] " + os.path.basename(row["out"]) + "\n")
+        return rows
+
+    return [run_config(config) for config in configs]
+
+
+def format_value(column, value):
+
+    if column in ("P", "R", "F1"):
+        return java_percent(value)
+    if column == "seconds":
+        return "%.3f" % value
+    if isinstance(value, bool):
+        return "on" if value else "off"
+
+    return str(value)
+
+
+def write_results(results_path, rows):
+
+    with codecs.open(results_path, "w", encoding="utf-8") as f:
+        f.write("\t".join(COLUMNS) + "\n")
+        for row in rows:
+            f.write("\t".join(format_value(column, row[column]) for column in COLUMNS) + "\n")
+
+
+def print_table(rows):
+
+    # markdown table, one line per configuration
+    columns = COLUMNS[:-2]
+    print("| " + " | ".join(columns) + " |")
+    print("| " + " | ".join([":---"] * 8 + ["---:"] * (len(columns) - 8)) + " |")
+    for row in rows:
+        print("| " + " | ".join(format_value(column, row[column]) for column in columns) + " |")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run and score a matrix of configurations of both scripts in parallel")
+
+    parser.add_argument("--task", default="", help="comma-separated tasks (en, mwsd; default: both)")
+    parser.add_argument("-s", "--system", default="", help="comma-separated base WSD systems (default: every system of each task)")
+    parser.add_argument("-t", "--test", default="", help="comma-separated test data sets (default: every test set of each task)")
+    parser.add_argument("-l", "--lang", default="", help="comma-separated test languages for mwsd (default: de,es,fr,it)")
+    parser.add_argument("--type", default="tst", help="comma-separated types of the mwsd test files (dev, tst, all; default: tst)")
+    parser.add_argument("-m", "--method", default="", help="comma-separated methods (base, hard, soft; default: all)")
+    parser.add_argument("--clubert", default="off,on", help="CluBERT p_freq for mwsd soft: off, on or off,on (default: off,on)")
+    parser.add_argument("--temb", default="off,on", help="t_emb for sensembert: off, on or off,on (default: off,on)")
+    parser.add_argument("-p", "--params", default="", help="JSON parameter table written by -m tune (default: hard-coded parameters)")
+    parser.add_argument("-j", "--jobs", default=os.cpu_count() or 1, type=int, help="number of worker processes (default: number of cores)")
+    parser.add_argument("-d", "--out-dir", default="sweep_outputs", help="directory of the outputs and results.tsv (default: sweep_outputs)")
+
+    args = parser.parse_args()
+
+    configs = expand_configs(args)
+    if not configs:
+        print("no configuration matches the given matrix!")
+        sys.exit(1)
+
+    for sub_dir in ("outputs", "mwsd_outputs"):
+        os.makedirs(os.path.join(args.out_dir, sub_dir), exist_ok=True)
+
+    start = time.time()
+    load_shared(configs, args.params)
+    SHARED["out_dir"] = args.out_dir
+    loaded = time.time()
+
+    rows = run_sweep(configs, args.jobs)
+
+    results_path = os.path.join(args.out_dir, "results.tsv")
+    write_results(results_path, rows)
+    print_table(rows)
+    sys.stderr.write(str(len(rows)) + " configurations, loaded in %.1fs, run in %.1fs with %d jobs -> %s\n" % (loaded - start, time.time() - loaded, args.jobs, results_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+#-*- coding: utf-8 -*-
+
+'''
+Shared machinery for translations4wsd.py, translations4wsd_mwsd.py and the evaluation scripts.
+
+The scripts at the top of the repository stay the entry points; this package holds the code
+they have in common (compiled data bundle, readers, interned vocabularies).
+t4wsd.api exposes the methods to other Python code.
+'''
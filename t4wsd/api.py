@@ -0,0 +1,231 @@
+#-*- coding: utf-8 -*-
+
+import os
+
+from t4wsd import bundle
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.priors import PriorStore, read_lemma_sense_distributions, instance_sense_freq, top_sense_p_freq, instance_p_freq
+from t4wsd.readers import glob_sources
+from t4wsd.scorer import load_key, score
+from t4wsd.scoring import Batch, flatten, ranked_batch, hard_decisions, soft_decisions, answers
+
+'''
+# Library API
+
+HardConstraint / SoftConstraint in memory, for embedding in other Python code:
+
+    from t4wsd.api import EnglishWSD, MultilingualWSD
+
+    en = EnglishWSD()
+    predictions = en.soft("ims", "ALL", a=0.5, b=0.4, c=0.1, t_smoothing=0.48, s_smoothing=0.01)  # [(i_id, sense), ...]
+    precision, recall, f1 = en.score(predictions, "ALL")
+
+    mwsd = MultilingualWSD()
+    predictions = mwsd.hard("sensembert", "semeval2013", "de", t_type="tst")
+
+Parameters are passed directly (no parameter table). The base can be a system name (its ranked output under
+base_outputs/ or mwsd_base_outputs/), a Batch, or a {i_id: [[sense, score], ...]} dict.
+
+Nothing is read when an object is created: base outputs, mappings, priors and gold keys are loaded on first use
+and kept, so a worker that only serves one language or data set never touches the others.
+Paths are relative to root (the repository by default).
+'''
+
+EN_LANGS = ["FR", "DE", "RU"] # pivot languages of translations4wsd.py, in the order it combines them
+
+
+class Resources(object):
+
+    # memoized loaders shared by both tasks
+
+    def __init__(self, root="."):
+        self.root = root
+        self._loaded = {}
+
+    def path(self, *parts):
+        return os.path.normpath(os.path.join(self.root, *parts))
+
+    def memo(self, key, load):
+        if key not in self._loaded:
+            self._loaded[key] = load()
+        return self._loaded[key]
+
+    def loaded(self):
+        # keys of everything loaded so far
+        return list(self._loaded)
+
+    def score(self, predictions, key_file):
+        # (P, R, F1) of predictions ({i_id: sense} or [(i_id, sense), ...]) against a gold key, as Scorer.java computes them
+        return score(load_key(self.path(key_file)), predictions)
+
+
+def as_batch(base):
+
+    # a Batch from a Batch or a {i_id: [[sense, score], ...]} dict
+    if isinstance(base, Batch):
+        return base
+    return flatten(base)
+
+
+class EnglishWSD(Resources):
+
+    # English all-words WSD; test is a data set (senseval2, ..., semeval2015) or ALL
+
+    def __init__(self, root=".", langs=None):
+        Resources.__init__(self, root)
+        self.langs = langs if langs is not None else EN_LANGS # any languages with a mapping under mappings/
+
+    def mapping_paths(self):
+
+        # {LANG: mapping path}, e.g. "FR" for mappings/ALL_bnsyn_trans_mapping.wmt14.en-fr.txt
+        def find():
+            paths = {}
+            for path in glob_sources(self.path("mappings", "ALL_bnsyn_trans_mapping.*.txt")):
+                paths[os.path.basename(path).split(".")[-2].split("-")[-1].upper()] = path
+            return paths
+
+        paths = self.memo(("mapping_paths",), find)
+        missing = [lang for lang in self.langs if lang not in paths]
+        if missing:
+            raise ValueError("no mapping for " + ", ".join(missing) + " under " + self.path("mappings"))
+
+        return [(lang, paths[lang]) for lang in self.langs]
+
+    def base_path(self, system):
+
+        return self.path("base_outputs", "ALL." + system + ".ranked.out")
+
+    def key_file(self, test="ALL"):
+
+        return os.path.join("gold_keys", test + ".gold.key.txt")
+
+    def base(self, system, test="ALL"):
+
+        # ranked output of a base system for a data set (ids without the data set prefix unless test is ALL)
+        def load():
+            def select(full_i_id):
+                if test == "ALL":
+                    return full_i_id
+                if full_i_id.split(".")[0] == test:
+                    return ".".join(full_i_id.split(".")[1:])
+                return None
+            table = bundle.load_ranked(self.base_path(system))
+            rows = None if test == "ALL" else bundle.partition_rows(table, test)
+            return ranked_batch([table], select, rows=[rows])
+
+        if not isinstance(system, str):
+            return as_batch(system)
+        return self.memo(("base", system, test), load)
+
+    def ranked(self, system, i_id):
+
+        # [[sense, score], ...] of one instance (full id, e.g. senseval2.d000.s000.t000), read from its document only
+        table = bundle.load_ranked(self.base_path(system))
+        row = bundle.instance_row(table, i_id)
+        if row < 0:
+            raise KeyError(i_id)
+        return next(bundle.iter_ranked(table, [row]))[1]
+
+    def constraints(self, test="ALL"):
+
+        return [self.memo(("constraints", lang, test), lambda: ConstraintIndex.load(path, 5, test)) for lang, path in self.mapping_paths()]
+
+    def priors(self, s_smoothing):
+
+        # {lemma_pos: {sense_key: p_freq}} of WordNet's index.sense, smoothed on access
+        return PriorStore.load(self.path("index.sense")).smoothed(s_smoothing)
+
+    def hard(self, base, test="ALL"):
+
+        batch = self.base(base, test)
+        return answers(batch, hard_decisions(batch, self.constraints(test)))
+
+    def soft(self, base, test="ALL", a=1.0, b=1.0, c=None, t_smoothing=None, s_smoothing=None):
+
+        # c and s_smoothing: weight and smoothing of the WordNet prior (None: without p_freq)
+        # t_smoothing > 0: without it p_trans is 0/0 for a constrained instance none of whose senses is translated
+        if t_smoothing is None or not t_smoothing > 0:
+            raise ValueError("EnglishWSD.soft needs t_smoothing > 0, got " + str(t_smoothing))
+        batch = self.base(base, test)
+        if c:
+            compute = lambda: top_sense_p_freq(batch, self.priors(s_smoothing))
+            p_freq = self.memo(("p_freq", base, test, s_smoothing), compute) if isinstance(base, str) else compute()
+        else:
+            p_freq = None
+        return answers(batch, soft_decisions(batch, self.constraints(test), p_freq, a, b, c, t_smoothing))
+
+    def score(self, predictions, test="ALL"):
+
+        return Resources.score(self, predictions, self.key_file(test))
+
+
+class MultilingualWSD(Resources):
+
+    # multilingual WSD; test is semeval2013 or semeval2015, lang the test language, t_type dev, tst or all
+
+    def mapping_paths(self, test, lang):
+
+        # every language pair with a mapping for the test language, in the order translations4wsd_mwsd.py combines them
+        return self.memo(("mapping_paths", test, lang),
+                         lambda: glob_sources(self.path("mwsd_mappings", test + "_bnsyn_trans_mapping.*." + lang + ".txt")))
+
+    def base_paths(self, system, test, lang, t_type="tst"):
+
+        # all = dev, then the tst instances
+        prefix = self.path("mwsd_base_outputs", test + "." + lang + "." + system + ".ranked.")
+        return [prefix + t + ".out" for t in (["dev", "tst"] if t_type == "all" else [t_type])]
+
+    def lemma_map_path(self, test, lang):
+
+        return self.path("mwsd_mappings", test + "_" + lang + "_lemma_bnsyn_mapping.txt")
+
+    def clubert_path(self, lang):
+
+        return self.path("clubert_v1.0", lang, "lexemes_distributions.bnid.txt")
+
+    def key_file(self, test, lang, t_type="tst"):
+
+        if t_type == "all":
+            return os.path.join("mwsd_gold_keys", test + "_" + lang + ".gold.key.txt")
+        return os.path.join("mwsd_gold_keys", test + "_" + lang + ".gold." + t_type + ".key")
+
+    def base(self, system, test, lang, t_type="tst"):
+
+        # ranked output of a base system (e.g. ims, sensembert, sensembert.temb)
+        def load():
+            return ranked_batch([bundle.load_ranked(path) for path in self.base_paths(system, test, lang, t_type)])
+
+        if not isinstance(system, str):
+            return as_batch(system)
+        return self.memo(("base", system, test, lang, t_type), load)
+
+    def constraints(self, test, lang):
+
+        return [self.memo(("constraints", path), lambda: ConstraintIndex.load(path, 4)) for path in self.mapping_paths(test, lang)]
+
+    def sense_freq(self, test, lang):
+
+        # CluBERT sense distribution of every instance: {i_id: {bn_id: probability}}
+        def load():
+            table = bundle.load_lemma_map(self.lemma_map_path(test, lang))
+            id_lemma_map = dict(zip(table.ids.tolist(), table.lemma_pos.tolist()))
+            lemma_sense_freq = read_lemma_sense_distributions(self.clubert_path(lang), set(id_lemma_map.values()))
+            return instance_sense_freq(lemma_sense_freq, id_lemma_map)
+
+        return self.memo(("sense_freq", test, lang), load)
+
+    def hard(self, base, test, lang, t_type="tst"):
+
+        batch = self.base(base, test, lang, t_type)
+        return answers(batch, hard_decisions(batch, self.constraints(test, lang)))
+
+    def soft(self, base, test, lang, t_type="tst", a=1.0, b=1.0, c=None, t_smoothing=0.0):
+
+        # c: weight of the CluBERT prior (None: without p_freq); p_trans = 1 when no sense is a candidate
+        batch = self.base(base, test, lang, t_type)
+        p_freq = instance_p_freq(batch, self.sense_freq(test, lang)) if c else None
+        return answers(batch, soft_decisions(batch, self.constraints(test, lang), p_freq, a, b, c, t_smoothing, zero_sum_one=True))
+
+    def score(self, predictions, test, lang, t_type="tst"):
+
+        return Resources.score(self, predictions, self.key_file(test, lang, t_type))
@@ -0,0 +1,666 @@
+#-*- coding: utf-8 -*-
+
+import glob
+import hashlib
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+
+from t4wsd.readers import iter_lines, resolve_path, logical_path, file_compression, parse_ranked_line, parse_mapping_line, parse_lemma_line, parse_gold_line, parse_sense_index_line
+from t4wsd.vocab import Vocab, StringTable
+
+'''
+# Compiled data bundle
+
+Each text source (ranked base output, sense-translation mapping, lemma map, gold key, WordNet index.sense) is compiled once
+into a column-oriented directory under bundle/ (or $T4WSD_BUNDLE):
+
+    bundle/<source path>/manifest.json     source mtime / size / sha1 and the column list
+    bundle/<source path>/<column>.npy      int32 ids, int64 offsets, float64 scores, bool flags
+    bundle/<source path>/<strings>.blob.npy + .offsets.npy   interned string tables
+
+Loading memory-maps the columns. A bundle is rebuilt automatically when the source mtime/size changed
+and its sha1 no longer matches the manifest. A compressed source (e.g. base_outputs/ALL.ims.ranked.out.gz, see
+readers.resolve_path) is compiled under its own name and decompressed while it is parsed.
+
+The ALL-prefixed files (base_outputs/ALL.*, mappings/ALL_*, gold_keys/ALL.gold.key.txt) are also partitioned
+by data set and document, so one test set is read without touching the others:
+
+    manifest.json "partitions"   {"senseval2": [[first row, end row], ...], "senseval2.d000": [...], ...}
+    line_offsets.npy             byte offset of every line in the source (and its size), so
+                                 rows [first, end) are bytes [line_offsets[first], line_offsets[end])
+                                 (uncompressed sources only; a compressed one is read up to the rows)
+
+partition_rows() gives the rows of a data set or document, read_partition() its text lines (by seeking),
+instance_row() / instance_line() a single instance.
+
+A large uncompressed source with one instance per line can also be compiled in parallel (loader.compile_sources):
+it is cut into byte ranges of about CHUNK_BYTES ending on a newline, each range is parsed by a worker process into
+arrays with its own vocab (compile_chunk), and the chunks are concatenated in file order (merge_chunks), their vocabs
+interned chunk by chunk, so the bundle is identical to the one a single process compiles.
+'''
+
+FORMAT_VERSION = 2
+
+CHUNK_BYTES = 16 << 20 # bytes of a source parsed by one worker in a chunked compilation
+CHUNKED_KINDS = ["ranked", "mapping", "lemma", "gold"] # one instance per line
+VOCAB_COLUMNS = ["senses", "candidates"] # ids into the vocab of a compiled source
+
+SOURCE_DIRS = ["base_outputs", "mappings", "gold_keys", "mwsd_base_outputs", "mwsd_mappings", "mwsd_gold_keys"]
+
+
+class Table(object):
+
+    # columns of one compiled source, accessible as attributes
+
+    def __init__(self, source, columns, sha1=None, partitions=None):
+        self.source = source
+        self.sha1 = sha1 # of the source file
+        self.partitions = partitions # {data set or document prefix: [[first row, end row], ...]}, None if not partitioned
+        self.__dict__.update(columns)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def bundle_root():
+
+    return os.environ.get("T4WSD_BUNDLE", "bundle")
+
+
+def artifact_dir(file_path):
+
+    rel_path = os.path.relpath(os.path.abspath(file_path))
+    if rel_path.startswith(".."):
+        rel_path = "abs" + os.path.abspath(file_path)
+
+    return os.path.join(bundle_root(), rel_path)
+
+
+def file_sha1(file_path):
+
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def source_sha1(file_path):
+
+    # sha1 of a file, from its bundle manifest for the sources the bundle compiles, else from a
+    # bundle/<path>.sha1.json stamp, so an unchanged file (same mtime and size) is not hashed again
+    file_path = resolve_path(file_path)
+    kind, n_fields = source_kind(file_path)
+    if kind is not None:
+        return ensure_compiled(file_path, kind, n_fields)["sha1"]
+
+    stamp_path = artifact_dir(file_path) + ".sha1.json"
+    stat = os.stat(file_path)
+    try:
+        with open(stamp_path) as f:
+            stamp = json.load(f)
+        if stamp["mtime_ns"] == stat.st_mtime_ns and stamp["size"] == stat.st_size:
+            return stamp["sha1"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    stamp = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": file_sha1(file_path)}
+    os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    tmp_path = stamp_path + ".tmp-" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(stamp, f)
+    os.replace(tmp_path, stamp_path)
+
+    return stamp["sha1"]
+
+
+def source_kind(file_path):
+
+    # (kind, n_fields) for the files shipped under SOURCE_DIRS (plain or compressed)
+    name = os.path.basename(logical_path(file_path))
+    if name == "index.sense":
+        return "prior", None
+    if "_lemma_bnsyn_mapping" in name:
+        return "lemma", None
+    if "_bnsyn_trans_mapping" in name:
+        if "mwsd_mappings" in file_path:
+            return "mapping", 4
+        return "mapping", 5
+    if ".gold." in name:
+        return "gold", None
+    if ".ranked." in name:
+        return "ranked", None
+
+    return None, None
+
+
+# --- compilation ---
+
+def compile_ranked(lines):
+
+    vocab = Vocab()
+    ids = []
+    offsets = [0]
+    senses = []
+    scores = []
+    for line in lines:
+        i_id, line_senses, line_scores = parse_ranked_line(line)
+        ids.append(i_id)
+        senses.extend(vocab.intern(s) for s in line_senses)
+        scores.extend(line_scores)
+        offsets.append(len(senses))
+
+    arrays = {"offsets": np.array(offsets, dtype=np.int64),
+              "senses": np.array(senses, dtype=np.int32),
+              "scores": np.array(scores, dtype=np.float64)}
+    strings = {"ids": ids, "vocab": vocab.strings}
+
+    return arrays, strings
+
+
+def compile_mapping(lines, n_fields):
+
+    vocab = Vocab()
+    ids = []
+    lemma_pos = []
+    constrained = []
+    offsets = [0]
+    candidates = []
+    for line in lines:
+        i_id, target_lemma_pos, line_candidates = parse_mapping_line(line, n_fields)
+        ids.append(i_id)
+        lemma_pos.append(target_lemma_pos)
+        constrained.append(line_candidates is not None)
+        if line_candidates is not None:
+            candidates.extend(vocab.intern(c) for c in line_candidates)
+        offsets.append(len(candidates))
+
+    arrays = {"constrained": np.array(constrained, dtype=bool),
+              "offsets": np.array(offsets, dtype=np.int64),
+              "candidates": np.array(candidates, dtype=np.int32)}
+    strings = {"ids": ids, "lemma_pos": lemma_pos, "vocab": vocab.strings}
+
+    return arrays, strings
+
+
+def compile_lemma(lines):
+
+    ids = []
+    lemma_pos = []
+    for line in lines:
+        i_id, line_lemma_pos = parse_lemma_line(line)
+        ids.append(i_id)
+        lemma_pos.append(line_lemma_pos)
+
+    return {}, {"ids": ids, "lemma_pos": lemma_pos}
+
+
+def compile_gold(lines):
+
+    vocab = Vocab()
+    ids = []
+    offsets = [0]
+    senses = []
+    for line in lines:
+        i_id, line_senses = parse_gold_line(line)
+        ids.append(i_id)
+        senses.extend(vocab.intern(s) for s in line_senses)
+        offsets.append(len(senses))
+
+    arrays = {"offsets": np.array(offsets, dtype=np.int64),
+              "senses": np.array(senses, dtype=np.int32)}
+    strings = {"ids": ids, "vocab": vocab.strings}
+
+    return arrays, strings
+
+
+def compile_prior(lines):
+
+    # sense tag counts grouped by lemma_pos (rows sorted by lemma_pos; senses in file order within a row,
+    # a repeated sense key keeps its position and its last count)
+    groups = {}
+    for line in lines:
+        sense_key, lemma_pos, count = parse_sense_index_line(line)
+        groups.setdefault(lemma_pos, {})[sense_key] = count
+
+    lemma_pos_list = sorted(groups, key=lambda l_p: l_p.encode("utf-8"))
+    offsets = [0]
+    sense_keys = []
+    counts = []
+    for lemma_pos in lemma_pos_list:
+        for sense_key, count in groups[lemma_pos].items():
+            sense_keys.append(sense_key)
+            counts.append(count)
+        offsets.append(len(sense_keys))
+
+    arrays = {"offsets": np.array(offsets, dtype=np.int64),
+              "counts": np.array(counts, dtype=np.int64)}
+    strings = {"lemma_pos": lemma_pos_list, "sense_keys": sense_keys}
+
+    return arrays, strings
+
+
+def is_partitioned(file_path, kind):
+
+    # files whose ids carry the data set prefix: senseval2.d000.s000.t000
+    return kind in ("ranked", "mapping", "gold") and os.path.basename(file_path).startswith("ALL")
+
+
+def partition_index(ids):
+
+    # {prefix: [[first row, end row], ...]} of every data set (senseval2) and document (senseval2.d000)
+    partitions = {}
+    for row, i_id in enumerate(ids):
+        parts = i_id.split(".")
+        for n in (1, 2):
+            if len(parts) <= n:
+                break
+            ranges = partitions.setdefault(".".join(parts[:n]), [])
+            if ranges and ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+
+    return partitions
+
+
+def line_offsets(file_path, n_lines):
+
+    # byte offset of each of the n_lines lines and the file size; None when the file splits into
+    # a different number of lines than iter_lines gives (line breaks other than "\n")
+    with open(file_path, "rb") as f:
+        data = np.frombuffer(f.read(), dtype=np.uint8)
+
+    ends = np.flatnonzero(data == ord("\n")) + 1
+    if len(data) and data[-1] != ord("\n"):
+        ends = np.append(ends, len(data))
+    if len(ends) != n_lines:
+        return None
+
+    return np.concatenate([[0], ends]).astype(np.int64)
+
+
+def compile_lines(lines, kind, n_fields=None):
+
+    # (arrays, strings) of the lines of a source
+    if kind == "ranked":
+        return compile_ranked(lines)
+    if kind == "mapping":
+        return compile_mapping(lines, n_fields)
+    if kind == "lemma":
+        return compile_lemma(lines)
+    if kind == "gold":
+        return compile_gold(lines)
+    if kind == "prior":
+        return compile_prior(lines)
+
+    raise ValueError("unknown bundle kind: " + str(kind))
+
+
+def compile_source(file_path, kind, n_fields=None):
+
+    return write_source(file_path, kind, n_fields, *compile_lines(iter_lines(file_path), kind, n_fields))
+
+
+def write_source(file_path, kind, n_fields, arrays, strings):
+
+    # write the compiled columns of a source (strings: lists or StringTables) to its bundle directory; returns the manifest
+    partitions = None
+    if is_partitioned(file_path, kind):
+        ids = strings["ids"].tolist() if isinstance(strings["ids"], StringTable) else strings["ids"]
+        offsets = line_offsets(file_path, len(ids)) if file_compression(file_path) is None else None
+        partitions = partition_index(ids)
+        if offsets is not None:
+            arrays["line_offsets"] = offsets
+
+    stat = os.stat(file_path)
+    manifest = {"version": FORMAT_VERSION,
+                "source": file_path,
+                "kind": kind,
+                "n_fields": n_fields,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha1": file_sha1(file_path),
+                "arrays": sorted(arrays),
+                "strings": sorted(strings),
+                "partitions": partitions}
+
+    out_dir = artifact_dir(file_path)
+    tmp_dir = out_dir + ".tmp-" + str(os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, name + ".npy"), array)
+    for name, values in strings.items():
+        table = values if isinstance(values, StringTable) else StringTable.from_strings(values)
+        table.save(os.path.join(tmp_dir, name))
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    # swap the finished directory in, so a concurrent reader never sees a half-written bundle
+    old_dir = out_dir + ".old-" + str(os.getpid())
+    try:
+        if os.path.isdir(out_dir):
+            os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+    except OSError: # another process swapped in the same bundle first
+        pass
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return manifest
+
+
+def read_manifest(file_path):
+
+    manifest_path = os.path.join(artifact_dir(file_path), "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def is_fresh(file_path, manifest, kind, n_fields=None):
+
+    if manifest is None or manifest["version"] != FORMAT_VERSION:
+        return False
+    if manifest["kind"] != kind or manifest["n_fields"] != n_fields:
+        return False
+
+    stat = os.stat(file_path)
+    if stat.st_mtime_ns == manifest["mtime_ns"] and stat.st_size == manifest["size"]:
+        return True
+    if stat.st_size != manifest["size"] or file_sha1(file_path) != manifest["sha1"]:
+        return False
+
+    # touched but unchanged: remember the new mtime so the hash is not recomputed next time
+    manifest["mtime_ns"] = stat.st_mtime_ns
+    manifest_path = os.path.join(artifact_dir(file_path), "manifest.json")
+    tmp_path = manifest_path + ".tmp-" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+    return True
+
+
+def ensure_compiled(file_path, kind, n_fields=None, force=False):
+
+    file_path = resolve_path(file_path)
+    manifest = read_manifest(file_path)
+    if force or not is_fresh(file_path, manifest, kind, n_fields):
+        manifest = compile_source(file_path, kind, n_fields)
+
+    return manifest
+
+
+# --- chunked compilation ---
+
+def is_chunkable(file_path, kind):
+
+    # sources whose lines can be parsed in independent byte ranges (and that are not compressed, so the ranges can be sought)
+    return kind in CHUNKED_KINDS and file_compression(file_path) is None
+
+
+def chunk_ranges(file_path, chunk_bytes=CHUNK_BYTES):
+
+    # [(start, end)] byte ranges of about chunk_bytes covering the file, each ending after a "\n"
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with open(file_path, "rb") as f:
+        while bounds[-1] < size:
+            f.seek(bounds[-1] + chunk_bytes)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def chunk_lines(file_path, start, end):
+
+    # the lines of bytes [start, end), split as iter_lines splits them
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    return [line.rstrip("\n") for line in data.decode("utf-8").splitlines(True)]
+
+
+def compile_chunk(file_path, kind, n_fields, start, end):
+
+    # (arrays, strings) of one byte range, with its own vocab (run in a worker process; strings other than
+    # the vocab come back as StringTables, which pickle as two arrays)
+    arrays, strings = compile_lines(chunk_lines(file_path, start, end), kind, n_fields)
+
+    return arrays, {name: values if name == "vocab" else StringTable.from_strings(values) for name, values in strings.items()}
+
+
+def merge_chunks(parts):
+
+    # (arrays, strings) of consecutive chunks, identical to compiling their lines at once: the chunk vocabs are
+    # interned in chunk order (so every sense gets the id of its first occurrence in the file) and the ids remapped
+    arrays = {}
+    strings = {}
+    first_arrays, first_strings = parts[0]
+    if "vocab" in first_strings:
+        vocab = Vocab()
+        remaps = [vocab.remap(part_strings["vocab"]) for _, part_strings in parts]
+        strings["vocab"] = vocab.strings
+
+    for name in first_arrays:
+        columns = [part_arrays[name] for part_arrays, _ in parts]
+        if name == "offsets":
+            pieces = [columns[0][:1]]
+            shift = 0
+            for column in columns:
+                pieces.append(column[1:] + shift)
+                shift += column[-1]
+            arrays[name] = np.concatenate(pieces)
+        elif name in VOCAB_COLUMNS:
+            arrays[name] = np.concatenate([remap[column] for remap, column in zip(remaps, columns)])
+        else:
+            arrays[name] = np.concatenate(columns)
+
+    for name in first_strings:
+        if name != "vocab":
+            strings[name] = StringTable.concat([part_strings[name] for _, part_strings in parts])
+
+    return arrays, strings
+
+
+# --- loading ---
+
+def _load_array(path):
+
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError: # zero-length arrays cannot be memory-mapped
+        return np.load(path)
+
+
+def load_table(file_path, kind, n_fields=None):
+
+    file_path = resolve_path(file_path)
+    manifest = ensure_compiled(file_path, kind, n_fields)
+    out_dir = artifact_dir(file_path)
+
+    columns = {}
+    for name in manifest["arrays"]:
+        columns[name] = _load_array(os.path.join(out_dir, name + ".npy"))
+    for name in manifest["strings"]:
+        prefix = os.path.join(out_dir, name)
+        columns[name] = StringTable(_load_array(prefix + ".blob.npy"), _load_array(prefix + ".offsets.npy"))
+
+    return Table(file_path, columns, manifest["sha1"], manifest["partitions"])
+
+
+def load_ranked(file_path):
+
+    return load_table(file_path, "ranked")
+
+
+def load_mapping(file_path, n_fields):
+
+    return load_table(file_path, "mapping", n_fields)
+
+
+def load_lemma_map(file_path):
+
+    return load_table(file_path, "lemma")
+
+
+def load_gold(file_path):
+
+    return load_table(file_path, "gold")
+
+
+def load_prior(file_path):
+
+    return load_table(file_path, "prior")
+
+
+# --- partitions ---
+
+def partition_rows(table, prefix):
+
+    # ascending rows of the instances of a data set ("senseval2") or document ("senseval2.d000");
+    # None when the table is not partitioned
+    if table.partitions is None:
+        return None
+    ranges = table.partitions.get(prefix, [])
+
+    return np.concatenate([np.arange(first, end, dtype=np.int64) for first, end in ranges] + [np.zeros(0, dtype=np.int64)])
+
+
+def segment_positions(offsets, rows):
+
+    # positions of the values of rows in a CSR column, and the offsets of the rows taken on their own
+    offsets = np.asarray(offsets)
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = offsets[rows + 1] - offsets[rows]
+    row_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    return np.repeat(offsets[rows] - row_offsets[:-1], lengths) + np.arange(row_offsets[-1]), row_offsets
+
+
+def instance_row(table, i_id):
+
+    # row of an instance (the last one for a repeated id), searching its document only when the table is partitioned; -1 if absent
+    if table.partitions is not None:
+        rows = partition_rows(table, ".".join(i_id.split(".")[:2]))
+    else:
+        rows = range(len(table))
+
+    found = -1
+    for row, row_id in zip(rows, table.ids.take(rows)):
+        if row_id == i_id:
+            found = int(row)
+
+    return found
+
+
+def read_rows(table, first, end):
+
+    # text lines [first, end) of the source of a partitioned table, read by seeking to their byte range
+    # (a compressed source is decompressed up to the rows)
+    if table.partitions is None:
+        raise ValueError("no partition index for " + table.source)
+    if not hasattr(table, "line_offsets"):
+        return list(itertools.islice(iter_lines(table.source), first, end))
+
+    start = int(table.line_offsets[first])
+    stop = int(table.line_offsets[end])
+    with open(table.source, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+
+    return data.decode("utf-8").split("\n")[:end - first]
+
+
+def read_partition(file_path, prefix):
+
+    # text lines of a data set or document of a partitioned source, in file order
+    table = load_table(file_path, *source_kind(file_path))
+    ranges = (table.partitions or {}).get(prefix, [])
+    if ranges and not hasattr(table, "line_offsets"):
+        # one decompressing pass for all the ranges (the documents of a data set can be interleaved)
+        rows = partition_rows(table, prefix)
+        taken = np.zeros(int(rows[-1]) + 1, dtype=bool)
+        taken[rows] = True
+        return [line for line, take in zip(iter_lines(table.source), taken) if take]
+
+    lines = []
+    for first, end in ranges:
+        lines.extend(read_rows(table, first, end))
+
+    return lines
+
+
+def instance_line(file_path, i_id):
+
+    # text line of one instance of a partitioned source, or None
+    table = load_table(file_path, *source_kind(file_path))
+    row = instance_row(table, i_id)
+    if row < 0:
+        return None
+
+    return read_rows(table, row, row + 1)[0]
+
+
+def iter_ranked(ranked, rows=None):
+
+    # (i_id, [[sense, score], ...]) per line of a compiled ranked output, in file order (rows: only these rows)
+    # (a sense without score comes back as [sense], like pair.split(" ") on the text line)
+    vocab = ranked.vocab.tolist()
+    if rows is None:
+        ids = ranked.ids.tolist()
+        senses = ranked.senses.tolist()
+        scores = ranked.scores.tolist()
+        offsets = ranked.offsets.tolist()
+    else:
+        ids = ranked.ids.take(rows)
+        positions, offsets = segment_positions(ranked.offsets, rows)
+        senses = np.asarray(ranked.senses)[positions].tolist()
+        scores = np.asarray(ranked.scores)[positions].tolist()
+        offsets = offsets.tolist()
+
+    for row, i_id in enumerate(ids):
+        ranked_sense_scores = []
+        for j in range(offsets[row], offsets[row + 1]):
+            if scores[j] != scores[j]: # NaN: no score
+                ranked_sense_scores.append([vocab[senses[j]]])
+            else:
+                ranked_sense_scores.append([vocab[senses[j]], scores[j]])
+        yield i_id, ranked_sense_scores
+
+
+def gold_dict(gold):
+
+    # {i_id: set of gold senses} from a compiled gold table (the senses of a repeated id are united)
+    vocab = gold.vocab.tolist()
+    senses = gold.senses.tolist()
+    offsets = gold.offsets.tolist()
+    key = {}
+    for i, i_id in enumerate(gold.ids.tolist()):
+        key.setdefault(i_id, set()).update(vocab[s] for s in senses[offsets[i]:offsets[i + 1]])
+
+    return key
+
+
+def iter_sources(root="."):
+
+    for source_dir in SOURCE_DIRS:
+        for file_path in sorted(glob.glob(os.path.normpath(os.path.join(root, source_dir, "*")))):
+            kind, n_fields = source_kind(file_path)
+            if kind is not None:
+                yield file_path, kind, n_fields
+
+    prior_path = os.path.normpath(os.path.join(root, "index.sense"))
+    if os.path.exists(prior_path):
+        yield prior_path, "prior", None
@@ -0,0 +1,277 @@
+#-*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from t4wsd import bundle, scoring, priors
+
+'''
+# Stage cache
+
+Derived results of a run (language masks / intersections, pair p_freq, decisions, score counts, the CluBERT lines
+a test set needs) are stored on disk
+under a hash of everything they depend on, so a re-run only recomputes the stages whose inputs changed:
+
+    bundle/cache/<key[:2]>/<key>.npz     the arrays of one stage result, and its engine counters
+    key = sha1(CACHE_VERSION, stage, fingerprints of the inputs, parameters)
+
+Inputs are fingerprinted by content: a source file by its sha1 (kept in the bundle manifest, so a file is only
+hashed again when it changed), a batch by its ids, ranked senses and scores. Parsed base outputs and constraints
+are the compiled bundle itself.
+
+The directory is kept under a size cap, least recently used first: a hit refreshes the mtime of its entry,
+and the oldest entries are removed until the cache fits. The directory is scanned on the first store of a
+process and then only once the bytes it stored push its running total past the cap; temporary files of
+stores in progress (<key>.npz.tmp-<pid>, possibly of another process) are never removed.
+'''
+
+CACHE_VERSION = 1 # bump when a cached stage computes something different
+DEFAULT_MAX_MB = 256
+
+
+def fingerprint(*parts):
+
+    # sha1 of JSON-serializable parts (strings, numbers, None, lists)
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def update_strings(h, strings):
+
+    # every string followed by "\n", hashed in one update
+    h.update("".join(s + "\n" for s in strings).encode("utf-8"))
+
+
+def batch_fingerprint(batch):
+
+    # ids, ranked senses and p_wsd of a batch (sense ids are process-local, so their strings are hashed)
+    if batch.fingerprint is None:
+        h = hashlib.sha1()
+        update_strings(h, batch.ids)
+        h.update(np.ascontiguousarray(batch.offsets).tobytes())
+        h.update(np.ascontiguousarray(batch.p_wsd).tobytes())
+        update_strings(h, (batch.vocab[s] for s in batch.sense_ids.tolist()))
+        batch.fingerprint = h.hexdigest()
+
+    return batch.fingerprint
+
+
+def index_fingerprint(index):
+
+    # the source a ConstraintIndex was loaded from, or its content; None for an absent language
+    if index is None:
+        return None
+    if index.fingerprint is None:
+        h = hashlib.sha1()
+        update_strings(h, index.ids)
+        h.update(np.ascontiguousarray(index.constrained).tobytes())
+        h.update(np.ascontiguousarray(index.offsets).tobytes())
+        update_strings(h, (index.vocab[c] for c in index.candidates.tolist()))
+        index.fingerprint = h.hexdigest()
+
+    return index.fingerprint
+
+
+def file_fingerprint(file_path):
+
+    return bundle.source_sha1(file_path)
+
+
+def predictions_fingerprint(predictions):
+
+    h = hashlib.sha1()
+    update_strings(h, (i_id + " " + sense for i_id, sense in predictions))
+
+    return h.hexdigest()
+
+
+class StageCache(object):
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_MB << 20, enabled=True):
+        self.root = root if root is not None else os.path.join(bundle.bundle_root(), "cache")
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.total = None # bytes in the directory as of the last scan, plus the entries stored since
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".npz")
+
+    def get(self, key):
+
+        # (arrays, meta) of a stored result, or None
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = tuple(data["a" + str(k)] for k in range(len(data.files) - 1))
+                meta = json.loads(str(data["meta"]))
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return arrays, meta
+
+    def put(self, key, arrays, meta):
+
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buf = io.BytesIO()
+        columns = {"a" + str(k): np.asarray(array) for k, array in enumerate(arrays)}
+        np.savez(buf, meta=np.array(json.dumps(meta)), **columns)
+        tmp_path = path + ".tmp-" + str(os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(buf.getvalue())
+            os.replace(tmp_path, path)
+        except OSError:
+            # the entry is not stored (e.g. its temporary file was removed under us): a miss on the next get
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        if self.total is None or self.total + buf.tell() > self.max_bytes:
+            self.evict()
+        else:
+            self.total += buf.tell()
+
+    def evict(self):
+
+        # remove the least recently used entries until the directory is under max_bytes
+        entries = []
+        total = 0
+        for dir_path, _, file_names in os.walk(self.root):
+            for name in file_names:
+                if ".tmp-" in name: # a store in progress
+                    continue
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.total = total
+
+    def cached(self, stage, key_parts, compute, counters=None):
+
+        # compute(counters) -> tuple of arrays, or the stored result for the same stage and key_parts;
+        # the engine counters of the computation are stored with it and added to counters on a hit
+        if not self.enabled:
+            return compute(counters)
+
+        key = fingerprint(CACHE_VERSION, stage, key_parts)
+        hit = self.get(key)
+        if hit is not None:
+            arrays, meta = hit
+            stage_counters = meta["counters"]
+        else:
+            stage_counters = {}
+            arrays = tuple(compute(stage_counters))
+            engine_counters = {name: n for name, n in stage_counters.items() if not name.startswith("cache_")}
+            self.put(key, arrays, {"stage": stage, "counters": engine_counters})
+
+        if counters is not None:
+            for name, n in stage_counters.items():
+                counters[name] = counters.get(name, 0) + n
+            name = ("cache_hits." if hit is not None else "cache_misses.") + stage
+            counters[name] = counters.get(name, 0) + 1
+
+        return arrays
+
+
+def cached_masks(cache, batch, indexes, counters=None):
+
+    # language_masks: the (masks, sizes) the N-way intersection and p_trans are computed from
+    key_parts = [batch_fingerprint(batch), [index_fingerprint(index) for index in indexes]]
+    return cache.cached("masks", key_parts, lambda stage_counters: scoring.language_masks(batch, indexes, stage_counters), counters)
+
+
+def cached_hard_decisions(cache, batch, indexes, counters=None):
+
+    def decide(stage_counters):
+        masks = cached_masks(cache, batch, indexes, stage_counters)
+        return (scoring.hard_decisions(batch, indexes, stage_counters, masks),)
+
+    key_parts = [batch_fingerprint(batch), [index_fingerprint(index) for index in indexes]]
+    return cache.cached("hard", key_parts, decide, counters)[0]
+
+
+def cached_soft_decisions(cache, batch, indexes, p_freq, p_freq_key, a, b, c, smoothing, zero_sum_one=False, counters=None):
+
+    # p_freq_key: fingerprint of the sense frequencies p_freq was computed from
+    def decide(stage_counters):
+        masks = cached_masks(cache, batch, indexes, stage_counters)
+        return (scoring.soft_decisions(batch, indexes, p_freq, a, b, c, smoothing, zero_sum_one, stage_counters, masks),)
+
+    key_parts = [batch_fingerprint(batch), [index_fingerprint(index) for index in indexes], p_freq_key if c else None, a, b, c, smoothing, zero_sum_one]
+    return cache.cached("soft", key_parts, decide, counters)[0]
+
+
+def cached_pair_p_freq(cache, batch, p_freq_key, compute, counters=None):
+
+    # compute() -> p_freq of every pair of the batch
+    return cache.cached("p_freq", [batch_fingerprint(batch), p_freq_key], lambda stage_counters: (compute(),), counters)[0]
+
+
+def cached_score_counts(cache, key_file, predictions, compute, counters=None):
+
+    # compute() -> the score counts (ok, notok, gold instances) of the predictions against key_file
+    key_parts = [file_fingerprint(key_file), predictions_fingerprint(predictions)]
+    ok, notok, n_gold = cache.cached("score_counts", key_parts, lambda stage_counters: (np.array(compute(), dtype=np.float64),), counters)[0].tolist()
+
+    return ok, notok, int(n_gold)
+
+
+def cached_lemma_sense_distributions(cache, file_path, lemma_pos_set, counters=None):
+
+    # read_lemma_sense_distributions of the lemma_pos in lemma_pos_set, stored as
+    # lemma_pos[k], senses / probabilities[offsets[k]:offsets[k + 1]]
+    def compute(stage_counters):
+        lemma_sense_freq = priors.read_lemma_sense_distributions(file_path, lemma_pos_set)
+        offsets = [0]
+        senses = []
+        probabilities = []
+        for sense_freq in lemma_sense_freq.values():
+            senses.extend(sense_freq)
+            probabilities.extend(sense_freq.values())
+            offsets.append(len(senses))
+        return (np.array(list(lemma_sense_freq), dtype=str), np.array(offsets, dtype=np.int64),
+                np.array(senses, dtype=str), np.array(probabilities, dtype=np.float64))
+
+    key_parts = [file_fingerprint(file_path), sorted(lemma_pos_set)]
+    lemma_pos, offsets, senses, probabilities = cache.cached("lemma_sense_distributions", key_parts, compute, counters)
+
+    offsets = offsets.tolist()
+    senses = senses.tolist()
+    probabilities = probabilities.tolist()
+    lemma_sense_freq = defaultdict(dict)
+    for k, l_p in enumerate(lemma_pos.tolist()):
+        lemma_sense_freq[l_p] = dict(zip(senses[offsets[k]:offsets[k + 1]], probabilities[offsets[k]:offsets[k + 1]]))
+
+    return lemma_sense_freq
+
+
+def cache_from_args(args):
+
+    return StageCache(max_bytes=int(args.cache_size * (1 << 20)), enabled=not args.no_cache)
+
+
+def add_cache_arguments(parser):
+
+    parser.add_argument("--no-cache", default=False, action="store_true", help="flag to recompute every stage instead of reusing bundle/cache (default: False)")
+    parser.add_argument("--cache-size", default=DEFAULT_MAX_MB, type=float, help="size cap of bundle/cache in MB, least recently used entries are removed first (default: " + str(DEFAULT_MAX_MB) + ")")
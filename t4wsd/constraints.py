@@ -0,0 +1,168 @@
+#-*- coding: utf-8 -*-
+
+import numpy as np
+
+from t4wsd import bundle
+from t4wsd.vocab import Vocab
+
+'''
+# Constraint index
+
+Sense-translation constraints of one language for one test set, with WordNet sense keys / BabelNet synset ids
+interned to integers and the candidates of all instances stored in CSR form:
+
+    candidates[offsets[row]:offsets[row + 1]]   sorted candidate ids of instance `row`
+    constrained[row]                            False = no constraint (no mapping, babel senses only, MONOSEMOUS)
+
+Candidate lists keep their duplicates, so the length of a row is the length of the original list
+(p_trans divides by it).
+'''
+
+SENSE_VOCAB = Vocab() # shared by every index and the base outputs, so ids compare across languages
+
+KEY_STRIDE = 1 << 31 # (row, id) pairs packed into one int64 key: row * KEY_STRIDE + id
+
+
+def member(sorted_ids, query_ids):
+
+    # membership of each query id in a sorted id array
+    query_ids = np.asarray(query_ids)
+    if len(sorted_ids) == 0:
+        return np.zeros(query_ids.shape, dtype=bool)
+    pos = np.searchsorted(sorted_ids, query_ids)
+    pos[pos == len(sorted_ids)] = 0
+
+    return sorted_ids[pos] == query_ids
+
+
+def sense_ids(senses, vocab=None):
+
+    # ids of sense strings in the shared vocab (-1 for senses no constraint mentions)
+    if vocab is None:
+        vocab = SENSE_VOCAB
+
+    return np.array([vocab.lookup(sense) for sense in senses], dtype=np.int32)
+
+
+class ConstraintIndex(object):
+
+    def __init__(self, ids, lemma_pos, constrained, offsets, candidates, vocab):
+        self.ids = ids
+        self.rows = {i_id: row for row, i_id in enumerate(ids)}
+        self.lemma_pos = lemma_pos
+        self.constrained = constrained
+        self.offsets = offsets
+        self.candidates = candidates
+        self.vocab = vocab
+        self.fingerprint = None # source of a loaded index, for the stage cache
+        self._keys = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, i_id):
+        return i_id in self.rows
+
+    def row(self, i_id):
+        return self.rows.get(i_id, -1)
+
+    def has_constraint(self, row):
+        return row >= 0 and bool(self.constrained[row])
+
+    def candidates_of(self, row):
+        # sorted candidate ids; empty for missing instances and instances without constraint
+        if row < 0:
+            return self.candidates[:0]
+        return self.candidates[self.offsets[row]:self.offsets[row + 1]]
+
+    def contains(self, row, query_ids):
+        return member(self.candidates_of(row), query_ids)
+
+    def sizes(self, rows):
+        # candidate-set size of each row (0 for missing rows and rows without constraint)
+        rows = np.asarray(rows)
+        lengths = np.diff(self.offsets)
+        return np.where(rows >= 0, lengths[np.maximum(rows, 0)], 0)
+
+    def keys(self):
+        # packed (row, candidate) keys, sorted because rows ascend and candidates are sorted within a row
+        if self._keys is None:
+            row_of = np.repeat(np.arange(len(self.ids), dtype=np.int64), np.diff(self.offsets))
+            self._keys = row_of * KEY_STRIDE + self.candidates
+        return self._keys
+
+    def contains_pairs(self, rows, query_ids):
+        # membership of query_ids[k] in the candidates of rows[k], for many pairs at once
+        rows = np.asarray(rows, dtype=np.int64)
+        query_keys = rows * KEY_STRIDE + np.asarray(query_ids, dtype=np.int64)
+        return member(self.keys(), query_keys) & (rows >= 0)
+
+    def candidate_strings(self, row):
+        return [self.vocab[c] for c in self.candidates_of(row)]
+
+    @classmethod
+    def from_csr(cls, ids, lemma_pos, constrained, offsets, candidates, vocab):
+
+        # sort candidates within each row
+        lengths = np.diff(offsets)
+        row_of = np.repeat(np.arange(len(lengths)), lengths)
+        order = np.lexsort((candidates, row_of))
+
+        return cls(ids, lemma_pos, np.asarray(constrained, dtype=bool), np.asarray(offsets, dtype=np.int64), np.asarray(candidates, dtype=np.int32)[order], vocab)
+
+    @classmethod
+    def from_lists(cls, ids, candidate_lists, lemma_pos=None, vocab=None):
+
+        # one row per id from candidate string lists (None: no constraint)
+        if vocab is None:
+            vocab = SENSE_VOCAB
+
+        constrained = []
+        offsets = [0]
+        candidates = []
+        for line_candidates in candidate_lists:
+            constrained.append(line_candidates is not None)
+            if line_candidates is not None:
+                candidates.extend(vocab.intern(c) for c in line_candidates)
+            offsets.append(len(candidates))
+        if lemma_pos is None:
+            lemma_pos = [None] * len(ids)
+
+        return cls.from_csr(ids, lemma_pos, constrained, offsets, np.array(candidates, dtype=np.int32), vocab)
+
+    @classmethod
+    def load(cls, file_path, n_fields, test_name="ALL", vocab=None):
+
+        # test_name other than ALL keeps the instances of that data set and strips its prefix from the ids
+        return cls.from_table(bundle.load_mapping(file_path, n_fields), n_fields, test_name, vocab)
+
+    @classmethod
+    def from_table(cls, table, n_fields, test_name="ALL", vocab=None):
+
+        # index of a compiled mapping (bundle.load_mapping), see load()
+        if vocab is None:
+            vocab = SENSE_VOCAB
+
+        remap = vocab.remap(table.vocab.tolist())
+
+        if test_name == "ALL":
+            ids = table.ids.tolist()
+            lemma_pos = table.lemma_pos.tolist()
+            constrained = np.asarray(table.constrained)
+            offsets = np.asarray(table.offsets)
+            candidates = remap[table.candidates] if len(table.candidates) else np.zeros(0, dtype=np.int32)
+        else:
+            # rows of the data set from the partition index, or by prefix for a file without one
+            rows = bundle.partition_rows(table, test_name)
+            if rows is None:
+                rows = np.array([row for row, i_id in enumerate(table.ids.tolist()) if i_id.split(".")[0] == test_name], dtype=np.int64)
+            positions, offsets = bundle.segment_positions(table.offsets, rows)
+            candidates = remap[np.asarray(table.candidates)[positions]] if len(positions) else np.zeros(0, dtype=np.int32)
+            constrained = np.asarray(table.constrained)[rows]
+            ids = [".".join(i_id.split(".")[1:]) for i_id in table.ids.take(rows)]
+            lemma_pos = table.lemma_pos.take(rows)
+
+        index = cls.from_csr(ids, lemma_pos, constrained, offsets, candidates, vocab)
+        index.fingerprint = "mapping:" + table.sha1 + ":" + str(n_fields) + ":" + test_name
+
+        return index
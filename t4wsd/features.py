@@ -0,0 +1,218 @@
+#-*- coding: utf-8 -*-
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # Parquet is optional, .npz always works
+    pyarrow = None
+
+from t4wsd import bundle
+from t4wsd.priors import PriorStore
+from t4wsd.readers import sense_lemma_pos
+from t4wsd.scoring import language_masks
+from t4wsd.tuning import gold_labels
+
+'''
+# Feature table
+
+The join every analysis and tuning run starts from, materialized once: one row per (instance, candidate sense)
+of a base output, in rank order, as columns
+
+    dataset, i_id, lemma_pos, sense, rank        the pair (English lemma_pos: of the top sense, like the WordNet prior;
+                                                 multilingual: of the lemma map)
+    p_wsd                                        base WSD score (NaN when the base output has none)
+    in_<LANG>, size_<LANG>                       is the sense a candidate of language LANG, candidate-set size of the
+                                                 instance (0: unconstrained by LANG)
+    prior_count, prior_total, prior_senses       inputs of the smoothed prior,
+                                                 p_freq = (prior_count + s) / (prior_total + prior_senses * s)
+                                                 (English: index.sense tag counts; multilingual: CluBERT probabilities;
+                                                 prior_count NaN: the sense is not in the distribution, p_freq = 0)
+    gold                                         is the sense a gold sense of the instance
+
+written as NumPy .npz (always) or Parquet (with pyarrow), so a notebook or tuner loads it without parsing anything:
+
+    columns, meta = load_features("features/ALL.ims.npz")
+
+meta records what the table was built from (task, system, data set, languages, sha1 of every source), so an
+export whose sources did not change is not rebuilt.
+'''
+
+FEATURES_VERSION = 1 # bump when the columns change
+FORMATS = ["npz", "parquet"]
+
+
+def language_columns(batch, indexes, langs):
+
+    # in_<LANG> (bool) and size_<LANG> (int32) of every pair
+    masks, sizes = language_masks(batch, indexes)
+    columns = OrderedDict()
+    for k, lang in enumerate(langs):
+        columns["in_" + lang] = ((masks >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        columns["size_" + lang] = sizes[k][batch.instance_of_pair].astype(np.int32)
+
+    return columns
+
+
+def prior_columns(batch, distributions):
+
+    # prior_count / prior_total / prior_senses of every pair, from the {sense: count} of each instance
+    prior_count = np.zeros(len(batch.sense_ids), dtype=np.float64)
+    prior_total = np.zeros(len(batch), dtype=np.float64)
+    prior_senses = np.zeros(len(batch), dtype=np.int32)
+    sense_ids = batch.sense_ids.tolist()
+    offsets = batch.offsets.tolist()
+
+    for i, sense_count in enumerate(distributions):
+        prior_total[i] = sum(sense_count.values())
+        prior_senses[i] = len(sense_count)
+        for pair in range(offsets[i], offsets[i + 1]):
+            prior_count[pair] = sense_count.get(batch.vocab[sense_ids[pair]], np.nan)
+
+    return OrderedDict([("prior_count", prior_count),
+                        ("prior_total", prior_total[batch.instance_of_pair]),
+                        ("prior_senses", prior_senses[batch.instance_of_pair])])
+
+
+def pair_columns(batch, datasets, lemma_pos):
+
+    # dataset, i_id, lemma_pos, sense, rank and p_wsd of every pair (datasets, lemma_pos: one per instance)
+    pairs = batch.instance_of_pair
+    return OrderedDict([("dataset", np.array(datasets, dtype=str)[pairs]),
+                        ("i_id", np.array(batch.ids, dtype=str)[pairs]),
+                        ("lemma_pos", np.array(lemma_pos, dtype=str)[pairs]),
+                        ("sense", np.array([batch.vocab[s] for s in batch.sense_ids.tolist()], dtype=str)),
+                        ("rank", (np.arange(len(pairs)) - batch.offsets[pairs]).astype(np.int32)),
+                        ("p_wsd", batch.p_wsd)])
+
+
+def source_fingerprints(paths):
+
+    return OrderedDict((path, bundle.source_sha1(path)) for path in paths)
+
+
+def english_meta(en, system, test="ALL"):
+
+    langs = [lang for lang, _ in en.mapping_paths()]
+    paths = [en.base_path(system)] + [path for _, path in en.mapping_paths()] + [en.path("index.sense"), en.path(en.key_file(test))]
+    return OrderedDict([("version", FEATURES_VERSION), ("task", "en"), ("system", system), ("test", test),
+                        ("languages", langs), ("sources", source_fingerprints(paths))])
+
+
+def english_features(en, system, test="ALL"):
+
+    # feature columns of a base system on an English data set (en: an api.EnglishWSD)
+    batch = en.base(system, test)
+    langs = [lang for lang, _ in en.mapping_paths()]
+    store = PriorStore.load(en.path("index.sense"))
+
+    datasets = []
+    lemma_pos = []
+    distributions = []
+    for i, i_id in enumerate(batch.ids):
+        datasets.append(i_id.split(".")[0] if test == "ALL" else test)
+        l_p = sense_lemma_pos(batch.sense(batch.offsets[i])) if batch.lengths[i] else ""
+        lemma_pos.append(l_p)
+        distributions.append(dict(store.counts(l_p)) if l_p else {})
+
+    columns = pair_columns(batch, datasets, lemma_pos)
+    columns.update(language_columns(batch, en.constraints(test), langs))
+    columns.update(prior_columns(batch, distributions))
+    columns["gold"] = gold_labels(batch, bundle.load_gold(en.path(en.key_file(test))))[0]
+
+    return columns
+
+
+def mapping_language(path, lang):
+
+    # the other language of a multilingual mapping: semeval2013_bnsyn_trans_mapping.en-de.de.txt -> EN
+    pair = os.path.basename(bundle.logical_path(path)).split(".")[-3].split("-")
+    others = [side for side in pair if side != lang]
+
+    return (others[0] if others else pair[0]).upper()
+
+
+def multilingual_meta(mwsd, system, test, lang, t_type="tst"):
+
+    paths = (mwsd.base_paths(system, test, lang, t_type) + mwsd.mapping_paths(test, lang)
+             + [mwsd.lemma_map_path(test, lang), mwsd.clubert_path(lang), mwsd.path(mwsd.key_file(test, lang, t_type))])
+    return OrderedDict([("version", FEATURES_VERSION), ("task", "mwsd"), ("system", system), ("test", test), ("lang", lang),
+                        ("type", t_type), ("languages", [mapping_language(path, lang) for path in mwsd.mapping_paths(test, lang)]),
+                        ("sources", source_fingerprints(paths))])
+
+
+def multilingual_features(mwsd, system, test, lang, t_type="tst"):
+
+    # feature columns of a base system on a multilingual data set (mwsd: an api.MultilingualWSD)
+    batch = mwsd.base(system, test, lang, t_type)
+    langs = [mapping_language(path, lang) for path in mwsd.mapping_paths(test, lang)]
+    table = bundle.load_lemma_map(mwsd.lemma_map_path(test, lang))
+    id_lemma_map = dict(zip(table.ids.tolist(), table.lemma_pos.tolist()))
+    sense_freq = mwsd.sense_freq(test, lang)
+
+    columns = pair_columns(batch, [test] * len(batch), [id_lemma_map.get(i_id, "") for i_id in batch.ids])
+    columns.update(language_columns(batch, mwsd.constraints(test, lang), langs))
+    columns.update(prior_columns(batch, [sense_freq.get(i_id, {}) for i_id in batch.ids]))
+    columns["gold"] = gold_labels(batch, bundle.load_gold(mwsd.path(mwsd.key_file(test, lang, t_type))))[0]
+
+    return columns
+
+
+def default_format():
+
+    return "parquet" if pyarrow is not None else "npz"
+
+
+def save_features(file_path, columns, meta):
+
+    # .parquet (needs pyarrow) or .npz, by extension; written to a temporary file, then renamed
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = file_path + ".tmp-" + str(os.getpid())
+
+    if file_path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ValueError("writing " + file_path + " needs the pyarrow package (pip install pyarrow), or use .npz")
+        table = pyarrow.table(dict(columns), metadata={"t4wsd": json.dumps(meta)})
+        pyarrow.parquet.write_table(table, tmp_path)
+    else:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **columns)
+    os.replace(tmp_path, file_path)
+
+
+def load_meta(file_path):
+
+    # meta of a saved table, None when it cannot be read
+    try:
+        if file_path.endswith(".parquet"):
+            if pyarrow is None:
+                return None
+            return json.loads(pyarrow.parquet.read_schema(file_path).metadata[b"t4wsd"])
+        with np.load(file_path) as data:
+            return json.loads(str(data["meta"]))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def load_features(file_path):
+
+    # ({column: numpy array}, meta) of a saved table
+    if file_path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ValueError("reading " + file_path + " needs the pyarrow package (pip install pyarrow)")
+        table = pyarrow.parquet.read_table(file_path)
+        columns = OrderedDict((name, table.column(name).to_numpy()) for name in table.column_names)
+        return columns, json.loads(table.schema.metadata[b"t4wsd"])
+
+    with np.load(file_path) as data:
+        columns = OrderedDict((name, data[name]) for name in data.files if name != "meta")
+        meta = json.loads(str(data["meta"]))
+
+    return columns, meta
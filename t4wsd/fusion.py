@@ -0,0 +1,133 @@
+#-*- coding: utf-8 -*-
+
+import numpy as np
+
+from t4wsd.scoring import Batch, get_p_trans, log_expert, segment_argmax, count_decisions
+
+'''
+# Multi-system fusion
+
+SoftConstraint over several base systems at once, with one p_wsd expert (and exponent) per system:
+
+    p(sense) = p_wsd_1^a_1 * ... * p_wsd_n^a_n * p_trans^b * p_freq^c
+
+    align     the ranked outputs are aligned per instance on the union of their candidates, in order of first
+              appearance (instances and senses of system 1 in rank order, then those only later systems rank):
+              p_wsd[k, pair] = score system k gives the sense, fill for a candidate it does not rank,
+              1 (no evidence) on instances it does not cover or scores without a positive number (NaN, all 0)
+    decide    one vectorized pass over the aligned arrays, like soft_decisions: first maximum of
+              a_1 log p_wsd_1 + ... + a_n log p_wsd_n + b log p_trans + c log p_freq per instance;
+              monosemous and unconstrained instances take the first maximum of the p_wsd terms alone (the ensemble)
+
+The senses (and constraints, p_trans, p_freq) are looked up once for the union, so an ensemble costs one run
+with a few more candidates. With a single system the decisions are those of soft_decisions.
+'''
+
+MISSING_P_WSD = 1e-4 # p_wsd of a candidate a system does not rank (0 would veto every sense another system adds)
+
+
+def usable_instances(batch):
+
+    # instances whose scores are all numbers, at least one positive
+    usable = np.zeros(len(batch), dtype=bool)
+    nonempty = batch.lengths > 0
+    if nonempty.any():
+        starts = batch.starts[nonempty]
+        has_nan = np.add.reduceat(np.isnan(batch.p_wsd).astype(np.int64), starts) > 0
+        with np.errstate(invalid="ignore"):
+            has_positive = np.maximum.reduceat(np.nan_to_num(batch.p_wsd, nan=0.0), starts) > 0.0
+        usable[nonempty] = ~has_nan & has_positive
+
+    return usable
+
+
+def align(batches, fill=MISSING_P_WSD):
+
+    # Batch of the union of the candidates of every instance (batches share one vocab), and p_wsd[k, pair] of every system
+    vocab = batches[0].vocab
+    position = {}
+    ids = []
+    instance_maps = []
+    for batch in batches:
+        instance_map = np.empty(len(batch), dtype=np.int64)
+        for i, i_id in enumerate(batch.ids):
+            if i_id not in position:
+                position[i_id] = len(ids)
+                ids.append(i_id)
+            instance_map[i] = position[i_id]
+        instance_maps.append(instance_map)
+
+    # (fused instance, sense) keys of every pair, system after system: the first occurrence of a key sets its order
+    n_senses = max([int(batch.sense_ids.max()) + 1 for batch in batches if len(batch.sense_ids)] + [1])
+    keys = [instance_map[batch.instance_of_pair] * n_senses + batch.sense_ids
+            for batch, instance_map in zip(batches, instance_maps)]
+    unique_keys, first = np.unique(np.concatenate(keys), return_index=True)
+    unique_instances = unique_keys // n_senses
+    order = np.lexsort((first, unique_instances))
+    pair_of_unique = np.empty(len(order), dtype=np.int64)
+    pair_of_unique[order] = np.arange(len(order))
+
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(unique_instances, minlength=len(ids)))])
+    fused = Batch(ids, offsets, (unique_keys % n_senses)[order], np.zeros(len(order)), vocab)
+
+    p_wsd = np.full((len(batches), len(order)), fill, dtype=np.float64)
+    for k, (batch, instance_map, batch_keys) in enumerate(zip(batches, instance_maps, keys)):
+        p_wsd[k, pair_of_unique[np.searchsorted(unique_keys, batch_keys)]] = batch.p_wsd
+        usable = np.zeros(len(ids), dtype=bool)
+        usable[instance_map[usable_instances(batch)]] = True
+        p_wsd[k, ~usable[fused.instance_of_pair]] = 1.0
+    fused.p_wsd = p_wsd[0].copy()
+
+    return fused, p_wsd
+
+
+def fusion_scores(batch, p_wsd, indexes, p_freq, weights, b, c, smoothing, zero_sum_one=False, counters=None, masks=None):
+
+    # (scores, p_wsd terms, p_trans, constrained) of every pair: the log product of experts and its parts
+    p_trans, constrained = get_p_trans(batch, indexes, smoothing, zero_sum_one, counters, masks)
+    wsd_scores = np.zeros(len(batch.sense_ids), dtype=np.float64)
+    for p_k, a_k in zip(p_wsd, weights):
+        wsd_scores = wsd_scores + log_expert(p_k, a_k)
+    scores = wsd_scores + log_expert(p_trans, b)
+    if c:
+        scores = scores + log_expert(p_freq, c)
+
+    return scores, wsd_scores, p_trans, constrained
+
+
+def fusion_decisions(batch, p_wsd, indexes, p_freq, weights, b, c, smoothing, zero_sum_one=False, counters=None, masks=None):
+
+    # index (within its instance) of the fused SoftConstraint answer of every instance (batch, p_wsd: align)
+    # counters: as soft_decisions ("changed": the answer is not the top sense of the first system)
+    scores, wsd_scores, p_trans, constrained = fusion_scores(batch, p_wsd, indexes, p_freq, weights, b, c, smoothing, zero_sum_one, counters, masks)
+
+    p_wsd_lists = p_wsd.tolist()
+    p_trans_list = p_trans.tolist()
+    p_freq_list = p_freq.tolist() if c else None
+    def exact_wsd(pair):
+        product = 1.0
+        for p_k, a_k in zip(p_wsd_lists, weights):
+            product = product * pow(p_k[pair], a_k)
+        return product
+    def exact(pair):
+        if c:
+            return exact_wsd(pair) * pow(p_trans_list[pair], b) * pow(p_freq_list[pair], c)
+        return exact_wsd(pair) * pow(p_trans_list[pair], b)
+
+    best = segment_argmax(scores, batch.offsets, exact, counters)
+
+    # monosemous instances and instances without any constraint take the best sense of the p_wsd experts
+    keep_top = (batch.lengths == 1) | ~constrained
+    if keep_top.any():
+        best[keep_top] = segment_argmax(wsd_scores, batch.offsets, exact_wsd)[keep_top]
+
+    if counters is not None:
+        count_decisions(counters, batch, best)
+
+    return best
+
+
+def add_fusion_arguments(parser):
+
+    parser.add_argument("--weights", default="", help="comma-separated p_wsd exponents of the systems fused by -m soft with -s SYSTEM1,SYSTEM2,... (default: a of the first system split evenly)")
+    parser.add_argument("--fill", default=MISSING_P_WSD, type=float, help="p_wsd of a candidate a fused system does not rank (default: " + str(MISSING_P_WSD) + ")")
@@ -0,0 +1,158 @@
+#-*- coding: utf-8 -*-
+
+import cProfile
+import collections
+import json
+import os
+import resource
+import signal
+import sys
+import time
+from contextlib import contextmanager
+
+'''
+# Instrumentation
+
+A Recorder times the stages of a run and collects the counters of the scoring engine; save() writes them
+next to the output file:
+
+    <out>.stats.json    {"stages": {name: {seconds, calls, peak_rss_mb, rss_growth_mb}}, "counters": {...}, ...}
+
+peak_rss_mb is the high-water mark of the process at the end of the stage, rss_growth_mb how much the stage
+raised it (0 when the stage stayed below an earlier peak).
+
+With profile=True, the hot stages (stage(name, hot=True)) also run under cProfile and a stack sampler:
+
+    <out>.prof          cProfile statistics (python -m pstats, snakeviz, ...)
+    <out>.collapsed     sampled stacks, one "outer;...;inner count" line per stack (flamegraph.pl, speedscope)
+'''
+
+SAMPLE_INTERVAL = 0.001 # seconds of CPU time between two stack samples
+
+
+def max_rss_mb():
+
+    # high-water mark of the resident set size (ru_maxrss is in KB on Linux, in bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def frame_label(frame):
+
+    code = frame.f_code
+    return os.path.basename(code.co_filename) + ":" + code.co_name
+
+
+class StackSampler(object):
+
+    # counts of the Python stacks seen every SAMPLE_INTERVAL of CPU time (main thread, Unix)
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._previous = None
+
+    def _sample(self, signum, frame):
+        labels = []
+        while frame is not None:
+            labels.append(frame_label(frame))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def write(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(self.stacks.items()):
+                f.write(stack + " " + str(n) + "\n")
+
+
+class Recorder(object):
+
+    # stats=False: time and count, but write no <out>.stats.json
+    def __init__(self, stats=True, profile=False, **info):
+        self.stats = stats
+        self.info = info
+        self.stages = collections.OrderedDict()
+        self.counters = {}
+        self.profile = cProfile.Profile() if profile else None
+        self.sampler = StackSampler() if profile and hasattr(signal, "setitimer") else None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, hot=False):
+
+        # a stage entered several times adds up its seconds and calls
+        profiled = hot and self.profile is not None
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        if profiled:
+            if self.sampler is not None:
+                self.sampler.start()
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if profiled:
+                self.profile.disable()
+                if self.sampler is not None:
+                    self.sampler.stop()
+            seconds = time.perf_counter() - start
+            rss_after = max_rss_mb()
+            stats = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_rss_mb": 0.0, "rss_growth_mb": 0.0})
+            stats["seconds"] += seconds
+            stats["calls"] += 1
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"], rss_after)
+            stats["rss_growth_mb"] += rss_after - rss_before
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def as_dict(self):
+        stages = collections.OrderedDict()
+        for name, stats in self.stages.items():
+            stages[name] = {"seconds": round(stats["seconds"], 6), "calls": stats["calls"],
+                            "peak_rss_mb": round(stats["peak_rss_mb"], 1), "rss_growth_mb": round(stats["rss_growth_mb"], 1)}
+
+        stats = collections.OrderedDict(self.info)
+        stats["seconds"] = round(time.perf_counter() - self._start, 6)
+        stats["peak_rss_mb"] = round(max_rss_mb(), 1)
+        stats["stages"] = stages
+        stats["counters"] = dict(sorted(self.counters.items()))
+
+        return stats
+
+    def save(self, out_path):
+
+        # <out>.stats.json, and with profiling <out>.prof and <out>.collapsed; returns the paths written
+        paths = []
+        if self.stats:
+            paths.append(out_path + ".stats.json")
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                json.dump(self.as_dict(), f, indent=2)
+                f.write("\n")
+
+        if self.profile is not None:
+            paths.append(out_path + ".prof")
+            self.profile.dump_stats(paths[-1])
+            if self.sampler is not None:
+                paths.append(out_path + ".collapsed")
+                self.sampler.write(paths[-1])
+
+        return paths
+
+
+def recorder_from_args(args, **info):
+
+    return Recorder(not args.no_stats, args.profile, **info)
+
+
+def add_instrument_arguments(parser):
+
+    parser.add_argument("--no-stats", default=False, action="store_true", help="flag to not write <out>.stats.json (stage times, memory and counters) next to the output (default: False)")
+    parser.add_argument("--profile", default=False, action="store_true", help="flag to profile the reranking loop into <out>.prof (cProfile) and <out>.collapsed (sampled stacks) (default: False)")
@@ -0,0 +1,96 @@
+#-*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from t4wsd import bundle
+from t4wsd.readers import resolve_path
+
+'''
+# Concurrent loading
+
+The input files of a run do not depend on each other, so they are fetched side by side:
+
+    compile    sources whose bundle is missing or stale, parsed in a process pool (CPU bound;
+               the columns are written to bundle/ and only the manifest comes back); a source larger than
+               bundle.CHUNK_BYTES is cut into byte ranges parsed side by side and merged in file order
+    process    other CPU-bound parsing (e.g. CluBERT distributions), also in the process pool
+    read       memory-mapping the compiled tables, in a thread pool
+
+Objects that intern senses into the shared SENSE_VOCAB (Batch, ConstraintIndex) are built afterwards by the caller,
+in a fixed order, so ids and results never depend on which file finished first.
+With workers=1 everything runs in the calling process, one file after another.
+'''
+
+
+def default_workers():
+
+    return os.cpu_count() or 1
+
+
+def stale_sources(file_paths):
+
+    # (file_path, kind, n_fields) of the sources whose bundle has to be (re)built
+    stale = []
+    for file_path in file_paths:
+        file_path = resolve_path(file_path)
+        kind, n_fields = bundle.source_kind(file_path)
+        if not bundle.is_fresh(file_path, bundle.read_manifest(file_path), kind, n_fields):
+            stale.append((file_path, kind, n_fields))
+
+    return stale
+
+
+def compile_sources(pool, sources, chunk_bytes=bundle.CHUNK_BYTES, force=False):
+
+    # compile (file_path, kind, n_fields) sources in a process pool: small or compressed ones whole,
+    # large ones in chunks (every chunk is queued before the first one is merged); returns their manifests
+    whole = {}
+    chunked = {}
+    for file_path, kind, n_fields in sources:
+        if bundle.is_chunkable(file_path, kind) and os.path.getsize(file_path) > chunk_bytes:
+            chunked[file_path] = [pool.submit(bundle.compile_chunk, file_path, kind, n_fields, start, end)
+                                  for start, end in bundle.chunk_ranges(file_path, chunk_bytes)]
+        else:
+            whole[file_path] = pool.submit(bundle.ensure_compiled, file_path, kind, n_fields, force)
+
+    manifests = {}
+    for file_path, kind, n_fields in sources:
+        if file_path in chunked:
+            parts = [future.result() for future in chunked[file_path]]
+            manifests[file_path] = bundle.write_source(file_path, kind, n_fields, *bundle.merge_chunks(parts))
+        else:
+            manifests[file_path] = whole[file_path].result()
+
+    return manifests
+
+
+def load_tables(file_paths, workers=None, processes=()):
+
+    # {file_path: bundle Table} of every file, and {name: result} of processes, a list of (name, function, args)
+    # run in the process pool at the same time (function must be importable, its result picklable)
+    if workers is None:
+        workers = default_workers()
+    file_paths = list(dict.fromkeys(file_paths))
+    stale = stale_sources(file_paths)
+
+    if workers <= 1:
+        results = {name: function(*args) for name, function, args in processes}
+        return {file_path: bundle.load_table(file_path, *bundle.source_kind(file_path)) for file_path in file_paths}, results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {name: pool.submit(function, *args) for name, function, args in processes}
+        compile_sources(pool, stale)
+
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            futures = {file_path: threads.submit(bundle.load_table, file_path, *bundle.source_kind(file_path)) for file_path in file_paths}
+            tables = {file_path: future.result() for file_path, future in futures.items()}
+
+        results = {name: future.result() for name, future in jobs.items()}
+
+    return tables, results
+
+
+def add_loader_arguments(parser):
+
+    parser.add_argument("--load-workers", default=default_workers(), type=int, help="processes / threads loading the input files side by side, 1 loads them one after another (default: number of CPUs)")
@@ -0,0 +1,242 @@
+#-*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from t4wsd.fusion import fusion_scores
+from t4wsd.readers import suffix_compression, compressed, COMPRESSED_SUFFIXES
+from t4wsd.scoring import combine, get_p_trans, segment_sum
+
+'''
+# Output sinks
+
+Prediction files are written through an AtomicWriter:
+
+    write()     text is collected and encoded in batches of BUFFER_LINES writes (one large write each)
+    close()     the batches go to <out>.tmp-<pid> (gzip / xz / bz2 / zstd compressed when <out> ends with
+                .gz / .xz / .bz2 / .zst), which is renamed over <out> once everything is written;
+                an exception inside `with AtomicWriter(out)` removes the temporary file instead
+
+so a crash never leaves a partial output a scorer would read.
+
+Two formats:
+
+    key      "i_id sense" per line, what Scorer.java reads (write_predictions)
+    jsonl    one JSON object per instance with the answer and every ranked sense with its experts
+             (write_details, next to the key file as <out>.jsonl):
+
+             {"id": ..., "answer": sense, "senses": [{"sense", "p_wsd", "languages", "p_trans", "p_freq", "score", "p"}, ...]}
+
+             languages: the languages whose candidates include the sense; p_trans, p_freq (SoftConstraint):
+             the experts, score: a log p_wsd + b log p_trans + c log p_freq, p: the normalized product of experts
+             of the instance; HardConstraint gives "intersection" (a candidate of every constraining language) instead,
+             a fused SoftConstraint (t4wsd/fusion.py) also p_wsd.<system> of every system.
+             Values that are not finite numbers (no base score, log 0) are null.
+'''
+
+BUFFER_LINES = 1 << 14 # writes collected before they are encoded and written at once
+
+
+class AtomicWriter(object):
+
+    # text output committed by renaming a temporary file over file_path on close
+
+    def __init__(self, file_path, buffer_lines=BUFFER_LINES):
+        self.file_path = file_path
+        self.tmp_path = file_path + ".tmp-" + str(os.getpid())
+        self.buffer_lines = buffer_lines
+        self.pending = []
+        self.raw = open(self.tmp_path, "wb")
+        try:
+            self.stream = compressed(self.raw, suffix_compression(file_path), file_path)
+        except Exception:
+            self.abort()
+            raise
+
+    def write(self, text):
+        self.pending.append(text)
+        if len(self.pending) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.stream.write("".join(self.pending).encode("utf-8"))
+            self.pending = []
+
+    def close(self):
+        # commit: everything written, then renamed into place
+        if self.raw.closed:
+            return
+        try:
+            self.flush()
+            if self.stream is not self.raw:
+                self.stream.close()
+            self.raw.flush()
+            os.fsync(self.raw.fileno())
+            self.raw.close()
+            os.replace(self.tmp_path, self.file_path)
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        # drop everything written so far; file_path is left as it was
+        self.raw.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class StdoutWriter(object):
+
+    # utf-8 text to stdout; close() only flushes, so leaving `with open_output("")` keeps stdout open
+    # (a reader that exits early, e.g. `| head`, ends the process quietly instead of with a BrokenPipeError)
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout.buffer
+
+    def write(self, text):
+        try:
+            self.stream.write(text.encode("utf-8"))
+        except BrokenPipeError:
+            self.reader_gone()
+
+    def flush(self):
+        try:
+            self.stream.flush()
+        except BrokenPipeError:
+            self.reader_gone()
+
+    def reader_gone(self):
+        # what is still buffered goes to devnull (so the flush at exit cannot fail again), as the Python docs recommend
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, self.stream.fileno())
+        sys.exit(1)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_output(file_path):
+
+    # stdout for "", else an AtomicWriter
+    if not file_path:
+        return StdoutWriter()
+
+    return AtomicWriter(file_path)
+
+
+def write_predictions(newf, predictions):
+
+    # "i_id sense" lines (key format) of (i_id, sense) pairs
+    for i_id, sense in predictions:
+        newf.write(i_id + " " + sense + "\n")
+
+
+def jsonl_path(out_path):
+
+    # <out>.jsonl next to <out>, compressed the same way (ALL.ims.soft.out.gz -> ALL.ims.soft.out.jsonl.gz)
+    for suffix in COMPRESSED_SUFFIXES:
+        if out_path.endswith(suffix):
+            return out_path[:-len(suffix)] + ".jsonl" + suffix
+
+    return out_path + ".jsonl"
+
+
+def finite(values):
+
+    # floats of an array, None for NaN and infinities (which JSON cannot hold)
+    return [v if np.isfinite(v) else None for v in values.tolist()]
+
+
+def hard_details(batch, indexes, masks):
+
+    # per-pair columns of write_details for HardConstraint
+    masks = masks[0]
+    return {"intersection": (masks == np.uint64((1 << len(indexes)) - 1)).tolist()}
+
+
+def soft_details(batch, indexes, p_freq, a, b, c, smoothing, zero_sum_one=False, masks=None):
+
+    # per-pair columns of write_details for SoftConstraint (masks: language_masks of the batch, when already computed)
+    p_trans, _ = get_p_trans(batch, indexes, smoothing, zero_sum_one, masks=masks)
+    scores = combine(batch.p_wsd, p_trans, p_freq if c else None, a, b, c)
+
+    return expert_details(batch, scores, p_trans, p_freq, c)
+
+
+def fusion_details(batch, p_wsd, systems, indexes, p_freq, weights, b, c, smoothing, zero_sum_one=False, masks=None):
+
+    # per-pair columns of write_details for a fused SoftConstraint (batch, p_wsd: fusion.align), with p_wsd.<system>
+    scores, _, p_trans, _ = fusion_scores(batch, p_wsd, indexes, p_freq, weights, b, c, smoothing, zero_sum_one, masks=masks)
+    details = dict(("p_wsd." + system, finite(p_k)) for system, p_k in zip(systems, p_wsd))
+    details.update(expert_details(batch, scores, p_trans, p_freq, c))
+
+    return details
+
+
+def expert_details(batch, scores, p_trans, p_freq, c):
+
+    # p_trans, p_freq, score and p: exp(score) normalized per instance (shifted by the instance maximum)
+    shifted = np.where(np.isfinite(scores), scores, -np.inf)
+    seg_max = np.full(len(batch), -np.inf)
+    nonempty = batch.lengths > 0
+    if nonempty.any():
+        seg_max[nonempty] = np.maximum.reduceat(shifted, batch.starts[nonempty])
+    with np.errstate(invalid="ignore"):
+        weights = np.exp(shifted - seg_max[batch.instance_of_pair])
+        p = weights / segment_sum(weights, batch.offsets)[batch.instance_of_pair]
+
+    details = {"p_trans": finite(p_trans)}
+    if c:
+        details["p_freq"] = finite(np.asarray(p_freq, dtype=np.float64))
+    details["score"] = finite(scores)
+    details["p"] = finite(p)
+
+    return details
+
+
+def write_details(newf, batch, best, langs, masks, details):
+
+    # one JSON line per instance: the answer and every ranked sense with p_wsd, its languages and the details columns
+    sense_ids = batch.sense_ids.tolist()
+    p_wsd = finite(batch.p_wsd)
+    lang_masks = masks[0].tolist()
+    offsets = batch.offsets.tolist()
+    best = best.tolist()
+    lang_bits = [(1 << k, lang) for k, lang in enumerate(langs)]
+
+    for i, i_id in enumerate(batch.ids):
+        senses = []
+        for pair in range(offsets[i], offsets[i + 1]):
+            sense = {"sense": batch.vocab[sense_ids[pair]], "p_wsd": p_wsd[pair],
+                     "languages": [lang for bit, lang in lang_bits if lang_masks[pair] & bit]}
+            for name, column in details.items():
+                sense[name] = column[pair]
+            senses.append(sense)
+        answer = batch.vocab[sense_ids[offsets[i] + best[i]]] if offsets[i + 1] > offsets[i] else None
+        newf.write(json.dumps({"id": i_id, "answer": answer, "senses": senses}, ensure_ascii=False) + "\n")
+
+
+def add_output_arguments(parser):
+
+    parser.add_argument("--jsonl", default=False, action="store_true", help="flag to also write <out>.jsonl: every ranked sense of each instance with its expert scores (default: False)")
@@ -0,0 +1,280 @@
+#-*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+import numpy as np
+
+from t4wsd import bundle
+from t4wsd.constraints import KEY_STRIDE
+from t4wsd.readers import iter_lines, sense_lemma_pos
+
+'''
+# Sense frequency priors
+
+WordNet's index.sense is compiled once into the bundle as a table sorted by lemma_pos:
+
+    lemma_pos[row]                              sorted "lemma pos" keys
+    sense_keys / counts[offsets[row]:offsets[row + 1]]   raw tag counts of its senses, in file order
+
+A lemma_pos is found by binary search over the memory-mapped keys when it is first queried, and additive
+smoothing is applied at query time, so the same artifact serves every s_smoothing value:
+
+    p_freq(sense) = (count + smoothing) / sum over the senses of the lemma_pos of (count + smoothing)
+
+(the sum runs in file order, as get_p_freq used to compute it).
+
+Multilingual WSD uses CluBERT sense distributions instead, one {bn_id: probability} per lemma_pos and language.
+A test set only needs the lemma_pos of its lemma map, so the distribution file is streamed and only their lines
+are parsed (read_lemma_sense_distributions with lemma_pos_set).
+Both priors are turned into a p_freq per (instance, sense) pair of a Batch:
+
+    top_sense_p_freq     English: the distribution of the lemma_pos of the top-ranked sense
+    instance_p_freq      multilingual: the distribution of the lemma_pos of the instance (lemma map)
+
+Neither loops over the pairs: the distributions the batch needs are flattened once into (distribution, sense id,
+p_freq) entries (for index.sense with one searchsorted over the padded keys and a gather of their counts), and
+every pair finds its entry with one searchsorted over packed (distribution, sense id) keys, as in
+ConstraintIndex.contains_pairs.
+'''
+
+_STORES = {}
+
+
+class PriorStore(object):
+
+    def __init__(self, table):
+        self.table = table
+        self.keys = table.lemma_pos
+        self.offsets = table.offsets
+        self._padded = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _key(self, row):
+        blob = self.keys.blob
+        return bytes(blob[self.keys.offsets[row]:self.keys.offsets[row + 1] - 1])
+
+    def find(self, lemma_pos):
+
+        # row of a lemma_pos, -1 if WordNet has no sense for it
+        target = lemma_pos.encode("utf-8")
+        lo = 0
+        hi = len(self.keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.keys) and self._key(lo) == target:
+            return lo
+
+        return -1
+
+    def padded_keys(self):
+
+        # the sorted keys as one fixed-width bytes array (zero padded), built from the blob without decoding it
+        if self._padded is None:
+            blob = np.asarray(self.keys.blob)
+            offsets = np.asarray(self.keys.offsets, dtype=np.int64)
+            lengths = np.diff(offsets) - 1 # without the "\n" terminator
+            width = max(int(lengths.max()) if len(lengths) else 0, 1)
+            row_of = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths + 1)
+            column = np.arange(len(blob), dtype=np.int64) - offsets[row_of]
+            keep = column < lengths[row_of]
+            padded = np.zeros((len(lengths), width), dtype=np.uint8)
+            padded[row_of[keep], column[keep]] = blob[keep]
+            self._padded = padded.view("S" + str(width)).ravel()
+
+        return self._padded
+
+    def find_many(self, lemma_pos_list):
+
+        # rows of many lemma_pos at once (-1 where WordNet has no sense), like find
+        keys = self.padded_keys()
+        encoded = [lemma_pos.encode("utf-8") for lemma_pos in lemma_pos_list]
+        queries = np.array(encoded, dtype=keys.dtype) # longer queries are cut to the key width, so they are checked
+        fits = np.array([len(e) <= keys.itemsize for e in encoded], dtype=bool)
+        if len(keys) == 0:
+            return np.full(len(encoded), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+
+        return np.where(fits & (keys[pos] == queries), pos, -1).astype(np.int64)
+
+    def counts(self, lemma_pos):
+
+        # [(sense_key, tag count)] of a lemma_pos, in file order
+        row = self.find(lemma_pos)
+        if row < 0:
+            return []
+        start = int(self.offsets[row])
+        end = int(self.offsets[row + 1])
+
+        return [(self.table.sense_keys[k], int(self.table.counts[k])) for k in range(start, end)]
+
+    def sense_freq(self, lemma_pos, smoothing):
+
+        # {sense_key: smoothed relative frequency} ({} for an unknown lemma_pos)
+        smoothed = [(sense, count + smoothing) for sense, count in self.counts(lemma_pos)]
+        sum_count = 0
+        for sense, count in smoothed:
+            sum_count += count
+
+        return {sense: float(count) / sum_count for sense, count in smoothed}
+
+    def smoothed(self, smoothing):
+        return SmoothedPriors(self, smoothing)
+
+    @classmethod
+    def load(cls, file_path="index.sense"):
+        if file_path not in _STORES:
+            _STORES[file_path] = cls(bundle.load_prior(file_path))
+        return _STORES[file_path]
+
+
+class SmoothedPriors(object):
+
+    # read-only {lemma_pos: {sense_key: p_freq}} for one smoothing value, normalized on first access
+
+    def __init__(self, store, smoothing):
+        self.store = store
+        self.smoothing = smoothing
+        self.cache = {}
+
+    def __getitem__(self, lemma_pos):
+        if lemma_pos not in self.cache:
+            self.cache[lemma_pos] = self.store.sense_freq(lemma_pos, self.smoothing)
+        return self.cache[lemma_pos]
+
+    def __contains__(self, lemma_pos):
+        return self.store.find(lemma_pos) >= 0
+
+    def get(self, lemma_pos, default=None):
+        if lemma_pos not in self:
+            return default
+        return self[lemma_pos]
+
+    def entries(self, lemma_pos_list, vocab):
+
+        # (k, sense id, p_freq) of every sense of lemma_pos_list[k], as distribution_entries of self[lemma_pos]
+        # (sums run in file order, one sense position at a time, so they equal those of sense_freq)
+        rows = self.store.find_many(lemma_pos_list)
+        found = np.flatnonzero(rows >= 0)
+        positions, row_offsets = bundle.segment_positions(self.store.offsets, rows[found])
+        lengths = np.diff(row_offsets)
+        smoothed = np.asarray(self.store.table.counts)[positions].astype(np.float64) + self.smoothing
+        sums = np.zeros(len(found), dtype=np.float64)
+        for j in range(int(lengths.max()) if len(lengths) else 0):
+            has_j = lengths > j
+            sums[has_j] += smoothed[row_offsets[:-1][has_j] + j]
+
+        owner = np.repeat(found, lengths)
+        sense_ids = vocab.remap(self.store.table.sense_keys.take(positions), add=False)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = smoothed / np.repeat(sums, lengths)
+
+        return owner, sense_ids, values
+
+
+def read_lemma_sense_distributions(file_path, lemma_pos_set=None):
+
+    # CluBERT sense distribution of every lemma_pos: {lemma_pos: {bn_id: probability}}
+    # (a sense without "#probability" gets 1.0); lemma_pos_set: parse only the lines of these lemma_pos
+    lemma_sense_freq = defaultdict(dict)
+    for line in iter_lines(file_path):
+        lemma_pos = line.split("\t", 1)[0].replace("#", " ")
+        if lemma_pos_set is not None and lemma_pos not in lemma_pos_set:
+            continue
+        for sense_prob in line.split("\t")[1:]:
+            if "#" not in sense_prob:
+                lemma_sense_freq[lemma_pos][sense_prob] = float(1.0)
+            else:
+                sense, prob = sense_prob.split("#")[:2]
+                lemma_sense_freq[lemma_pos][sense] = float(prob)
+
+    return lemma_sense_freq
+
+
+def instance_sense_freq(lemma_sense_freq, id_lemma_map):
+
+    # {i_id: sense distribution of its lemma_pos}
+    return {i_id: lemma_sense_freq[lemma_pos] for i_id, lemma_pos in id_lemma_map.items()}
+
+
+def distribution_entries(distributions, vocab):
+
+    # (k, sense id, p_freq) of every entry of the {sense: p_freq} dicts distributions[k] (sense id -1: not in vocab)
+    owner = []
+    sense_ids = []
+    values = []
+    for k, sense_freq in enumerate(distributions):
+        for sense, p in sense_freq.items():
+            owner.append(k)
+            sense_ids.append(vocab.lookup(sense))
+            values.append(p)
+
+    return np.array(owner, dtype=np.int64), np.array(sense_ids, dtype=np.int32), np.array(values, dtype=np.float64)
+
+
+def pair_entries(batch, distribution_of, entries):
+
+    # p_freq of every pair: the entry of (distribution of its instance, its sense), 0 without one
+    # (distribution_of[i] = -1: no distribution; a sense listed twice takes its last entry, as a dict would)
+    owner, sense_ids, values = entries
+    known = sense_ids >= 0
+    keys = owner[known] * KEY_STRIDE + sense_ids[known]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = values[known][order]
+
+    p_freq = np.zeros(len(batch.sense_ids), dtype=np.float64)
+    pair_owner = np.asarray(distribution_of, dtype=np.int64)[batch.instance_of_pair]
+    query = pair_owner * KEY_STRIDE + batch.sense_ids
+    pos = np.searchsorted(keys, query, side="right") - 1
+    hit = (pair_owner >= 0) & (pos >= 0)
+    hit[hit] = keys[pos[hit]] == query[hit]
+    p_freq[hit] = values[pos[hit]]
+
+    return p_freq
+
+
+def top_sense_p_freq(batch, sense_freq_dict):
+
+    # p_freq of every (instance, sense) pair, from the sense frequencies of the lemma_pos of the top sense
+    # (sense_freq_dict: {lemma_pos: {sense_key: p_freq}}, e.g. SmoothedPriors)
+    # predictions from WN1st sense backoff or monosemous words (one sense) are never reranked, their p_freq stays 0
+    reranked = np.flatnonzero(batch.lengths > 1)
+    top_ids, top_of = np.unique(batch.sense_ids[batch.starts[reranked]], return_inverse=True)
+    lemma_pos_list = sorted(set(sense_lemma_pos(batch.vocab[s]) for s in top_ids.tolist()))
+    position = dict((lemma_pos, k) for k, lemma_pos in enumerate(lemma_pos_list))
+    lemma_pos_of = np.array([position[sense_lemma_pos(batch.vocab[s])] for s in top_ids.tolist()], dtype=np.int64)
+
+    distribution_of = np.full(len(batch), -1, dtype=np.int64)
+    distribution_of[reranked] = lemma_pos_of[top_of]
+    if isinstance(sense_freq_dict, SmoothedPriors):
+        entries = sense_freq_dict.entries(lemma_pos_list, batch.vocab)
+    else:
+        entries = distribution_entries([sense_freq_dict[lemma_pos] for lemma_pos in lemma_pos_list], batch.vocab)
+
+    return pair_entries(batch, distribution_of, entries)
+
+
+def instance_p_freq(batch, sense_freq_dict, i_ids=None):
+
+    # p_freq of every (instance, sense) pair, from the sense distribution of the instance ({i_id: {sense: p_freq}})
+    # (i_ids: instance ids when they are not the batch ids; instances of one lemma_pos share their dict, so each
+    # distribution is flattened once)
+    distributions = []
+    position = {}
+    distribution_of = np.full(len(batch), -1, dtype=np.int64)
+    for i, i_id in enumerate(batch.ids if i_ids is None else i_ids):
+        sense_freq = sense_freq_dict.get(i_id)
+        if not sense_freq:
+            continue
+        if id(sense_freq) not in position:
+            position[id(sense_freq)] = len(distributions)
+            distributions.append(sense_freq)
+        distribution_of[i] = position[id(sense_freq)]
+
+    return pair_entries(batch, distribution_of, distribution_entries(distributions, batch.vocab))
@@ -0,0 +1,238 @@
+#-*- coding: utf-8 -*-
+
+import bz2
+import codecs
+import glob
+import gzip
+import lzma
+import os
+
+try:
+    import zstandard
+except ImportError: # optional: only needed for .zst inputs
+    zstandard = None
+
+'''
+Line parsers for the text formats shipped with the repository
+
+ranked output   i_id \t sense score \t sense score ...      (base_outputs/, mwsd_base_outputs/)
+mapping         i_id \t lemma_pos \t trans [\t bn_syns] [\t wn_senses]   (mappings/: 5 fields, mwsd_mappings/: 4 fields)
+lemma map       i_id \t lemma_pos \t bn_syns                 (mwsd_mappings/*_lemma_bnsyn_mapping.txt)
+gold key        i_id sense [sense ...]                       (gold_keys/, mwsd_gold_keys/)
+sense index     sense_key synset_offset sense_number tag_cnt (WordNet index.sense)
+
+Any of them may be stored compressed (gzip, xz, bz2, or zstd with the zstandard package), as the plain path plus
+.gz / .xz / .bz2 / .zst: paths stay the uncompressed names, resolve_path() finds the file actually stored,
+and iter_lines() decodes it line by line as it reads (the compression is recognized by its magic bytes).
+'''
+
+COMPRESSED_SUFFIXES = [".gz", ".xz", ".bz2", ".zst"]
+
+MAGIC_BYTES = [(b"\x1f\x8b", "gz"), (b"\xfd7zXZ\x00", "xz"), (b"BZh", "bz2"), (b"\x28\xb5\x2f\xfd", "zst")]
+
+MISSING_SCORE = float("nan") # monosemous / backoff predictions come without a score
+
+POS_OF_SS_TYPE = {"1": "n", "2": "v", "3": "a", "4": "r", "5": "a"} # WordNet sense key ss_type -> pos
+
+
+def resolve_path(file_path):
+
+    # the file stored for a path: the path itself, or else its first compressed variant that exists
+    if os.path.exists(file_path):
+        return file_path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(file_path + suffix):
+            return file_path + suffix
+
+    return file_path
+
+
+def logical_path(file_path):
+
+    # the uncompressed name of a path (without .gz, .xz, .bz2, .zst)
+    for suffix in COMPRESSED_SUFFIXES:
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)]
+
+    return file_path
+
+
+def glob_sources(pattern):
+
+    # sorted uncompressed names of the files matching pattern, stored plain or compressed
+    paths = glob.glob(pattern)
+    for suffix in COMPRESSED_SUFFIXES:
+        paths.extend(glob.glob(pattern + suffix))
+
+    return sorted(set(logical_path(path) for path in paths))
+
+
+def compression_of(head):
+
+    # "gz", "xz", "bz2", "zst" or None from the first bytes of a file
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+
+    return None
+
+
+def file_compression(file_path):
+
+    with open(resolve_path(file_path), "rb") as f:
+        return compression_of(f.read(6))
+
+
+def decompressed(f, compression, name=""):
+
+    # binary stream of the decompressed content of the binary stream f
+    if compression == "gz":
+        return gzip.GzipFile(fileobj=f)
+    if compression == "xz":
+        return lzma.LZMAFile(f)
+    if compression == "bz2":
+        return bz2.BZ2File(f)
+    if compression == "zst":
+        if zstandard is None:
+            raise ValueError("reading zstd-compressed " + (name or "input") + " needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(f)
+
+    return f
+
+
+def suffix_compression(file_path):
+
+    # "gz", "xz", "bz2", "zst" or None from the name of a file to write (ALL.ims.soft.out.gz)
+    for suffix in COMPRESSED_SUFFIXES:
+        if file_path.endswith(suffix):
+            return suffix[1:]
+
+    return None
+
+
+def compressed(f, compression, name=""):
+
+    # binary stream compressing what is written to it into the binary stream f (closing it leaves f open)
+    if compression == "gz":
+        return gzip.GzipFile(filename="", mode="wb", fileobj=f, compresslevel=6, mtime=0) # the level of the gzip command
+    if compression == "xz":
+        return lzma.LZMAFile(f, "wb")
+    if compression == "bz2":
+        return bz2.BZ2File(f, "wb")
+    if compression == "zst":
+        if zstandard is None:
+            raise ValueError("writing zstd-compressed " + (name or "output") + " needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor().stream_writer(f, closefd=False)
+
+    return f
+
+
+def open_binary(file_path):
+
+    # binary stream of a file's content, decompressed while it is read
+    file_path = resolve_path(file_path)
+    f = open(file_path, "rb")
+    try:
+        compression = compression_of(f.peek(6)[:6])
+        return f if compression is None else ClosingStream(decompressed(f, compression, file_path), f)
+    except Exception:
+        f.close()
+        raise
+
+
+class ClosingStream(object):
+
+    # a decompressing stream that also closes the file under it
+    def __init__(self, stream, f):
+        self.stream = stream
+        self.f = f
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def close(self):
+        self.stream.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_lines(file_path):
+
+    file_path = resolve_path(file_path)
+    if file_compression(file_path) is None:
+        with codecs.open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+        return
+
+    with open_binary(file_path) as b:
+        for line in codecs.getreader("utf-8")(b):
+            yield line.rstrip("\n")
+
+
+def parse_ranked_line(line):
+
+    fields = line.split("\t")
+    senses = []
+    scores = []
+    for pair in fields[1:]:
+        sense_score = pair.split(" ")
+        senses.append(sense_score[0])
+        if len(sense_score) > 1:
+            scores.append(float(sense_score[1]))
+        else:
+            scores.append(MISSING_SCORE)
+
+    return fields[0], senses, scores
+
+
+def parse_mapping_line(line, n_fields):
+
+    # candidates is None when the line carries no constraint
+    # (no sense trans mapping, babel senses only, or MONOSEMOUS)
+    fields = line.split("\t")
+    i_id = fields[0]
+    target_lemma_pos = fields[1]
+
+    if len(fields) != n_fields or fields[2] == "MONOSEMOUS":
+        return i_id, target_lemma_pos, None
+
+    return i_id, target_lemma_pos, fields[n_fields - 1].split(" ")
+
+
+def parse_lemma_line(line):
+
+    fields = line.split("\t")
+    return fields[0], fields[1]
+
+
+def parse_gold_line(line):
+
+    fields = line.split(" ")
+    return fields[0], fields[1:]
+
+
+def is_sense_key(sense):
+
+    # WordNet sense key form: lemma%ss_type:... with a known ss_type (what sense_lemma_pos can read)
+    lemma, sep, lex_sense = sense.partition("%")
+    return bool(lemma) and bool(sep) and lex_sense[:1] in POS_OF_SS_TYPE
+
+
+def sense_lemma_pos(sense_key):
+
+    # "lemma pos" of a WordNet sense key (lemma%ss_type:...)
+    lemma, lex_sense = sense_key.split("%", 1)
+    return lemma + " " + POS_OF_SS_TYPE[lex_sense[0]]
+
+
+def parse_sense_index_line(line):
+
+    # (sense_key, lemma_pos, tag count)
+    fields = line.rstrip("\r").split(" ")
+    return fields[0], sense_lemma_pos(fields[0]), int(fields[-1])
@@ -0,0 +1,200 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+from decimal import Decimal, ROUND_HALF_UP
+import os
+import subprocess
+import sys
+import tempfile
+
+from t4wsd import bundle
+from t4wsd.cache import cached_score_counts
+from t4wsd.readers import suffix_compression
+
+'''
+# In-process scorer
+
+Precision / recall / F1 computed the way Scorer.java (WSD Unified Framework) does, from in-memory predictions:
+
+    ok, notok   summed over the answered instances; an instance with n distinct answer senses adds (hits / n, misses / n)
+    P = ok / (ok + notok),  R = ok / |gold|,  F1 = 2PR / (P + R)
+
+(ok, notok, |gold|) are kept as score counts: the counts of disjoint parts of a data set (e.g. shards split by
+document) add up to the counts of the whole, so scores can be merged without the predictions (merge_counts).
+    printed as "P=\t%.1f%%" etc. (Java rounds half up on the shortest decimal form of the double)
+
+Like Scorer.java, keys and answers are sets per instance: the senses of repeated lines of one id are united, and a
+repeated sense counts once.
+
+Gold keys are read through the compiled bundle and kept in memory, so every key file is loaded once per process.
+`java Scorer` stays available (run_java_scorer) to cross-check the numbers.
+'''
+
+_GOLD_CACHE = {}
+
+
+class ScorerError(Exception):
+
+    # raised for answers Scorer.java refuses (the message is the one it prints)
+    pass
+
+
+def load_key(key_file):
+
+    # {i_id: set of gold senses}; the senses of a repeated id are united
+    if key_file not in _GOLD_CACHE:
+        _GOLD_CACHE[key_file] = bundle.gold_dict(bundle.load_gold(key_file))
+
+    return _GOLD_CACHE[key_file]
+
+
+def iter_predictions(predictions):
+
+    # (i_id, [senses]) from a {i_id: sense(s)} dict or an iterable of (i_id, sense(s)) pairs
+    if hasattr(predictions, "items"):
+        predictions = predictions.items()
+    for i_id, senses in predictions:
+        if isinstance(senses, str):
+            senses = [senses]
+        yield i_id, senses
+
+
+def score_counts(gold, predictions):
+
+    # (ok, notok, number of gold instances) as Scorer.java sums them, over the set of answer senses of each id
+    answers = {}
+    for i_id, senses in iter_predictions(predictions):
+        if i_id not in gold:
+            raise ScorerError("Sense key '" + i_id + "' not present in the gold standard file.")
+        answers.setdefault(i_id, set()).update(senses)
+
+    ok = 0.0
+    notok = 0.0
+    for i_id, senses in answers.items():
+        gold_senses = gold[i_id]
+        local_ok = sum(1 for sense in senses if sense in gold_senses)
+        local_notok = len(senses) - local_ok
+        ok += divide(local_ok, len(senses))
+        notok += divide(local_notok, len(senses))
+
+    return ok, notok, len(gold)
+
+
+def scores_from_counts(ok, notok, n_gold):
+
+    # (P, R, F1) of score counts
+    precision = divide(ok, ok + notok)
+    recall = divide(ok, n_gold)
+    f1 = divide(2 * precision * recall, precision + recall)
+
+    return precision, recall, f1
+
+
+def merge_counts(counts_list):
+
+    # score counts of the union of disjoint parts
+    ok = 0.0
+    notok = 0.0
+    n_gold = 0
+    for counts in counts_list:
+        ok += counts[0]
+        notok += counts[1]
+        n_gold += counts[2]
+
+    return ok, notok, n_gold
+
+
+def score(gold, predictions):
+
+    # (P, R, F1) as Scorer.java computes them
+    return scores_from_counts(*score_counts(gold, predictions))
+
+
+def divide(x, y):
+
+    # Java double division: 0 / 0 is NaN
+    if y == 0:
+        return float("nan") if x == 0 or x != x else float("inf") * x
+    return float(x) / y
+
+
+def java_percent(x):
+
+    # String.format("%.1f", x * 100)
+    x = x * 100
+    if x != x:
+        return "NaN"
+    if x in (float("inf"), float("-inf")):
+        return "Infinity" if x > 0 else "-Infinity"
+
+    return str(Decimal(repr(x)).quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
+
+
+def format_scores(precision, recall, f1):
+
+    return "P=\t" + java_percent(precision) + "%\n" + "R=\t" + java_percent(recall) + "%\n" + "F1=\t" + java_percent(f1) + "%"
+
+
+def evaluate(key_file, predictions):
+
+    # the text Scorer.java prints for these predictions
+    try:
+        return format_scores(*score(load_key(key_file), predictions))
+    except ScorerError as e:
+        return str(e)
+
+
+def run_java_scorer(key_file, out_path=None, predictions=None):
+
+    # `java Scorer key system`; predictions are written to a private temporary file when no output file exists
+    # or the output file is compressed (Scorer.java reads plain text)
+    tmp_path = None
+    if out_path is None or suffix_compression(out_path):
+        fd, tmp_path = tempfile.mkstemp(suffix=".out")
+        os.close(fd)
+        with codecs.open(tmp_path, "w", encoding="utf-8") as f:
+            for i_id, senses in iter_predictions(predictions):
+                f.write(i_id + " " + " ".join(senses) + "\n")
+        out_path = tmp_path
+
+    try:
+        b_out = subprocess.check_output(["java", "Scorer", key_file, out_path])
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+    return b_out.decode().rstrip("\r\n")
+
+
+def report(key_file, predictions, out_path=None, java_scorer=False, cache=None):
+
+    # print the scores and return their counts (None when Scorer.java refuses the answers);
+    # with java_scorer, print Scorer.java's output and warn when the two disagree
+    # (cache: a StageCache the in-process counts are reused from)
+    try:
+        if cache is not None:
+            counts = cached_score_counts(cache, key_file, predictions, lambda: score_counts(load_key(key_file), predictions))
+        else:
+            counts = score_counts(load_key(key_file), predictions)
+        s_out = format_scores(*scores_from_counts(*counts))
+    except ScorerError as e:
+        counts = None
+        s_out = str(e)
+    if java_scorer:
+        java_out = run_java_scorer(key_file, out_path, predictions)
+        if java_out.replace("\r\n", "\n") != s_out:
+            sys.stderr.write("warning: in-process scores differ from Scorer.java:\n" + s_out + "\n")
+        s_out = java_out
+
+    print(s_out)
+
+    return counts
+
+
+def counts_dict(counts):
+
+    # score counts as stored in <out>.stats.json
+    if counts is None:
+        return None
+
+    return {"ok": counts[0], "notok": counts[1], "gold": counts[2]}
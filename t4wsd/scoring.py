@@ -0,0 +1,377 @@
+#-*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+
+from t4wsd.constraints import SENSE_VOCAB
+
+'''
+# Batch scoring engine
+
+All (instance, candidate sense) pairs of a base output are flattened into arrays, in rank order:
+
+    offsets[i]:offsets[i + 1]   pairs of instance i
+    sense_ids[p], p_wsd[p]      sense (shared vocab id) and base WSD score of pair p
+
+SoftConstraint combines the experts in log space,
+
+    score = a * log p_wsd + b * log p_trans + c * log p_freq
+
+and takes the first maximum per instance (the same sense a stable descending sort puts first).
+Instances whose best scores are too close to call in floating point (or whose product would under/overflow)
+are re-decided with the exact pow() product the reference implementation uses, so decisions are identical.
+'''
+
+TIE_TOLERANCE = 1e-7 # in log space; far above the rounding error of either formulation
+LOG_UNDERFLOW = -700.0 # exp() of anything below is subnormal
+MAX_LANGUAGES = 64 # bits of a language membership mask
+
+
+class Batch(object):
+
+    def __init__(self, ids, offsets, sense_ids, p_wsd, vocab=None):
+        self.ids = ids
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.sense_ids = np.asarray(sense_ids, dtype=np.int32)
+        self.p_wsd = np.asarray(p_wsd, dtype=np.float64)
+        self.vocab = vocab if vocab is not None else SENSE_VOCAB
+        self.lengths = np.diff(self.offsets)
+        self.starts = self.offsets[:-1]
+        self.fingerprint = None # content hash, set by the stage cache
+        self.instance_of_pair = np.repeat(np.arange(len(ids), dtype=np.int64), self.lengths)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sense(self, pair):
+        return self.vocab[self.sense_ids[pair]]
+
+    def items(self):
+        # (i_id, [[sense, score], ...]) per instance, like the items of the {i_id: ranked senses} dict it replaces
+        sense_ids = self.sense_ids.tolist()
+        p_wsd = self.p_wsd.tolist()
+        offsets = self.offsets.tolist()
+        for i, i_id in enumerate(self.ids):
+            ranked_sense_scores = []
+            for pair in range(offsets[i], offsets[i + 1]):
+                if p_wsd[pair] != p_wsd[pair]: # NaN: no score
+                    ranked_sense_scores.append([self.vocab[sense_ids[pair]]])
+                else:
+                    ranked_sense_scores.append([self.vocab[sense_ids[pair]], p_wsd[pair]])
+            yield i_id, ranked_sense_scores
+
+
+def flatten(base, vocab=None):
+
+    # {i_id: [[sense, score], ...]} -> Batch
+    if vocab is None:
+        vocab = SENSE_VOCAB
+
+    ids = []
+    offsets = [0]
+    sense_ids = []
+    p_wsd = []
+    for i_id, ranked_sense_scores in base.items():
+        ids.append(i_id)
+        for sense_score in ranked_sense_scores:
+            sense_ids.append(vocab.intern(sense_score[0]))
+            p_wsd.append(float(sense_score[1]) if len(sense_score) > 1 else math.nan)
+        offsets.append(len(sense_ids))
+
+    return Batch(ids, offsets, sense_ids, p_wsd, vocab)
+
+
+def ranked_batch(tables, select=None, vocab=None, rows=None):
+
+    # Batch of compiled ranked outputs (bundle.load_ranked), read column-wise without a Python object per sense;
+    # select(i_id) -> id the instance is kept under, or None to leave it out; rows: the rows read from each table
+    # (None: all), e.g. the partition of one data set, so the senses of the other rows are never touched.
+    # Like a {i_id: ranked senses} dict filled line by line, a repeated id keeps its first position and its last senses
+    if vocab is None:
+        vocab = SENSE_VOCAB
+    if rows is None:
+        rows = [None] * len(tables)
+
+    ids = []
+    position = {}
+    entries = [] # (global start, length) of the senses of every instance
+    bases = []
+    base = 0
+    for table, table_rows in zip(tables, rows):
+        offsets = np.asarray(table.offsets)
+        if table_rows is None:
+            table_rows = range(len(table))
+            table_ids = table.ids.tolist()
+        else:
+            table_ids = table.ids.take(table_rows)
+        for row, i_id in zip(table_rows, table_ids):
+            if select is not None:
+                i_id = select(i_id)
+                if i_id is None:
+                    continue
+            entry = (base + int(offsets[row]), int(offsets[row + 1] - offsets[row]))
+            if i_id in position:
+                entries[position[i_id]] = entry
+            else:
+                position[i_id] = len(entries)
+                entries.append(entry)
+                ids.append(i_id)
+        bases.append(base)
+        base += len(table.senses)
+
+    starts = np.array([start for start, _ in entries], dtype=np.int64)
+    lengths = np.array([length for _, length in entries], dtype=np.int64)
+    batch_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    pairs = np.repeat(starts - batch_offsets[:-1], lengths) + np.arange(batch_offsets[-1])
+
+    # gather only the senses and scores of the kept instances from each table
+    all_sense_ids = np.zeros(len(pairs), dtype=np.int32)
+    all_p_wsd = np.zeros(len(pairs), dtype=np.float64)
+    for table, table_base in zip(tables, bases):
+        local = vocab.remap(table.vocab.tolist()) if len(table.vocab) else np.zeros(0, dtype=np.int32)
+        inside = (pairs >= table_base) & (pairs < table_base + len(table.senses))
+        positions = pairs[inside] - table_base
+        all_sense_ids[inside] = local[np.asarray(table.senses)[positions]]
+        all_p_wsd[inside] = np.asarray(table.scores)[positions]
+
+    return Batch(ids, batch_offsets, all_sense_ids, all_p_wsd, vocab)
+
+
+def segment_sum(values, offsets):
+
+    # per-segment sums accumulated left to right (bit-identical to a Python loop, unlike reduceat)
+    lengths = np.diff(offsets)
+    sums = np.zeros(len(lengths), dtype=np.float64)
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        alive = lengths > k
+        sums[alive] += values[offsets[:-1][alive] + k]
+
+    return sums
+
+
+def segment_first(mask, offsets):
+
+    # position (within the segment) of the first True of each segment, -1 if none
+    n_pairs = len(mask)
+    pos = np.where(mask, np.arange(n_pairs), n_pairs)
+    first = np.full(len(offsets) - 1, n_pairs, dtype=np.int64)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        first[nonempty] = np.minimum.reduceat(pos, offsets[:-1][nonempty])
+
+    return np.where(first < n_pairs, first - offsets[:-1], -1)
+
+
+def instance_rows(batch, index):
+
+    # row of every batch instance in a constraint index (-1 when absent)
+    return np.array([index.row(i_id) for i_id in batch.ids], dtype=np.int64)
+
+
+def count(counters, name, n):
+
+    # add n to a counter of the instrumentation (no-op without counters)
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + int(n)
+
+
+def pair_membership(batch, index):
+
+    # (is the sense of each pair a candidate, candidate-set size of each pair's instance)
+    rows = instance_rows(batch, index)
+    sizes = index.sizes(rows)
+    in_lang = index.contains_pairs(rows[batch.instance_of_pair], batch.sense_ids)
+
+    return in_lang, sizes
+
+
+def language_masks(batch, indexes, counters=None):
+
+    # per pair: bit k set when its sense is a candidate of language k; per language: candidate-set size of each instance
+    # (a language can be None, i.e. absent: no bit, size 0)
+    # counters: no_constraint.<k> = instances language k leaves unconstrained (missing, NONE or absent language)
+    if len(indexes) > MAX_LANGUAGES:
+        raise ValueError("at most " + str(MAX_LANGUAGES) + " languages, got " + str(len(indexes)))
+
+    masks = np.zeros(len(batch.sense_ids), dtype=np.uint64)
+    sizes = np.zeros((len(indexes), len(batch)), dtype=np.int64)
+    for k, index in enumerate(indexes):
+        if index is None:
+            continue
+        in_lang, sizes[k] = pair_membership(batch, index)
+        masks |= in_lang.astype(np.uint64) << np.uint64(k)
+
+    if counters is not None:
+        for k in range(len(indexes)):
+            count(counters, "no_constraint." + str(k), np.count_nonzero(sizes[k] == 0))
+
+    return masks, sizes
+
+
+def mask_bits(masks, n_languages):
+
+    # [n_languages, pairs] 0/1 matrix of the bitmasks
+    shifts = np.arange(n_languages, dtype=np.uint64)[:, None]
+    return ((masks[None, :] >> shifts) & np.uint64(1)).astype(np.float64)
+
+
+def get_p_trans(batch, indexes, smoothing, zero_sum_one=False, counters=None, masks=None):
+
+    # smoothed p_trans of every pair, and whether any language constrains each instance, in one pass over the pairs:
+    #   weight(sense) = sum over languages whose candidates include the sense of 1 / |candidates|
+    #   p_trans(sense) = (weight(sense) + smoothing) / (n_senses * smoothing + sum of the weights of the instance)
+    # zero_sum_one: p_trans = 1 for instances none of whose senses is a candidate (multilingual variant)
+    # counters: unconstrained instances, and constrained instances none of whose senses is a candidate (no_candidate_sense)
+    # masks: (masks, sizes) of language_masks, when already computed
+    masks, sizes = masks if masks is not None else language_masks(batch, indexes, counters)
+    constrained = (sizes > 0).any(axis=0)
+    inv_sizes = np.divide(1.0, sizes, out=np.zeros(sizes.shape), where=sizes > 0)
+    # rows are added in language order, so the sums match adding the languages one by one
+    weights = (mask_bits(masks, len(indexes)) * inv_sizes[:, batch.instance_of_pair]).sum(axis=0) if len(indexes) else np.zeros(len(masks))
+
+    all_sum = segment_sum(weights, batch.offsets)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = (batch.lengths * smoothing) + all_sum
+        p_trans = (weights + smoothing) / denominator[batch.instance_of_pair]
+    if zero_sum_one:
+        p_trans[(all_sum == 0.0)[batch.instance_of_pair]] = 1.0
+
+    if counters is not None:
+        count(counters, "unconstrained", np.count_nonzero(~constrained))
+        count(counters, "no_candidate_sense", np.count_nonzero(constrained & (all_sum == 0.0)))
+
+    return p_trans, constrained
+
+
+def log_expert(p, exponent):
+
+    # exponent * log p, with p^0 = 1 even for p = 0
+    if not exponent:
+        return np.zeros(len(p), dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        return exponent * np.log(p)
+
+
+def combine(p_wsd, p_trans, p_freq, a, b, c):
+
+    # log p(sense) = a * log p_wsd + b * log p_trans (+ c * log p_freq)
+    scores = log_expert(p_wsd, a) + log_expert(p_trans, b)
+    if c:
+        scores = scores + log_expert(p_freq, c)
+
+    return scores
+
+
+def exact_product(p_wsd, p_trans, p_freq, a, b, c):
+
+    # the reference p_wsd^a * p_trans^b (* p_freq^c), evaluated with Python floats
+    if c:
+        return pow(p_wsd, a) * pow(p_trans, b) * pow(p_freq, c)
+    return pow(p_wsd, a) * pow(p_trans, b)
+
+
+def segment_argmax(scores, offsets, exact=None, counters=None):
+
+    # first maximum (in rank order) of every segment; exact(pair) -> score used to settle near ties
+    # counters: exact_redecisions = segments settled with exact()
+    n_segments = len(offsets) - 1
+    lengths = np.diff(offsets)
+    best = np.zeros(n_segments, dtype=np.int64)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return best
+
+    starts = offsets[:-1][nonempty]
+    seg_max = np.full(n_segments, -np.inf)
+    seg_max[nonempty] = np.maximum.reduceat(scores, starts)
+    pair_max = np.repeat(seg_max, lengths)
+    best = np.maximum(segment_first(scores == pair_max, offsets), 0)
+
+    if exact is None:
+        return best
+
+    with np.errstate(invalid="ignore"):
+        close = scores >= pair_max - TIE_TOLERANCE
+    n_close = np.zeros(n_segments, dtype=np.int64)
+    n_close[nonempty] = np.add.reduceat(close.astype(np.int64), starts)
+    unsure = (n_close > 1) | ~(np.abs(seg_max) < -LOG_UNDERFLOW) # near ties, under/overflow, NaN
+    unsure = np.flatnonzero(unsure & nonempty)
+    count(counters, "exact_redecisions", len(unsure))
+    for i in unsure:
+        start = offsets[i]
+        best_k = 0
+        best_score = exact(start)
+        for k in range(1, lengths[i]):
+            score = exact(start + k)
+            if score > best_score:
+                best_k = k
+                best_score = score
+        best[i] = best_k
+
+    return best
+
+
+def soft_decisions(batch, indexes, p_freq, a, b, c, smoothing, zero_sum_one=False, counters=None, masks=None):
+
+    # index (within its instance) of the SoftConstraint answer of every instance
+    # counters: instances, monosemous ones, and instances whose answer is not the top sense (changed)
+    p_trans, constrained = get_p_trans(batch, indexes, smoothing, zero_sum_one, counters, masks)
+    if not c:
+        p_freq = None
+    scores = combine(batch.p_wsd, p_trans, p_freq, a, b, c)
+
+    p_wsd_list = batch.p_wsd.tolist()
+    p_trans_list = p_trans.tolist()
+    p_freq_list = p_freq.tolist() if p_freq is not None else None
+    def exact(pair):
+        return exact_product(p_wsd_list[pair], p_trans_list[pair], p_freq_list[pair] if p_freq_list is not None else None, a, b, c)
+
+    best = segment_argmax(scores, batch.offsets, exact, counters)
+
+    # monosemous instances (single prediction) and instances without any constraint keep the top sense
+    keep_top = (batch.lengths == 1) | ~constrained
+    best[keep_top] = 0
+
+    if counters is not None:
+        count_decisions(counters, batch, best)
+
+    return best
+
+
+def hard_decisions(batch, indexes, counters=None, masks=None):
+
+    # index (within its instance) of the HardConstraint answer: first sense in rank order that is a candidate
+    # in every language (the N-way intersection); no such sense, or no constraint, keeps the top sense
+    # counters: as soft_decisions, and polysemous instances whose intersection is empty (empty_intersection)
+    masks, sizes = masks if masks is not None else language_masks(batch, indexes, counters)
+    in_all = masks == np.uint64((1 << len(indexes)) - 1)
+    first = segment_first(in_all, batch.offsets)
+
+    best = np.maximum(first, 0)
+    best[batch.lengths == 1] = 0
+
+    if counters is not None:
+        count(counters, "unconstrained", np.count_nonzero(~(sizes > 0).any(axis=0)))
+        count(counters, "empty_intersection", np.count_nonzero((first < 0) & (batch.lengths > 1)))
+        count_decisions(counters, batch, best)
+
+    return best
+
+
+def count_decisions(counters, batch, best):
+
+    count(counters, "instances", len(batch))
+    count(counters, "monosemous", np.count_nonzero(batch.lengths == 1))
+    count(counters, "changed", np.count_nonzero(best > 0))
+
+
+def answers(batch, best):
+
+    # (i_id, answer sense) in batch order; an instance without ranked senses has no answer
+    pairs = (batch.starts + best).tolist()
+    lengths = batch.lengths.tolist()
+    sense_ids = batch.sense_ids.tolist()
+    vocab = batch.vocab
+
+    return [(i_id, vocab[sense_ids[pair]]) for i_id, pair, length in zip(batch.ids, pairs, lengths) if length]
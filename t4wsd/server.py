@@ -0,0 +1,378 @@
+#-*- coding: utf-8 -*-
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.readers import parse_ranked_line
+from t4wsd.scoring import Batch, soft_decisions, answers
+from t4wsd.vocab import Vocab
+
+'''
+# SoftConstraint service
+
+Constraints (and p_freq) are loaded once; requests are answered over HTTP, on a TCP port or a Unix socket.
+
+    POST /disambiguate   {"instances": [instance, ...]} -> {"answers": [{"id": ..., "sense": ...}, ...]}
+                         (a single instance object gets a single answer object back)
+    GET  /stats          request / instance / batch counters, p50 / p99 latency, throughput
+
+    instance             {"id": i_id,                                   (optional if candidates are given)
+                          "senses": [[sense, score], ..., [sense]],     (ranked, as in the base outputs;
+                          "line": "i_id\tsense score\t...",              or one line of a ranked output)
+                          "candidates": {lang: [sense, ...], ...}}      (optional, or a list in language order)
+
+A language without candidates in the request falls back to the loaded mapping of the instance id.
+Requests arriving together are micro-batched: the batcher thread waits up to max_wait for up to max_batch
+instances and scores them all in one vectorized pass.
+'''
+
+LATENCY_WINDOW = 10000 # latencies kept for the percentiles
+
+
+class RequestError(ValueError):
+    pass
+
+
+def parse_instance(obj, is_sense=None):
+
+    # request instance -> {"id", "senses", "scores", "candidates"}; is_sense(sense) -> whether the model knows the form
+    # of a sense (e.g. a WordNet sense key), None: any string
+    if not isinstance(obj, dict):
+        raise RequestError("an instance must be a JSON object")
+
+    if "line" in obj:
+        if not isinstance(obj["line"], str):
+            raise RequestError("line must be a string")
+        i_id, senses, scores = parse_ranked_line(obj["line"].rstrip("\n"))
+    else:
+        i_id = obj.get("id")
+        senses = []
+        scores = []
+        sense_scores = obj.get("senses") or []
+        if not isinstance(sense_scores, list):
+            raise RequestError("senses must be a list")
+        for sense_score in sense_scores:
+            if isinstance(sense_score, str):
+                sense_score = [sense_score]
+            if not isinstance(sense_score, list) or not sense_score or not isinstance(sense_score[0], str):
+                raise RequestError("a ranked sense must be a sense string or a [sense, score] list")
+            if len(sense_score) > 1 and (isinstance(sense_score[1], bool) or not isinstance(sense_score[1], (int, float))):
+                raise RequestError("a sense score must be a number")
+            senses.append(sense_score[0])
+            scores.append(float(sense_score[1]) if len(sense_score) > 1 else float("nan"))
+    if not senses:
+        raise RequestError("an instance needs ranked senses")
+    if is_sense is not None:
+        for sense in senses:
+            if not is_sense(sense):
+                raise RequestError("not a sense of this model: " + sense)
+
+    i_id = obj.get("id", i_id)
+    if i_id is not None and not isinstance(i_id, str):
+        raise RequestError("id must be a string")
+
+    candidates = obj.get("candidates")
+    if isinstance(candidates, dict):
+        lists = list(candidates.values())
+    elif isinstance(candidates, list):
+        lists = candidates
+    elif candidates is None:
+        lists = []
+    else:
+        raise RequestError("candidates must be an object or a list")
+    for given in lists:
+        if given is not None and not (isinstance(given, list) and all(isinstance(c, str) for c in given)):
+            raise RequestError("the candidates of a language must be a list of sense strings")
+
+    return {"id": i_id, "senses": senses, "scores": scores, "candidates": candidates}
+
+
+class SoftModel(object):
+
+    # pair_p_freq(batch, i_ids) -> per-pair p_freq; names[k] labels indexes[k] in request candidates;
+    # is_sense: check of the ranked senses of a request (see parse_instance)
+    def __init__(self, names, indexes, a, b, c, smoothing, pair_p_freq=None, zero_sum_one=False, is_sense=None):
+        self.names = names
+        self.indexes = indexes
+        self.a = a
+        self.b = b
+        self.c = c
+        self.smoothing = smoothing
+        self.pair_p_freq = pair_p_freq
+        self.zero_sum_one = zero_sum_one
+        self.is_sense = is_sense
+
+    def request_index(self, k, instances, rows, vocab):
+
+        # constraint index of language k over the batch (rows are the batch instance ids, vocab the batch vocab)
+        name = self.names[k]
+        loaded = self.indexes[k]
+        constrained = []
+        offsets = [0]
+        candidates = []
+        for instance in instances:
+            given = instance["candidates"]
+            if isinstance(given, dict):
+                given = given.get(name)
+            elif isinstance(given, list):
+                given = given[k] if k < len(given) else None
+
+            if given is not None:
+                constrained.append(True)
+                candidates.extend(vocab.intern(c) for c in given)
+            else:
+                row = loaded.row(instance["id"]) if loaded is not None else -1
+                has_constraint = loaded is not None and loaded.has_constraint(row)
+                constrained.append(has_constraint)
+                if has_constraint:
+                    candidates.extend(vocab.intern(c) for c in loaded.candidate_strings(row))
+            offsets.append(len(candidates))
+
+        return ConstraintIndex.from_csr(rows, [None] * len(rows), constrained, offsets, np.array(candidates, dtype=np.int32), vocab)
+
+    def decide(self, instances):
+
+        # SoftConstraint answer of every instance, in one pass
+        # (instances are numbered within the batch, so the same id may come from several requests;
+        # senses are interned in a vocab of the batch, so client strings never reach the shared one)
+        vocab = Vocab()
+        rows = [str(k) for k in range(len(instances))]
+        offsets = [0]
+        sense_ids = []
+        p_wsd = []
+        for instance in instances:
+            sense_ids.extend(vocab.intern(s) for s in instance["senses"])
+            p_wsd.extend(instance["scores"])
+            offsets.append(len(sense_ids))
+        batch = Batch(rows, offsets, sense_ids, p_wsd, vocab)
+
+        indexes = [self.request_index(k, instances, rows, vocab) for k in range(len(self.indexes))]
+        if self.c and self.pair_p_freq is not None:
+            p_freq = self.pair_p_freq(batch, [instance["id"] for instance in instances])
+        else:
+            p_freq = None
+        best = soft_decisions(batch, indexes, p_freq, self.a, self.b, self.c, self.smoothing, self.zero_sum_one)
+
+        return [sense for _, sense in answers(batch, best)]
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.instances = 0
+        self.batches = 0
+        self.batch_instances = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record_request(self, latency, n_instances):
+        with self.lock:
+            self.requests += 1
+            self.instances += n_instances
+            self.latencies.append(latency)
+
+    def record_batch(self, n_instances):
+        with self.lock:
+            self.batches += 1
+            self.batch_instances += n_instances
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            latencies = np.array(self.latencies) * 1000.0
+            return {"uptime_s": elapsed,
+                    "requests": self.requests,
+                    "instances": self.instances,
+                    "errors": self.errors,
+                    "batches": self.batches,
+                    "mean_batch_instances": self.batch_instances / self.batches if self.batches else 0.0,
+                    "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                    "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+                    "requests_per_s": self.requests / elapsed,
+                    "instances_per_s": self.instances / elapsed}
+
+
+class MicroBatcher(object):
+
+    def __init__(self, decide, max_batch=512, max_wait=0.002, stats=None):
+        self.decide = decide
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, instances):
+
+        # blocks until the batch holding these instances is scored
+        job = {"instances": instances, "done": threading.Event(), "result": None, "error": None}
+        self.queue.put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+
+        return job["result"]
+
+    def _collect(self):
+
+        jobs = [self.queue.get()]
+        n_instances = len(jobs[0]["instances"])
+        deadline = time.time() + self.max_wait
+        while n_instances < self.max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            n_instances += len(job["instances"])
+
+        return jobs
+
+    def _run(self):
+
+        while True:
+            jobs = self._collect()
+            self._score(jobs)
+
+    def _score(self, jobs):
+
+        instances = [instance for job in jobs for instance in job["instances"]]
+        try:
+            senses = self.decide(instances)
+        except Exception as e:
+            if len(jobs) > 1: # score one by one so a bad request fails alone
+                for job in jobs:
+                    self._score([job])
+                return
+            jobs[0]["error"] = e
+            jobs[0]["done"].set()
+            return
+
+        if self.stats is not None:
+            self.stats.record_batch(len(instances))
+        start = 0
+        for job in jobs:
+            job["result"] = senses[start:start + len(job["instances"])]
+            start += len(job["instances"])
+            job["done"].set()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.server.stats.snapshot())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        start = time.time()
+        if self.path.rstrip("/") != "/disambiguate":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            single = not (isinstance(body, dict) and "instances" in body)
+            objs = [body] if single else body["instances"]
+            if not isinstance(objs, list):
+                raise RequestError("instances must be a list")
+            instances = [parse_instance(obj, self.server.is_sense) for obj in objs]
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            self.server.stats.record_error()
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            senses = self.server.batcher.submit(instances) if instances else []
+        except Exception as e:
+            self.server.stats.record_error()
+            self.send_json(500, {"error": str(e)})
+            return
+
+        results = [{"id": instance["id"], "sense": sense} for instance, sense in zip(instances, senses)]
+        self.server.stats.record_request(time.time() - start, len(instances))
+        self.send_json(200, results[0] if single else {"answers": results})
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(model, host="127.0.0.1", port=8000, socket_path="", max_batch=512, max_wait=0.002):
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+
+    server.stats = Stats()
+    server.is_sense = model.is_sense
+    server.batcher = MicroBatcher(model.decide, max_batch, max_wait, server.stats)
+
+    return server
+
+
+def serve(model, args):
+
+    server = make_server(model, args.host, args.port, args.socket, args.max_batch, args.max_wait_ms / 1000.0)
+    where = args.socket if args.socket else "http://" + args.host + ":" + str(server.server_address[1])
+    sys.stderr.write("serving on " + where + "\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+def add_server_arguments(parser):
+
+    parser.add_argument("--host", default="127.0.0.1", help="host for -m serve (default: 127.0.0.1)")
+    parser.add_argument("--port", default=8000, type=int, help="port for -m serve (default: 8000)")
+    parser.add_argument("--socket", default="", help="Unix socket path for -m serve, instead of host/port")
+    parser.add_argument("--max-batch", default=512, type=int, help="instances scored per batch by -m serve (default: 512)")
+    parser.add_argument("--max-wait-ms", default=2.0, type=float, help="time -m serve waits to fill a batch (default: 2.0)")
@@ -0,0 +1,201 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+import json
+import os
+import subprocess
+import sys
+import zlib
+
+from t4wsd import bundle
+from t4wsd.output import AtomicWriter
+from t4wsd.readers import iter_lines, logical_path, COMPRESSED_SUFFIXES
+from t4wsd.scorer import merge_counts
+
+'''
+# Sharded runs
+
+A corpus too large for one machine is split by document (senseval2.d000, d001, ...) into N shards, each a directory
+laid out like this repository, so translations4wsd.py / translations4wsd_mwsd.py run on a shard unchanged:
+
+    <shard dir>/shard-<k>/base_outputs/..., mappings/..., gold_keys/..., mwsd_*/...   the instances of shard k
+    <shard dir>/shard-<k>/index.sense, clubert_v1.0                                  linked, every shard reads them whole
+    <shard dir>/shards.json                                                          number of shards, source stamps
+
+Every instance goes to shard crc32(document) % N, the same in every file, so a shard holds whole documents with
+their base outputs, mappings and gold keys. Shards are independent (any machine, any order); each writes its output
+and <out>.stats.json, whose "score" counts (ok, notok, gold) add up to the counts of the whole corpus:
+
+    merge   outputs concatenated in shard order, counts and engine counters summed -> P / R / F1 of the corpus
+'''
+
+SHARED_FILES = ["index.sense", "clubert_v1.0"] # read whole by every shard (linked, not split)
+
+
+def document_of(i_id):
+
+    # senseval2.d000.s000.t000 -> senseval2.d000, d001.s002.t003 -> d001
+    return i_id.rsplit(".", 2)[0]
+
+
+def shard_of(document, n_shards):
+
+    return zlib.crc32(document.encode("utf-8")) % n_shards
+
+
+def shard_name(k):
+
+    return "shard-%04d" % k
+
+
+def id_prefix(file_path, kind):
+
+    # data set prefix a file leaves out of its ids (gold_keys/senseval2.gold.key.txt: "senseval2.")
+    name = os.path.basename(logical_path(file_path))
+    if kind == "gold" and os.path.basename(os.path.dirname(file_path)) == "gold_keys" and not name.startswith("ALL."):
+        return name.split(".")[0] + "."
+
+    return ""
+
+
+def source_stamps(src):
+
+    # {relative path: [mtime_ns, size]} of every file split into the shards
+    stamps = {}
+    for file_path, _, _ in bundle.iter_sources(src):
+        if os.path.basename(logical_path(file_path)) in SHARED_FILES:
+            continue
+        stat = os.stat(file_path)
+        stamps[os.path.relpath(file_path, src)] = [stat.st_mtime_ns, stat.st_size]
+
+    return stamps
+
+
+def split_file(file_path, kind, out_paths):
+
+    # every line of a source to the shard of its document; returns the number of lines of each shard
+    sep = " " if kind == "gold" else "\t"
+    prefix = id_prefix(file_path, kind)
+    counts = [0] * len(out_paths)
+    handles = []
+    for out_path in out_paths:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        handles.append(codecs.open(out_path, "w", encoding="utf-8"))
+    try:
+        for line in iter_lines(file_path):
+            if not line.strip():
+                continue
+            k = shard_of(document_of(prefix + line.split(sep, 1)[0]), len(out_paths))
+            handles[k].write(line + "\n")
+            counts[k] += 1
+    finally:
+        for newf in handles:
+            newf.close()
+
+    return counts
+
+
+def link_shared(src, shard_path):
+
+    # index.sense and clubert_v1.0 (plain or compressed) of the source repository, linked into a shard
+    for name in SHARED_FILES:
+        for suffix in [""] + COMPRESSED_SUFFIXES:
+            path = os.path.join(src, name + suffix)
+            link_path = os.path.join(shard_path, name + suffix)
+            if os.path.exists(path) and not os.path.lexists(link_path):
+                os.symlink(os.path.abspath(path), link_path)
+
+
+def split(src, shard_dir, n_shards):
+
+    # shard directories of the repository at src; kept when shards.json matches the sources and n_shards
+    stamps = source_stamps(src)
+    manifest_path = os.path.join(shard_dir, "shards.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["shards"] == n_shards and manifest["sources"] == stamps:
+            return shard_paths(shard_dir, n_shards)
+
+    paths = shard_paths(shard_dir, n_shards)
+    for shard_path in paths:
+        for sub_dir in ("outputs", "mwsd_outputs"):
+            os.makedirs(os.path.join(shard_path, sub_dir), exist_ok=True)
+        link_shared(src, shard_path)
+
+    instances = {}
+    for file_path, kind, _ in bundle.iter_sources(src):
+        rel_path = os.path.relpath(file_path, src)
+        if os.path.basename(logical_path(rel_path)) in SHARED_FILES:
+            continue
+        out_paths = [os.path.join(shard_path, logical_path(rel_path)) for shard_path in paths]
+        instances[logical_path(rel_path)] = split_file(file_path, kind, out_paths)
+
+    tmp_path = manifest_path + ".tmp-" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump({"shards": n_shards, "sources": stamps, "instances": instances}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+    return paths
+
+
+def shard_paths(shard_dir, n_shards):
+
+    return [os.path.join(shard_dir, shard_name(k)) for k in range(n_shards)]
+
+
+def shard_command(script_path, script_args):
+
+    # the command a worker runs in a shard directory
+    return [sys.executable, os.path.abspath(script_path)] + list(script_args)
+
+
+def run_shard(shard_path, command, log_path):
+
+    # run a shard's command in its directory (its own bundle/, even with $T4WSD_BUNDLE); returns the exit code
+    env = dict(os.environ)
+    env.pop("T4WSD_BUNDLE", None)
+    with open(log_path, "w") as log:
+        return subprocess.call(command, cwd=shard_path, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def load_stats(stats_path):
+
+    with open(stats_path) as f:
+        return json.load(f)
+
+
+def merge(out_paths, merged_path):
+
+    # concatenate the shard outputs (shard order, compressed like merged_path) and sum their score counts and counters;
+    # returns the merged stats (written to <merged>.stats.json), whose score is None when the scorer
+    # refused the answers of a shard (like an unsharded run)
+    shard_scores = []
+    counters = {}
+    with AtomicWriter(merged_path) as newf:
+        for out_path in out_paths:
+            for line in iter_lines(out_path):
+                if line:
+                    newf.write(line + "\n")
+
+            stats = load_stats(out_path + ".stats.json")
+            if "score" not in stats:
+                raise ValueError("no score counts in " + out_path + ".stats.json")
+            shard_scores.append(stats["score"])
+            for name, n in stats["counters"].items():
+                counters[name] = counters.get(name, 0) + n
+
+    if None in shard_scores:
+        score = None
+    else:
+        ok, notok, n_gold = merge_counts([(s["ok"], s["notok"], s["gold"]) for s in shard_scores])
+        score = {"ok": ok, "notok": notok, "gold": n_gold}
+    merged = {"shards": len(out_paths),
+              "score": score,
+              "shard_scores": shard_scores,
+              "counters": dict(sorted(counters.items()))}
+    with open(merged_path + ".stats.json", "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+        f.write("\n")
+
+    return merged
@@ -0,0 +1,217 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from t4wsd import bundle
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.readers import iter_lines, resolve_path, compression_of, decompressed, parse_ranked_line, parse_mapping_line, parse_lemma_line
+from t4wsd.scoring import Batch, hard_decisions, soft_decisions, answers
+from t4wsd.vocab import Vocab
+
+'''
+# Streaming reranking
+
+Ranked base-output lines (stdin or any line iterator) are merge-joined by instance id against mapping files
+sorted by id, and reranked in small batches, so memory does not grow with the corpus:
+
+    ranked lines (sorted by id) --+
+    mapping 1 (sorted by id)    --+--> merge_join --> batches of batch_size --> (i_id, sense) ...
+    mapping N (sorted by id)    --+
+
+The input must be sorted by id (e.g. `LC_ALL=C sort -t $'\\t' -k1,1`). Mapping files that are not sorted
+are sorted once with an external merge sort into bundle/ (sorted_source).
+'''
+
+SORT_CHUNK_LINES = 1000000 # lines held in memory per run of the external sort
+
+
+def line_key(line):
+
+    return line.split("\t", 1)[0]
+
+
+def is_sorted(file_path):
+
+    previous = None
+    for line in iter_lines(file_path):
+        key = line_key(line)
+        if previous is not None and key < previous:
+            return False
+        previous = key
+
+    return True
+
+
+def external_sort(file_path, out_path, chunk_lines=SORT_CHUNK_LINES):
+
+    # stable sort of the lines of a file by id, holding chunk_lines lines at a time
+    tmp_dir = tempfile.mkdtemp(prefix="t4wsd-sort-")
+    try:
+        runs = []
+        lines = iter_lines(file_path)
+        while True:
+            chunk = list(itertools.islice(lines, chunk_lines))
+            if not chunk:
+                break
+            chunk.sort(key=line_key)
+            run_path = os.path.join(tmp_dir, "run" + str(len(runs)))
+            with open(run_path, "w", encoding="utf-8") as f:
+                for line in chunk:
+                    f.write(line + "\n")
+            runs.append(run_path)
+
+        files = [open(run_path, encoding="utf-8") for run_path in runs]
+        try:
+            tmp_path = out_path + ".tmp-" + str(os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(heapq.merge(*files, key=lambda line: line_key(line.rstrip("\n"))))
+            os.replace(tmp_path, out_path)
+        finally:
+            for run_file in files:
+                run_file.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def sorted_source(file_path):
+
+    # path of an id-sorted version of a source file: the file itself when already sorted, else a sorted copy under bundle/
+    file_path = resolve_path(file_path)
+    out_path = bundle.artifact_dir(file_path) + ".sorted.txt"
+    stamp_path = out_path + ".json"
+    stat = os.stat(file_path)
+    stamp = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            saved = json.load(f)
+        if saved["mtime_ns"] == stamp["mtime_ns"] and saved["size"] == stamp["size"] and os.path.exists(saved["path"]):
+            return saved["path"]
+
+    if is_sorted(file_path):
+        stamp["path"] = file_path
+    else:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        external_sort(file_path, out_path)
+        stamp["path"] = out_path
+    os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, "w") as f:
+        json.dump(stamp, f)
+
+    return stamp["path"]
+
+
+def input_lines(file_path):
+
+    # lines of a file, or of stdin for "-" (either may be compressed)
+    if file_path == "-":
+        stdin = sys.stdin.buffer
+        return codecs.getreader("utf-8")(decompressed(stdin, compression_of(stdin.peek(6)[:6]), "stdin"))
+
+    return iter_lines(file_path)
+
+
+def ranked_records(lines):
+
+    # (i_id, (senses, scores)) per ranked-output line
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        i_id, senses, scores = parse_ranked_line(line)
+        yield i_id, (senses, scores)
+
+
+def mapping_records(file_path, n_fields):
+
+    # (i_id, candidates or None) from an id-sorted mapping
+    for line in iter_lines(sorted_source(file_path)):
+        i_id, _, candidates = parse_mapping_line(line, n_fields)
+        yield i_id, candidates
+
+
+def lemma_records(file_path):
+
+    for line in iter_lines(sorted_source(file_path)):
+        yield parse_lemma_line(line)
+
+
+def merge_join(records, sides):
+
+    # (key, payload, [value of each side or None]) for every record; records and sides sorted by key
+    # (a key repeated in a side keeps its last value, like a dict built from the file)
+    sides = [iter(side) for side in sides]
+    heads = [next(side, None) for side in sides]
+    matched = [(None, None)] * len(sides) # last (key, value) taken from each side
+    previous = None
+
+    for key, payload in records:
+        if previous is not None and key < previous:
+            raise ValueError("input is not sorted by instance id: " + key + " after " + previous)
+        previous = key
+
+        values = []
+        for k, side in enumerate(sides):
+            if matched[k][0] == key: # repeated input id
+                values.append(matched[k][1])
+                continue
+            value = None
+            while heads[k] is not None and heads[k][0] <= key:
+                head_key, head_value = heads[k]
+                if head_key == key:
+                    value = head_value
+                heads[k] = next(side, None)
+                if heads[k] is not None and heads[k][0] < head_key:
+                    raise ValueError("mapping is not sorted by instance id: " + heads[k][0] + " after " + head_key)
+            matched[k] = (key, value)
+            values.append(value)
+
+        yield key, payload, values
+
+
+def rerank_stream(records, mapping_sides, method, a=None, b=None, c=None, smoothing=None, pair_p_freq=None, zero_sum_one=False, extra_sides=(), batch_size=1024, counters=None):
+
+    # (i_id, sense) for every record, in input order
+    # pair_p_freq(batch, i_ids, extras) -> per-pair p_freq, extras[i] = values of the extra sides for instance i
+    mapping_sides = list(mapping_sides)
+    extra_sides = list(extra_sides)
+    n_mappings = len(mapping_sides)
+    joined = merge_join(records, mapping_sides + extra_sides)
+
+    while True:
+        chunk = list(itertools.islice(joined, batch_size))
+        if not chunk:
+            break
+
+        i_ids = [key for key, _, _ in chunk]
+        rows = [str(k) for k in range(len(chunk))]
+        offsets = [0]
+        senses = []
+        p_wsd = []
+        for _, (line_senses, line_scores), _ in chunk:
+            senses.extend(line_senses)
+            p_wsd.extend(line_scores)
+            offsets.append(len(senses))
+        # senses and candidates are interned in a vocab of the batch, so the shared one does not grow with the stream
+        vocab = Vocab()
+        batch = Batch(rows, offsets, [vocab.intern(s) for s in senses], p_wsd, vocab)
+
+        indexes = [ConstraintIndex.from_lists(rows, [values[k] for _, _, values in chunk], vocab=vocab) for k in range(n_mappings)]
+        if method == "hard":
+            best = hard_decisions(batch, indexes, counters)
+        else:
+            if c and pair_p_freq is not None:
+                p_freq = pair_p_freq(batch, i_ids, [values[n_mappings:] for _, _, values in chunk])
+            else:
+                p_freq = None
+            best = soft_decisions(batch, indexes, p_freq, a, b, c, smoothing, zero_sum_one, counters)
+
+        for row, sense in answers(batch, best):
+            yield i_ids[int(row)], sense
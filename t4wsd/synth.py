@@ -0,0 +1,291 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+import glob
+import os
+import zlib
+
+import numpy as np
+
+from t4wsd.readers import iter_lines, parse_ranked_line, parse_mapping_line, sense_lemma_pos
+
+'''
+# Synthetic corpora
+
+A synthetic corpus resamples the instances of a real one, so every distribution of the real files
+(candidates per instance, score skew, constraint coverage of each language, monosemous instances, gold ranks)
+is reproduced, and the files stay consistent with each other:
+
+    template   an instance of the real corpus, with its line in every file of the corpus
+               (ranked outputs, mappings, lemma map, gold keys; index.sense entries of its lemmas)
+    round r    every template once, in a random order; the copies of round r > 0 are renamed
+               d001.s002.t003 -> d001r2.s002.t003, art n -> art_2 n,
+               art%1:09:00:: -> art_2%1:09:00::, bn:00062759n -> bn:200062759n
+
+A corpus of scale k has round(k * templates) instances: the first rounds complete, the last one a random part.
+The output only depends on the source files, the scale and the seed.
+'''
+
+BN_ROUND = 100000000 # added to a BabelNet synset number per round
+
+
+# --- renaming ---
+
+def rename_id(i_id, r):
+
+    if r == 0:
+        return i_id
+    parts = i_id.split(".")
+    parts[-3] = parts[-3] + "r" + str(r) # document of dNNN.sNNN.tNNN
+
+    return ".".join(parts)
+
+
+def rename_lemma_pos(lemma_pos, r):
+
+    if r == 0:
+        return lemma_pos
+    lemma, pos = lemma_pos.rsplit(" ", 1)
+
+    return lemma + "_" + str(r) + " " + pos
+
+
+def rename_sense(token, r):
+
+    # WordNet sense keys and BabelNet synsets; any other token (scores, translations, NONE, ...) is kept
+    if r == 0:
+        return token
+    if "%" in token:
+        lemma, lex_sense = token.split("%", 1)
+        return lemma + "_" + str(r) + "%" + lex_sense
+    if token.startswith("bn:") and token[3:-1].isdigit():
+        return "bn:%08d%s" % (r * BN_ROUND + int(token[3:-1]), token[-1])
+
+    return token
+
+
+def rename_line(line, kind, r):
+
+    if r == 0:
+        return line
+
+    if kind in ("gold", "prior"):
+        tokens = line.split(" ")
+        head = rename_id(tokens[0], r) if kind == "gold" else rename_sense(tokens[0], r)
+        return " ".join([head] + [rename_sense(token, r) for token in tokens[1:]])
+
+    fields = line.split("\t")
+    renamed = [rename_id(fields[0], r)]
+    for k, field in enumerate(fields[1:]):
+        if k == 0 and kind in ("mapping", "lemma"):
+            renamed.append(rename_lemma_pos(field, r))
+        else:
+            renamed.append(" ".join(rename_sense(token, r) for token in field.split(" ")))
+
+    return "\t".join(renamed)
+
+
+# --- corpora ---
+
+class SourceFile(object):
+
+    # one file of a corpus: {template id: line}
+    # (id_prefix: data set prefix the file leaves out of its ids, e.g. "senseval2." for gold_keys/senseval2.gold.key.txt)
+    def __init__(self, rel_path, kind, lines):
+        self.rel_path = rel_path
+        self.kind = kind
+        self.lines = lines
+
+    @classmethod
+    def read(cls, src, rel_path, kind, id_prefix=""):
+        lines = {}
+        sep = " " if kind == "gold" else "\t"
+        for line in iter_lines(os.path.join(src, rel_path)):
+            if line.strip():
+                lines[id_prefix + line.split(sep, 1)[0]] = line
+        return cls(rel_path, kind, lines)
+
+
+class Corpus(object):
+
+    def __init__(self, name, template_ids, files):
+        self.name = name
+        self.template_ids = template_ids
+        self.files = files
+
+    def __len__(self):
+        return len(self.template_ids)
+
+
+def rel_paths(src, pattern):
+
+    return sorted(os.path.relpath(path, src) for path in glob.glob(os.path.join(src, pattern)))
+
+
+def en_corpus(src):
+
+    # English all-words WSD: every base system, the three mappings and the gold keys (ALL and per data set)
+    files = [SourceFile.read(src, path, "ranked") for path in rel_paths(src, "base_outputs/ALL.*.ranked.out")]
+    files += [SourceFile.read(src, path, "mapping") for path in rel_paths(src, "mappings/ALL_bnsyn_trans_mapping.*.txt")]
+    for path in rel_paths(src, "gold_keys/*.gold.key.txt"):
+        test_name = os.path.basename(path).split(".")[0]
+        files.append(SourceFile.read(src, path, "gold", "" if test_name == "ALL" else test_name + "."))
+    template_ids = list(SourceFile.read(src, "gold_keys/ALL.gold.key.txt", "gold").lines)
+
+    return Corpus("en", template_ids, files)
+
+
+def mwsd_corpora(src):
+
+    # one corpus per test set and language
+    corpora = []
+    for key_path in rel_paths(src, "mwsd_gold_keys/*_*.gold.key.txt"):
+        test_name, lang = os.path.basename(key_path)[:-len(".gold.key.txt")].split("_")
+        files = [SourceFile.read(src, path, "ranked") for path in rel_paths(src, "mwsd_base_outputs/" + test_name + "." + lang + ".*.ranked.*.out")]
+        files += [SourceFile.read(src, path, "mapping") for path in rel_paths(src, "mwsd_mappings/" + test_name + "_bnsyn_trans_mapping.*." + lang + ".txt")]
+        files += [SourceFile.read(src, path, "lemma") for path in rel_paths(src, "mwsd_mappings/" + test_name + "_" + lang + "_lemma_bnsyn_mapping.txt")]
+        files += [SourceFile.read(src, path, "gold") for path in rel_paths(src, "mwsd_gold_keys/" + test_name + "_" + lang + ".gold.*")]
+        template_ids = list(SourceFile.read(src, key_path, "gold").lines)
+        corpora.append(Corpus(test_name + "_" + lang, template_ids, files))
+
+    return corpora
+
+
+def read_prior_groups(file_path):
+
+    # {lemma_pos: [index.sense lines]}, in file order
+    groups = {}
+    for line in iter_lines(file_path):
+        if line.strip():
+            groups.setdefault(sense_lemma_pos(line.split(" ", 1)[0]), []).append(line)
+
+    return groups
+
+
+def instance_lemma_pos(corpus, template_id):
+
+    # lemma_pos of the WordNet senses an instance mentions (for its index.sense entries)
+    lemma_pos = set()
+    for source in corpus.files:
+        line = source.lines.get(template_id)
+        if line is None or source.kind not in ("ranked", "gold"):
+            continue
+        senses = parse_ranked_line(line)[1] if source.kind == "ranked" else line.split(" ")[1:]
+        lemma_pos.update(sense_lemma_pos(sense) for sense in senses if "%" in sense)
+
+    return lemma_pos
+
+
+def iter_rounds(n_templates, n_instances, rng):
+
+    # (round, templates of the round in order): whole permutations, then a random part of one more
+    for r in range(-(-n_instances // n_templates)):
+        order = rng.permutation(n_templates)
+        yield r, order[:n_instances - r * n_templates]
+
+
+class PriorPlan(object):
+
+    # the index.sense entries of a round are written with the first instance of the round that mentions their lemma;
+    # which one that is follows from the order of the round alone, so nothing is remembered across instances or rounds
+
+    def __init__(self, corpus, prior_groups):
+        # lemma_pos of every template (with index.sense entries, sorted), and every (lemma_pos, template) pair
+        self.template_lemma_pos = []
+        self.lemma_index = {}
+        lemma_of = []
+        template_of = []
+        for t, template_id in enumerate(corpus.template_ids):
+            lemma_pos_list = sorted(lemma_pos for lemma_pos in instance_lemma_pos(corpus, template_id) if lemma_pos in prior_groups)
+            self.template_lemma_pos.append(lemma_pos_list)
+            for lemma_pos in lemma_pos_list:
+                lemma_of.append(self.lemma_index.setdefault(lemma_pos, len(self.lemma_index)))
+                template_of.append(t)
+        self.lemma_of = np.array(lemma_of, dtype=np.int64)
+        self.template_of = np.array(template_of, dtype=np.int64)
+        self.n_templates = len(corpus)
+
+    def start_round(self, templates):
+        # position of every template in the round, and the first position that mentions each lemma_pos
+        self.position = np.full(self.n_templates, self.n_templates, dtype=np.int64)
+        self.position[templates] = np.arange(len(templates))
+        self.first = np.full(len(self.lemma_index), self.n_templates, dtype=np.int64)
+        np.minimum.at(self.first, self.lemma_of, self.position[self.template_of])
+
+    def lemma_pos_of(self, t):
+        # lemma_pos whose entries are written with template t in the current round
+        return [lemma_pos for lemma_pos in self.template_lemma_pos[t] if self.first[self.lemma_index[lemma_pos]] == self.position[t]]
+
+
+def generate(corpus, out_dir, scale, seed, prior_groups=None, prior_file=None):
+
+    # write the synthetic copy of a corpus under out_dir; returns the number of instances
+    rng = np.random.default_rng([seed, zlib.crc32(corpus.name.encode("utf-8"))])
+    n_instances = int(round(scale * len(corpus)))
+    prior_plan = PriorPlan(corpus, prior_groups) if prior_file is not None else None
+
+    handles = []
+    for source in corpus.files:
+        out_path = os.path.join(out_dir, source.rel_path)
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        handles.append(codecs.open(out_path, "w", encoding="utf-8"))
+
+    try:
+        for r, templates in iter_rounds(len(corpus), n_instances, rng):
+            if prior_plan is not None:
+                prior_plan.start_round(templates)
+            for t in templates.tolist():
+                template_id = corpus.template_ids[t]
+                for source, newf in zip(corpus.files, handles):
+                    line = source.lines.get(template_id)
+                    if line is not None:
+                        newf.write(rename_line(line, source.kind, r) + "\n")
+
+                if prior_plan is not None:
+                    for lemma_pos in prior_plan.lemma_pos_of(t):
+                        for line in prior_groups[lemma_pos]:
+                            prior_file.write(rename_line(line, "prior", r) + "\n")
+    finally:
+        for newf in handles:
+            newf.close()
+
+    return n_instances
+
+
+# --- statistics ---
+
+def file_stats(file_path, kind):
+
+    # the learned distributions, summarized: instances, candidates per instance, monosemous share, top score,
+    # and for mappings the coverage (share of instances with a constraint)
+    n = 0
+    n_candidates = 0
+    n_monosemous = 0
+    top_scores = []
+    n_constrained = 0
+    n_fields = 5 if "/mappings/" in "/" + file_path.replace(os.sep, "/") else 4
+
+    for line in iter_lines(file_path):
+        if not line.strip():
+            continue
+        n += 1
+        if kind == "ranked":
+            _, senses, scores = parse_ranked_line(line)
+            n_candidates += len(senses)
+            n_monosemous += len(senses) == 1
+            if len(senses) > 1:
+                top_scores.append(scores[0])
+        elif kind == "mapping":
+            _, _, candidates = parse_mapping_line(line, n_fields)
+            if candidates is not None:
+                n_constrained += 1
+                n_candidates += len(candidates)
+
+    stats = {"instances": n}
+    if kind == "ranked":
+        stats.update({"candidates": n_candidates / n if n else 0.0, "monosemous": n_monosemous / n if n else 0.0,
+                      "top_score": float(np.nanmean(top_scores)) if top_scores else 0.0})
+    elif kind == "mapping":
+        stats.update({"coverage": n_constrained / n if n else 0.0, "candidates": n_candidates / n_constrained if n_constrained else 0.0})
+
+    return stats
@@ -0,0 +1,328 @@
+#-*- coding: utf-8 -*-
+
+import itertools
+import json
+import os
+import random
+
+import numpy as np
+
+from t4wsd import scoring
+from t4wsd.constraints import SENSE_VOCAB, KEY_STRIDE, member
+
+'''
+# In-process hyperparameter tuning for SoftConstraint
+
+Base scores, constraints and priors are loaded once; every grid point (a, b, c, t_smoothing, s_smoothing)
+is then scored against the gold keys without writing files or calling the Scorer:
+
+    for each (t_smoothing, s_smoothing): log p_trans / log p_freq are computed once
+    for all (a, b, c) of that group:     scores[G, pairs] = a * log p_wsd + b * log p_trans + c * log p_freq
+                                         -> segment argmax per instance -> correct answers per grid point
+
+The best few points are re-scored with the exact engine (scoring.soft_decisions), which settles near ties
+the same way SoftConstraint does, and the winner is written to a JSON table the scripts load with -p.
+'''
+
+MAX_BATCH_CELLS = 1 << 24 # grid points x pairs scored per numpy pass
+
+
+def gold_labels(batch, gold):
+
+    # per pair: is the sense one of the gold senses of its instance; per instance: is it in the gold key
+    gold_ids = gold.ids.tolist()
+    gold_rows = {i_id: row for row, i_id in enumerate(gold_ids)}
+    rows = np.array([gold_rows.get(i_id, -1) for i_id in batch.ids], dtype=np.int64)
+
+    gold_senses = SENSE_VOCAB.remap(gold.vocab.tolist())[gold.senses] if len(gold.senses) else np.zeros(0, dtype=np.int32)
+    gold_row_of = np.repeat(np.arange(len(gold_ids), dtype=np.int64), np.diff(gold.offsets))
+    gold_keys = np.sort(gold_row_of * KEY_STRIDE + gold_senses)
+
+    pair_rows = rows[batch.instance_of_pair]
+    labels = member(gold_keys, pair_rows * KEY_STRIDE + batch.sense_ids) & (pair_rows >= 0)
+
+    return labels, rows >= 0, len(gold_ids)
+
+
+def f1_score(correct, answered, n_gold):
+
+    # Scorer.java with one answer per instance: P = correct / answered, R = correct / |gold|
+    precision = np.divide(correct, answered, out=np.zeros(np.shape(correct)), where=np.asarray(answered) > 0)
+    recall = np.asarray(correct, dtype=np.float64) / n_gold if n_gold else np.zeros(np.shape(correct))
+    denominator = precision + recall
+
+    return np.divide(2 * precision * recall, denominator, out=np.zeros(np.shape(denominator)), where=denominator > 0)
+
+
+class TuningProblem(object):
+
+    # p_freq_for(s_smoothing) -> per-pair p_freq (None when the prior is not used)
+    def __init__(self, batch, indexes, gold, p_freq_for=None, zero_sum_one=False):
+        self.batch = batch
+        self.indexes = indexes
+        self.p_freq_for = p_freq_for
+        self.zero_sum_one = zero_sum_one
+        self.labels, self.in_gold, self.n_gold = gold_labels(batch, gold)
+        self._p_trans = {}
+        self._p_freq = {}
+
+    def p_trans(self, t_smoothing):
+        if t_smoothing not in self._p_trans:
+            self._p_trans[t_smoothing] = scoring.get_p_trans(self.batch, self.indexes, t_smoothing, self.zero_sum_one)
+        return self._p_trans[t_smoothing]
+
+    def p_freq(self, s_smoothing):
+        # s_smoothing is None for priors without smoothing (CluBERT)
+        if self.p_freq_for is None:
+            return None
+        if s_smoothing not in self._p_freq:
+            self._p_freq[s_smoothing] = self.p_freq_for(s_smoothing)
+        return self._p_freq[s_smoothing]
+
+    def evaluate(self, points, instances=None):
+
+        # F1 of every point (dicts with a, b, c, t_smoothing, s_smoothing), optionally on a subset of instances
+        batch = self.batch
+        if instances is None:
+            instances = np.arange(len(batch))
+        lengths = batch.lengths[instances]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        pairs = np.repeat(batch.starts[instances] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        labels = self.labels[pairs]
+        nonempty = lengths > 0 # an instance without ranked senses gets no answer
+        heads = offsets[:-1][nonempty]
+        answered = int(nonempty.sum())
+        n_gold = self.n_gold if answered == len(batch) else int(self.in_gold[instances].sum())
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_p_wsd = np.log(batch.p_wsd[pairs])
+        f1 = np.zeros(len(points))
+        groups = {}
+        for k, point in enumerate(points):
+            use_freq = bool(point["c"])
+            groups.setdefault((point["t_smoothing"], point["s_smoothing"] if use_freq else None, use_freq), []).append(k)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for (t_smoothing, s_smoothing, use_freq), members in groups.items():
+                p_trans, constrained = self.p_trans(t_smoothing)
+                keep_top = ((lengths == 1) | ~constrained[instances])
+                log_p_trans = np.log(p_trans[pairs])
+                p_freq = self.p_freq(s_smoothing) if use_freq else None
+                log_p_freq = np.log(p_freq[pairs]) if p_freq is not None else None
+
+                chunk = max(1, MAX_BATCH_CELLS // max(1, len(pairs)))
+                for c0 in range(0, len(members), chunk):
+                    ks = members[c0:c0 + chunk]
+                    exps = np.array([[points[k]["a"], points[k]["b"], points[k]["c"] or 0.0] for k in ks])
+                    scores = log_term(exps[:, 0], log_p_wsd) + log_term(exps[:, 1], log_p_trans)
+                    if log_p_freq is not None:
+                        scores += log_term(exps[:, 2], log_p_freq)
+                    best = segment_argmax_2d(scores, offsets)
+                    best[:, keep_top] = 0
+                    correct = labels[heads + best[:, nonempty]].sum(axis=1)
+                    f1[ks] = f1_score(correct, answered, n_gold)
+
+        return f1
+
+    def exact_f1(self, point):
+
+        p_freq = self.p_freq(point["s_smoothing"]) if point["c"] else None
+        best = scoring.soft_decisions(self.batch, self.indexes, p_freq, point["a"], point["b"], point["c"], point["t_smoothing"], self.zero_sum_one)
+        nonempty = self.batch.lengths > 0
+        correct = int(self.labels[(self.batch.starts + best)[nonempty]].sum())
+
+        return float(f1_score(correct, int(nonempty.sum()), self.n_gold))
+
+
+def log_term(exponents, log_p):
+
+    # [G, pairs] exponent * log p with p^0 = 1
+    out = exponents[:, None] * log_p[None, :]
+    out[exponents == 0, :] = 0.0
+
+    return out
+
+
+def segment_argmax_2d(scores, offsets):
+
+    # first maximum of every segment, for every row of a [G, pairs] score matrix (0 for an empty segment)
+    n_rows, n_pairs = scores.shape
+    lengths = np.diff(offsets)
+    best = np.zeros((n_rows, len(lengths)), dtype=np.int64)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return best
+
+    starts = offsets[:-1][nonempty]
+    seg_max = np.maximum.reduceat(scores, starts, axis=1)
+    is_max = scores == np.repeat(seg_max, lengths[nonempty], axis=1)
+    pos = np.where(is_max, np.arange(n_pairs)[None, :], n_pairs)
+    first = np.minimum.reduceat(pos, starts, axis=1)
+    best[:, nonempty] = np.where(first < n_pairs, first - starts[None, :], 0)
+
+    return best
+
+
+# --- search spaces ---
+
+def frange(start, stop, step):
+
+    n = int(round((stop - start) / step))
+    return [round(start + k * step, 10) for k in range(n + 1)]
+
+
+def weight_grid(step, use_freq):
+
+    # exponents on a simplex: a + b (+ c) = 1, all positive
+    values = frange(step, 1.0 - step, step)
+    points = []
+    if use_freq:
+        for a, b in itertools.product(values, values):
+            c = round(1.0 - a - b, 10)
+            if c >= step - 1e-9:
+                points.append((a, b, c))
+    else:
+        for a in values:
+            points.append((a, round(1.0 - a, 10), None))
+
+    return points
+
+
+def grid_points(step, t_values, s_values, use_freq):
+
+    points = []
+    for t_smoothing in t_values:
+        for a, b, c in weight_grid(step, use_freq):
+            for s_smoothing in (s_values if use_freq else [None]):
+                points.append({"a": a, "b": b, "c": c, "t_smoothing": t_smoothing, "s_smoothing": s_smoothing})
+
+    return points
+
+
+def random_points(n, rng, step, t_values, s_values, use_freq):
+
+    weights = weight_grid(step, use_freq)
+    points = []
+    for _ in range(n):
+        a, b, c = rng.choice(weights)
+        points.append({"a": a, "b": b, "c": c, "t_smoothing": rng.choice(t_values), "s_smoothing": rng.choice(s_values) if use_freq else None})
+
+    return points
+
+
+def successive_halving(problem, points, rng, eta=3, min_instances=200):
+
+    # score all points on a small random subset of instances, keep the best 1/eta, grow the subset, repeat
+    n = len(problem.batch)
+    order = np.array(rng.sample(range(n), n), dtype=np.int64)
+    n_rungs = 0
+    while len(points) > eta ** (n_rungs + 1) and min_instances * eta ** n_rungs < n:
+        n_rungs += 1
+
+    for rung in range(n_rungs):
+        size = min(n, min_instances * eta ** rung)
+        f1 = problem.evaluate(points, np.sort(order[:size]))
+        keep = max(1, len(points) // eta)
+        points = [points[k] for k in np.argsort(-f1, kind="stable")[:keep]]
+
+    return points
+
+
+def tune(problem, search="grid", step=0.1, t_values=None, s_values=None, use_freq=False, trials=500, seed=0, top_k=5):
+
+    # best point (with its exact F1) over the search space
+    rng = random.Random(seed)
+    if t_values is None:
+        t_values = frange(0.0 if problem.zero_sum_one else 0.01, 1.0, 0.01)
+    if s_values is None:
+        s_values = [0.01, 0.02, 0.05, 0.1]
+    if not s_values:
+        s_values = [None]
+
+    if search == "grid":
+        points = grid_points(step, t_values, s_values, use_freq)
+    elif search == "random":
+        points = random_points(trials, rng, step, t_values, s_values, use_freq)
+    elif search == "halving":
+        points = successive_halving(problem, grid_points(step, t_values, s_values, use_freq), rng)
+    else:
+        raise ValueError("unknown search: " + search)
+    if not points:
+        raise ValueError("empty search space")
+
+    f1 = problem.evaluate(points)
+    candidates = [points[k] for k in np.argsort(-f1, kind="stable")[:top_k]]
+
+    best = None
+    for point in candidates:
+        exact = problem.exact_f1(point)
+        if best is None or exact > best["f1"]:
+            best = dict(point, f1=exact)
+
+    return best, len(points)
+
+
+# --- parameter tables ---
+
+def load_parameters(file_path):
+
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def save_parameters(file_path, system_key, case_key, params):
+
+    # merge one tuned entry into the JSON table (same shape as the scripts' parameters dicts)
+    table = load_parameters(file_path) if os.path.exists(file_path) else {}
+    table.setdefault(system_key, {})[case_key] = params
+    tmp_path = file_path + ".tmp-" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, file_path)
+
+
+def parse_values(spec):
+
+    # "0.01,0.02" or "start:stop:step"; "" for no values
+    if not spec:
+        return []
+    if ":" in spec:
+        start, stop, step = [float(v) for v in spec.split(":")]
+        return frange(start, stop, step)
+    return [float(v) for v in spec.split(",")]
+
+
+def check_tune_arguments(parser, args, use_freq, zero_sum_one=False):
+
+    # parser error for a search space without points, or with t_smoothing 0 where p_trans would divide 0 by 0
+    # (a constrained instance none of whose senses is translated; zero_sum_one gives those senses p_trans 1)
+    try:
+        t_values = parse_values(args.t_grid)
+        s_values = parse_values(args.s_grid)
+    except (ValueError, ZeroDivisionError) as e:
+        parser.error("bad --t-grid / --s-grid: " + str(e))
+    if not t_values:
+        parser.error("--t-grid has no t_smoothing value")
+    if use_freq and not zero_sum_one and not s_values:
+        parser.error("--s-grid has no s_smoothing value")
+    if not zero_sum_one and min(t_values) <= 0.0:
+        parser.error("--t-grid needs t_smoothing > 0")
+    if not 0.0 < args.step < 1.0 or not weight_grid(args.step, use_freq):
+        parser.error("--step " + str(args.step) + " leaves no a/b/c point")
+    if args.search not in ("grid", "random", "halving"):
+        parser.error("unknown --search: " + args.search)
+    if args.search == "random" and args.trials < 1:
+        parser.error("--trials needs at least one point")
+
+
+def add_tune_arguments(parser, zero_sum_one=False):
+
+    # t_smoothing 0 is only defined (and the shipped optimum of most entries) with zero_sum_one
+    t_grid = "0:1:0.01" if zero_sum_one else "0.01:1:0.01"
+    parser.add_argument("-p", "--params", default="", help="JSON parameter table written by -m tune (default: hard-coded parameters)")
+    parser.add_argument("--search", default="grid", help="search strategy for -m tune (grid, random, halving; default: grid)")
+    parser.add_argument("--step", default=0.1, type=float, help="step of the a/b/c simplex grid for -m tune (default: 0.1)")
+    parser.add_argument("--t-grid", default=t_grid, help="t_smoothing values for -m tune, list or start:stop:step (default: " + t_grid + ")")
+    parser.add_argument("--s-grid", default="0.01,0.02,0.05,0.1", help="s_smoothing values for -m tune (default: 0.01,0.02,0.05,0.1)")
+    parser.add_argument("--trials", default=500, type=int, help="number of points for --search random (default: 500)")
+    parser.add_argument("--seed", default=0, type=int, help="random seed for -m tune (default: 0)")
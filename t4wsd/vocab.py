@@ -0,0 +1,113 @@
+#-*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class Vocab(object):
+
+    # interns strings (sense keys, synset ids, instance ids) to dense integer ids
+
+    def __init__(self, strings=()):
+        self.index = {}
+        self.strings = []
+        for s in strings:
+            self.intern(s)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __contains__(self, s):
+        return s in self.index
+
+    def intern(self, s):
+        i = self.index.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.index[s] = i
+            self.strings.append(s)
+        return i
+
+    def lookup(self, s, default=-1):
+        return self.index.get(s, default)
+
+    def remap(self, strings, add=True):
+        # array mapping positions of a local string table to ids of this vocab
+        if add:
+            return np.array([self.intern(s) for s in strings], dtype=np.int32)
+        return np.array([self.index.get(s, -1) for s in strings], dtype=np.int32)
+
+
+class StringTable(object):
+
+    # immutable list of strings stored as one utf-8 blob plus offsets (memory-mappable)
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self._decoded = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if self._decoded is not None:
+            return self._decoded[i]
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1] - 1]).decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def take(self, rows):
+        # entries of the given rows, decoding only their bytes (sliced from one buffer, not row by row from the memmap)
+        if self._decoded is not None:
+            return [self._decoded[row] for row in rows]
+        rows = np.asarray(rows, dtype=np.int64)
+        blob = memoryview(np.asarray(self.blob))
+        offsets = np.asarray(self.offsets)
+        return [str(blob[start:end], "utf-8") for start, end in zip(offsets[rows].tolist(), (offsets[rows + 1] - 1).tolist())]
+
+    def tolist(self):
+        # every entry is "\n"-terminated in the blob, so one decode + split gives the whole table
+        if self._decoded is None:
+            if len(self) == 0:
+                self._decoded = []
+            else:
+                self._decoded = bytes(self.blob).decode("utf-8").split("\n")[:-1]
+        return self._decoded
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") + b"\n" for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        table = cls(blob, offsets)
+        table._decoded = list(strings)
+        return table
+
+    @classmethod
+    def concat(cls, tables):
+        # the entries of tables one after another, joining the blobs without decoding them
+        blobs = [np.asarray(table.blob) for table in tables]
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        for table, blob in zip(tables, blobs):
+            offsets.append(np.asarray(table.offsets[1:], dtype=np.int64) + shift)
+            shift += len(blob)
+        return cls(np.concatenate(blobs + [np.zeros(0, dtype=np.uint8)]), np.concatenate(offsets))
+
+    def __getstate__(self):
+        # pickled without the decoded strings (e.g. a table sent back by a worker process)
+        return {"blob": self.blob, "offsets": self.offsets, "_decoded": None}
+
+    def save(self, prefix):
+        np.save(prefix + ".blob.npy", self.blob)
+        np.save(prefix + ".offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode="r"):
+        return cls(np.load(prefix + ".blob.npy", mmap_mode=mmap_mode), np.load(prefix + ".offsets.npy", mmap_mode=mmap_mode))
@@ -0,0 +1,24 @@
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+
+    # the scripts read their data through paths relative to the repository
+    monkeypatch.chdir(REPO)
+
+
+def needs(*paths):
+
+    # skip marker for tests on data files that are downloaded separately (index.sense, clubert_v1.0/)
+    missing = [path for path in paths if not os.path.exists(os.path.join(REPO, path))]
+    return pytest.mark.skipif(bool(missing), reason="missing " + ", ".join(missing))
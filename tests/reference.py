@@ -0,0 +1,208 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+from collections import defaultdict
+
+'''
+# Reference implementation
+
+The per-instance loops of the original scripts (dict per instance, pow() product, stable descending sort),
+with the three (English) or four (multilingual) candidate lists generalized to any number of languages
+in the same order. The engine tests compare the vectorized decisions with these.
+'''
+
+POS_OF_NUM = {"1": "n", "2": "v", "3": "a", "4": "r", "5": "a"}
+
+
+def sense_lemma_pos(sense_key):
+
+    lemma = sense_key.split("%")[0]
+    return lemma + " " + POS_OF_NUM[sense_key.split("%")[1][0]]
+
+
+def read_lines(file_path):
+
+    with codecs.open(file_path, "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f.readlines()]
+
+
+def load_ranked(file_paths, test_name="ALL"):
+
+    # {i_id: [[sense, score], ...]}; test_name other than ALL keeps its instances without the prefix
+    base = {}
+    for file_path in file_paths:
+        for line in read_lines(file_path):
+            full_i_id = line.split("\t")[0]
+            if test_name == "ALL":
+                i_id = full_i_id
+            elif full_i_id.split(".")[0] == test_name:
+                i_id = ".".join(full_i_id.split(".")[1:])
+            else:
+                continue
+            base[i_id] = [pair.split(" ") for pair in line.split("\t")[1:]]
+
+    return base
+
+
+def load_mapping(file_path, n_fields, test_name="ALL"):
+
+    # {i_id: target_lemma_pos (no constraint) or [target_lemma_pos, candidates]}; the candidates are the last field
+    t_s_constraint = {}
+    for line in read_lines(file_path):
+        t_s_info_list = line.split("\t")
+        i_id = t_s_info_list[0]
+        if test_name != "ALL":
+            if i_id.split(".")[0] != test_name:
+                continue
+            i_id = ".".join(i_id.split(".")[1:])
+
+        target_lemma_pos = t_s_info_list[1]
+        if len(t_s_info_list) != n_fields or t_s_info_list[2] == "MONOSEMOUS":
+            t_s_constraint[i_id] = target_lemma_pos
+        else:
+            t_s_constraint[i_id] = [target_lemma_pos, t_s_info_list[n_fields - 1].split(" ")]
+
+    return t_s_constraint
+
+
+def load_wordnet_p_freq(file_path, smoothing):
+
+    # {lemma_pos: {sense_key: (count + smoothing) / sum}} of index.sense
+    sense_count_dict = defaultdict(dict)
+    for line in read_lines(file_path):
+        sense_key = line.split(" ")[0]
+        sense_count_dict[sense_lemma_pos(sense_key)][sense_key] = int(line.split(" ")[-1]) + smoothing
+
+    sense_freq_dict = defaultdict(dict)
+    for lemma_pos, sense_counts in sense_count_dict.items():
+        sum_count = 0
+        for sense, count in sense_counts.items():
+            sum_count += count
+        for sense, count in sense_counts.items():
+            sense_freq_dict[lemma_pos][sense] = float(count) / sum_count
+
+    return sense_freq_dict
+
+
+def load_clubert_p_freq(file_path, id_lemma_path):
+
+    # {i_id: {bn_id: probability}} of the lemma_pos of every instance (1.0 for a sense without "#probability")
+    lemma_sense_freq = defaultdict(dict)
+    for line in read_lines(file_path):
+        lemma_pos = line.split("\t")[0].replace("#", " ")
+        for sense_prob in line.split("\t")[1:]:
+            if "#" not in sense_prob:
+                lemma_sense_freq[lemma_pos][sense_prob] = float(1.0)
+            else:
+                lemma_sense_freq[lemma_pos][sense_prob.split("#")[0]] = float(sense_prob.split("#")[1])
+
+    sense_freq_dict = {}
+    for line in read_lines(id_lemma_path):
+        sense_freq_dict[line.split("\t")[0]] = lemma_sense_freq[line.split("\t")[1]]
+
+    return sense_freq_dict
+
+
+def get_intersect(t_s_constraints):
+
+    # HardConstraint: {i_id: target_lemma_pos or [target_lemma_pos, candidates of every language]}
+    t_s_constraint_intersect = {}
+    for i_id, info1 in t_s_constraints[0].items():
+        target_lemma_pos = info1 if type(info1) == str else info1[0]
+        infos = [info1] + [t_s_constraint[i_id] for t_s_constraint in t_s_constraints[1:]]
+        if all(type(info) == list for info in infos):
+            intersection = list(set(infos[0][1]).intersection(*[set(info[1]) for info in infos[1:]]))
+            if intersection == []:
+                t_s_constraint_intersect[i_id] = target_lemma_pos
+            else:
+                t_s_constraint_intersect[i_id] = [target_lemma_pos, intersection]
+        else:
+            t_s_constraint_intersect[i_id] = target_lemma_pos
+
+    return t_s_constraint_intersect
+
+
+def get_p_trans(ranked_sense_scores, candidate_lists, smoothing, zero_sum_one=False):
+
+    # {sense: p_trans}; the weights of the languages are added in language order
+    def weight(sense):
+        w = 0
+        for candidates in candidate_lists:
+            if sense in candidates:
+                w += 1 / len(candidates)
+        return w
+
+    all_sum = 0.0
+    for sense_score in ranked_sense_scores:
+        all_sum += weight(sense_score[0])
+
+    if zero_sum_one and all_sum == 0.0:
+        return {sense_score[0]: 1 for sense_score in ranked_sense_scores}
+
+    constraint_scores = {}
+    for sense_score in ranked_sense_scores:
+        sense = sense_score[0]
+        constraint_scores[sense] = float(weight(sense) + smoothing) / ((len(ranked_sense_scores) * smoothing) + all_sum)
+
+    return constraint_scores
+
+
+def combine_all_experts(ranked_sense_scores, trans_cons_factor, sense_freq, a, b, c):
+
+    # p(sense) = p(wsd)^a * p(translation)^b [* p(prior)^c], stable sort descending
+    new_ranked_sense_scores = []
+    for sense_score in ranked_sense_scores:
+        sense = sense_score[0]
+        new_score = pow(float(sense_score[1]), a) * pow(trans_cons_factor[sense], b)
+        if c:
+            new_score = new_score * pow(sense_freq.get(sense, 0), c)
+        new_ranked_sense_scores.append([sense, new_score])
+
+    new_ranked_sense_scores.sort(key=lambda x: x[1], reverse=True)
+
+    return new_ranked_sense_scores
+
+
+def hard_constraint(base, t_s_constraint_intersect):
+
+    # {i_id: answer}: the first ranked sense every language allows, else the top sense
+    answers = {}
+    for i_id, ranked_sense_scores in base.items():
+        ans_sense = ranked_sense_scores[0][0]
+        constraint = t_s_constraint_intersect.get(i_id)
+        if len(ranked_sense_scores) == 1 or type(constraint) != list:
+            answers[i_id] = ans_sense
+            continue
+        answers[i_id] = ans_sense
+        for pair in ranked_sense_scores:
+            if pair[0] in constraint[1]:
+                answers[i_id] = pair[0]
+                break
+
+    return answers
+
+
+def soft_constraint(base, t_s_constraints, sense_freq_of, a, b, c, smoothing, zero_sum_one=False):
+
+    # {i_id: answer}; sense_freq_of(i_id, top sense) -> {sense: p_freq} when c
+    answers = {}
+    for i_id, p_wsd in base.items():
+        ans_sense = p_wsd[0][0]
+        if len(p_wsd) == 1:
+            answers[i_id] = ans_sense
+            continue
+
+        candidate_lists = []
+        for t_s_constraint in t_s_constraints:
+            constraint = t_s_constraint.get(i_id)
+            candidate_lists.append(constraint[1] if type(constraint) == list else [])
+
+        if all(candidates == [] for candidates in candidate_lists):
+            answers[i_id] = ans_sense
+            continue
+
+        p_trans = get_p_trans(p_wsd, candidate_lists, smoothing, zero_sum_one)
+        sense_freq = sense_freq_of(i_id, ans_sense) if c else None
+        answers[i_id] = combine_all_experts(p_wsd, p_trans, sense_freq, a, b, c)[0][0]
+
+    return answers
@@ -0,0 +1,24 @@
+#-*- coding: utf-8 -*-
+
+import pytest
+
+import translations4wsd
+from t4wsd.api import EnglishWSD
+from t4wsd.scoring import answers, soft_decisions
+
+
+@pytest.mark.parametrize("t_smoothing", [None, 0.0])
+def test_english_soft_needs_t_smoothing(t_smoothing):
+
+    with pytest.raises(ValueError):
+        EnglishWSD().soft("ukb_plain", "semeval2007", a=0.5, b=0.5, t_smoothing=t_smoothing)
+
+
+def test_english_soft_matches_script():
+
+    parameters = translations4wsd.PARAMETERS["ukb_plain"]
+    predictions = EnglishWSD().soft("ukb_plain", "semeval2007", parameters["a"], parameters["b"], t_smoothing=parameters["t_smoothing"])
+
+    batch = translations4wsd.get_p_wsd("ukb_plain", "semeval2007")
+    indexes = [translations4wsd.load_trans_sense_constraint("semeval2007", lang) for lang in ["FR", "DE", "RU"]]
+    assert predictions == answers(batch, soft_decisions(batch, indexes, None, parameters["a"], parameters["b"], None, parameters["t_smoothing"]))
@@ -0,0 +1,90 @@
+#-*- coding: utf-8 -*-
+
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from t4wsd import bundle, loader
+from t4wsd.vocab import StringTable
+
+SOURCES = ["base_outputs/ALL.ims.ranked.out", "mappings/ALL_bnsyn_trans_mapping.wmt14.en-fr.txt",
+           "mwsd_mappings/semeval2013_de_lemma_bnsyn_mapping.txt", "gold_keys/ALL.gold.key.txt"]
+
+
+def compiled_columns(file_path):
+
+    # {column: numpy array or list of strings} and the manifest of a compiled source
+    manifest = bundle.read_manifest(file_path)
+    table = bundle.load_table(file_path, manifest["kind"], manifest["n_fields"])
+    columns = {}
+    for name in manifest["arrays"] + manifest["strings"]:
+        column = getattr(table, name)
+        columns[name] = column.tolist() if isinstance(column, StringTable) else np.asarray(column)
+
+    return columns, manifest
+
+
+@pytest.mark.parametrize("file_path", SOURCES)
+def test_chunked_compile_matches_whole_file(tmp_path, monkeypatch, file_path):
+
+    kind, n_fields = bundle.source_kind(file_path)
+    chunk_bytes = 50000
+    assert len(bundle.chunk_ranges(file_path, chunk_bytes)) > 2
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "whole"))
+    bundle.compile_source(file_path, kind, n_fields)
+    whole, whole_manifest = compiled_columns(file_path)
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "chunked"))
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        loader.compile_sources(pool, [(file_path, kind, n_fields)], chunk_bytes=chunk_bytes)
+    chunked, chunked_manifest = compiled_columns(file_path)
+
+    assert sorted(chunked) == sorted(whole)
+    for name, column in whole.items():
+        if isinstance(column, list):
+            assert chunked[name] == column, name
+        else:
+            equal_nan = column.dtype.kind == "f" # scores without a number are NaN
+            assert chunked[name].dtype == column.dtype and np.array_equal(chunked[name], column, equal_nan=equal_nan), name
+    assert chunked_manifest["partitions"] == whole_manifest["partitions"]
+
+
+def source_lines(file_path):
+
+    # exact text lines of a plain source, without their "\n"
+    with open(file_path, "rb") as f:
+        return f.read().decode("utf-8").split("\n")[:-1]
+
+
+@pytest.mark.parametrize("file_path", [file_path for file_path in SOURCES if os.path.basename(file_path).startswith("ALL")])
+@pytest.mark.parametrize("compression", [None, "gz"])
+def test_partitions_match_filtering_by_prefix(tmp_path, monkeypatch, file_path, compression):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    lines = source_lines(file_path)
+    if compression is not None:
+        # a compressed source has no line offsets, its rows are read by decompressing up to them
+        copy_path = tmp_path / file_path.split("/")[0] / os.path.basename(file_path)
+        copy_path.parent.mkdir()
+        with gzip.open(str(copy_path) + ".gz", "wb") as f:
+            f.write("".join(line + "\n" for line in lines).encode("utf-8"))
+        file_path = str(copy_path)
+
+    table = bundle.load_table(file_path, *bundle.source_kind(file_path))
+    assert hasattr(table, "line_offsets") == (compression is None)
+    ids = table.ids.tolist()
+    assert ids == [line.split(None, 1)[0] for line in lines]
+
+    prefixes = {i_id.split(".")[0] for i_id in ids} | {".".join(i_id.split(".")[:2]) for i_id in ids[::97]}
+    for prefix in sorted(prefixes) + ["semeval2015.d999", "senseval"]:
+        rows = [row for row, i_id in enumerate(ids) if i_id.startswith(prefix + ".")]
+        assert bundle.partition_rows(table, prefix).tolist() == rows, prefix
+        assert bundle.read_partition(file_path, prefix) == [lines[row] for row in rows], prefix
+
+    for row in [0, 1, len(lines) // 2, len(lines) - 1]:
+        assert bundle.instance_line(file_path, ids[row]) == lines[row]
+    assert bundle.instance_line(file_path, "senseval2.d000.s000.t999") is None
@@ -0,0 +1,60 @@
+#-*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+import translations4wsd
+from t4wsd.cache import StageCache, cached_hard_decisions, cached_soft_decisions
+from t4wsd.scoring import hard_decisions, soft_decisions
+
+EN_LANGS = ["FR", "DE", "RU"]
+
+
+def test_cached_decisions_match_and_are_reused(tmp_path):
+
+    cache = StageCache(root=str(tmp_path / "cache"))
+    batch = translations4wsd.get_p_wsd("ukb_plain", "semeval2007")
+    indexes = [translations4wsd.load_trans_sense_constraint("semeval2007", lang) for lang in EN_LANGS]
+    expected = soft_decisions(batch, indexes, None, 0.5, 0.5, None, 0.1)
+
+    counters = {}
+    assert np.array_equal(cached_soft_decisions(cache, batch, indexes, None, None, 0.5, 0.5, None, 0.1, counters=counters), expected)
+    assert np.array_equal(cached_soft_decisions(cache, batch, indexes, None, None, 0.5, 0.5, None, 0.1, counters=counters), expected)
+    assert counters["cache_misses.soft"] == 1 and counters["cache_hits.soft"] == 1
+
+    # other parameters miss the soft entry but reuse the language masks; hard decisions have their own stage
+    counters = {}
+    cached_soft_decisions(cache, batch, indexes, None, None, 0.6, 0.4, None, 0.1, counters=counters)
+    assert counters["cache_misses.soft"] == 1 and counters["cache_hits.masks"] == 1
+    assert np.array_equal(cached_hard_decisions(cache, batch, indexes), hard_decisions(batch, indexes))
+
+
+def test_disabled_cache_computes():
+
+    cache = StageCache(enabled=False)
+    calls = []
+    arrays = cache.cached("stage", ["key"], lambda counters: calls.append(1) or (np.arange(3),))
+    cache.cached("stage", ["key"], lambda counters: calls.append(1) or (np.arange(3),))
+
+    assert len(calls) == 2 and np.array_equal(arrays[0], np.arange(3))
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+
+    root = tmp_path / "cache"
+    cache = StageCache(root=str(root), max_bytes=1 << 40)
+    for k, key in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put(key, (np.zeros(1000),), {})
+        os.utime(cache.path(key), ns=(k * 10 ** 9, k * 10 ** 9))
+    in_progress = cache.path("aa4") + ".tmp-1"
+    with open(in_progress, "wb") as f:
+        f.write(b"x" * 100000)
+
+    cache.get("aa1") # refreshes aa1
+    cache.max_bytes = 2 * os.path.getsize(cache.path("aa1"))
+    cache.evict()
+
+    assert not os.path.exists(cache.path("bb2"))
+    assert os.path.exists(cache.path("aa1")) and os.path.exists(cache.path("cc3"))
+    assert os.path.exists(in_progress)
@@ -0,0 +1,74 @@
+#-*- coding: utf-8 -*-
+
+import pytest
+
+import reference
+import translations4wsd_mwsd
+from t4wsd.cache import StageCache, cached_lemma_sense_distributions
+from t4wsd.priors import read_lemma_sense_distributions
+
+# lexemes_distributions.bnid.txt: lemma#pos, then bn_id#probability (a sense without a probability gets 1.0)
+DISTRIBUTIONS = """plan#n\tbn:14691922n#0.6\tbn:00053303n#0.3\tbn:00062759n#0.1
+pose#n\tbn:05474810n
+klimakonferenz#n\tbn:13884479n#1.0
+plan#v\tbn:00088460v#0.7\tbn:00088461v#0.3
+veröffentlichung#n\tbn:00065106n#0.5\tbn:00067023n#0.5
+freitag#n\tbn:05436956n#0.9\tbn:00036512n#0.1
+"""
+
+# the instances need plan n, pose n, veröffentlichung n and dokument n (not in the distributions)
+LEMMA_MAP = """d001.s001.t001\tplan n\tbn:14691922n bn:00053303n
+d001.s002.t002\tpose n\tbn:05474810n
+d001.s002.t004\tveröffentlichung n\tbn:00065106n
+d001.s002.t005\tdokument n\tbn:00028017n
+d001.s003.t001\tplan n\tbn:14691922n
+"""
+
+
+@pytest.fixture
+def clubert(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    file_path = tmp_path / "lexemes_distributions.bnid.txt"
+    file_path.write_text(DISTRIBUTIONS, encoding="utf-8")
+    lemma_map_path = tmp_path / "lemma_bnsyn_mapping.txt"
+    lemma_map_path.write_text(LEMMA_MAP, encoding="utf-8")
+    return str(file_path), str(lemma_map_path)
+
+
+def test_filtered_parse_keeps_only_the_lemma_map(clubert):
+
+    file_path, lemma_map_path = clubert
+    lemma_pos_set = set(translations4wsd_mwsd.load_id_lemma_map(lemma_map_path).values())
+    full = read_lemma_sense_distributions(file_path)
+    filtered = read_lemma_sense_distributions(file_path, lemma_pos_set)
+
+    assert dict(filtered) == {lemma_pos: full[lemma_pos] for lemma_pos in lemma_pos_set if lemma_pos in full}
+    assert set(filtered) == {"plan n", "pose n", "veröffentlichung n"}
+    assert filtered["pose n"] == {"bn:05474810n": 1.0}
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_instance_p_freq_matches_reference(clubert, tmp_path, use_cache):
+
+    file_path, lemma_map_path = clubert
+    cache = StageCache(root=str(tmp_path / "cache")) if use_cache else None
+    id_lemma_map = translations4wsd_mwsd.load_id_lemma_map(lemma_map_path)
+    expected = reference.load_clubert_p_freq(file_path, lemma_map_path)
+
+    assert translations4wsd_mwsd.get_p_freq(file_path, id_lemma_map, cache) == expected
+    assert translations4wsd_mwsd.get_p_freq(file_path, id_lemma_map, cache) == expected # a cache hit the second time
+
+
+def test_cached_distributions_are_kept_per_lemma_map(clubert, tmp_path):
+
+    file_path, lemma_map_path = clubert
+    cache = StageCache(root=str(tmp_path / "cache"))
+    counters = {}
+    first = cached_lemma_sense_distributions(cache, file_path, {"plan n", "pose n"}, counters)
+    second = cached_lemma_sense_distributions(cache, file_path, {"pose n", "plan n"}, counters)
+    other = cached_lemma_sense_distributions(cache, file_path, {"plan v"}, counters)
+
+    assert counters == {"cache_misses.lemma_sense_distributions": 2, "cache_hits.lemma_sense_distributions": 1}
+    assert dict(first) == dict(second) == dict(read_lemma_sense_distributions(file_path, {"plan n", "pose n"}))
+    assert dict(other) == {"plan v": {"bn:00088460v": 0.7, "bn:00088461v": 0.3}}
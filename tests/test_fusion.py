@@ -0,0 +1,64 @@
+#-*- coding: utf-8 -*-
+
+import numpy as np
+
+import translations4wsd
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.fusion import MISSING_P_WSD, align, fusion_decisions
+from t4wsd.scoring import Batch, answers, soft_decisions
+from t4wsd.vocab import Vocab
+
+EN_LANGS = ["FR", "DE", "RU"]
+
+
+def toy_batch(vocab, ranked):
+
+    # {i_id: [(sense, score), ...]} -> Batch
+    offsets = [0]
+    senses = []
+    scores = []
+    for i_id, sense_scores in ranked.items():
+        senses.extend(vocab.intern(sense) for sense, _ in sense_scores)
+        scores.extend(score for _, score in sense_scores)
+        offsets.append(len(senses))
+
+    return Batch(list(ranked), offsets, senses, scores, vocab)
+
+
+def test_align_unions_candidates():
+
+    vocab = Vocab()
+    first = toy_batch(vocab, {"d.1": [("a%1", 0.7), ("b%1", 0.3)], "d.2": [("c%1", float("nan"))]})
+    second = toy_batch(vocab, {"d.1": [("b%1", 0.6), ("e%1", 0.4)], "d.3": [("f%1", 1.0)]})
+    fused, p_wsd = align([first, second])
+
+    assert fused.ids == ["d.1", "d.2", "d.3"]
+    assert [item for item in fused.items()] == [("d.1", [["a%1", 0.7], ["b%1", 0.3], ["e%1", MISSING_P_WSD]]),
+                                                ("d.2", [["c%1", 1.0]]), ("d.3", [["f%1", 1.0]])]
+    # second system: fill for a%1 it does not rank, 1 on d.2 it does not cover; first system: 1 on d.2 (no number), d.3
+    assert p_wsd[1].tolist() == [MISSING_P_WSD, 0.6, 0.4, 1.0, 1.0]
+    assert p_wsd[0].tolist() == [0.7, 0.3, MISSING_P_WSD, 1.0, 1.0]
+
+
+def test_second_system_moves_the_answer():
+
+    vocab = Vocab()
+    first = toy_batch(vocab, {"d.1": [("a%1", 0.55), ("b%1", 0.45)]})
+    second = toy_batch(vocab, {"d.1": [("b%1", 0.9), ("a%1", 0.1)]})
+    fused, p_wsd = align([first, second])
+    unconstrained = [ConstraintIndex.from_lists(fused.ids, [None], vocab=vocab)]
+
+    assert answers(fused, fusion_decisions(fused, p_wsd, unconstrained, None, [0.5, 0.5], 0.5, None, 0.1)) == [("d.1", "b%1")]
+    assert answers(fused, fusion_decisions(fused, p_wsd, unconstrained, None, [1.0, 0.0], 0.5, None, 0.1)) == [("d.1", "a%1")]
+
+
+def test_single_system_matches_soft_decisions():
+
+    parameters = translations4wsd.PARAMETERS["ukb_plain"]
+    a, b, smoothing = parameters["a"], parameters["b"], parameters["t_smoothing"]
+    batch = translations4wsd.get_p_wsd("ukb_plain", "ALL")
+    indexes = [translations4wsd.load_trans_sense_constraint("ALL", lang) for lang in EN_LANGS]
+    fused, p_wsd = align([batch])
+
+    assert np.array_equal(fusion_decisions(fused, p_wsd, indexes, None, [a], b, None, smoothing),
+                          soft_decisions(batch, indexes, None, a, b, None, smoothing))
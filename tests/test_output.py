@@ -0,0 +1,74 @@
+#-*- coding: utf-8 -*-
+
+import io
+import json
+import os
+
+import pytest
+
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.output import AtomicWriter, StdoutWriter, jsonl_path, soft_details, write_details, write_predictions
+from t4wsd.readers import iter_lines
+from t4wsd.scoring import Batch, language_masks, soft_decisions
+from t4wsd.vocab import Vocab
+
+PREDICTIONS = [("d%03d" % k, "s%1:0" + str(k % 7)) for k in range(10)]
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".xz", ".bz2"])
+def test_atomic_writer_round_trip(tmp_path, suffix):
+
+    out_path = str(tmp_path / ("pred.out" + suffix))
+    with AtomicWriter(out_path, buffer_lines=3) as newf:
+        write_predictions(newf, PREDICTIONS)
+        assert not os.path.exists(out_path) # nothing is visible before the commit
+
+    assert list(iter_lines(out_path)) == [i_id + " " + sense for i_id, sense in PREDICTIONS]
+    assert os.listdir(str(tmp_path)) == ["pred.out" + suffix]
+
+
+def test_atomic_writer_keeps_old_output_on_error(tmp_path):
+
+    out_path = tmp_path / "pred.out"
+    out_path.write_text("old\n")
+    with pytest.raises(RuntimeError):
+        with AtomicWriter(str(out_path), buffer_lines=1) as newf:
+            write_predictions(newf, PREDICTIONS)
+            raise RuntimeError("crash")
+
+    assert out_path.read_text() == "old\n"
+    assert os.listdir(str(tmp_path)) == ["pred.out"]
+
+
+def test_stdout_writer_leaves_stream_open():
+
+    stream = io.BytesIO()
+    with StdoutWriter(stream) as newf:
+        newf.write("d.1 é%1\n")
+
+    assert not stream.closed and stream.getvalue() == "d.1 é%1\n".encode("utf-8")
+
+
+def test_jsonl_path():
+
+    assert jsonl_path("outputs/ALL.ims.soft.out") == "outputs/ALL.ims.soft.out.jsonl"
+    assert jsonl_path("outputs/ALL.ims.soft.out.gz") == "outputs/ALL.ims.soft.out.jsonl.gz"
+
+
+def test_write_details():
+
+    # d.1: FR keeps b%1 only; d.2 has no ranked senses; d.3 has no base score
+    vocab = Vocab()
+    batch = Batch(["d.1", "d.2", "d.3"], [0, 2, 2, 3], [vocab.intern(s) for s in ["a%1", "b%1", "c%1"]], [0.6, 0.4, float("nan")], vocab)
+    indexes = [ConstraintIndex.from_lists(batch.ids, [["b%1"], None, None], vocab=vocab)]
+    masks = language_masks(batch, indexes)
+    best = soft_decisions(batch, indexes, None, 0.5, 0.5, None, 0.1)
+
+    newf = io.StringIO()
+    write_details(newf, batch, best, ["FR"], masks, soft_details(batch, indexes, None, 0.5, 0.5, None, 0.1, masks=masks))
+    rows = [json.loads(line) for line in newf.getvalue().splitlines()]
+
+    assert [row["answer"] for row in rows] == ["b%1", None, "c%1"]
+    assert [sense["languages"] for sense in rows[0]["senses"]] == [[], ["FR"]]
+    assert sum(sense["p"] for sense in rows[0]["senses"]) == pytest.approx(1.0)
+    assert rows[1]["senses"] == [] and rows[2]["senses"][0]["p_wsd"] is None
@@ -0,0 +1,70 @@
+#-*- coding: utf-8 -*-
+
+import pytest
+
+import reference
+from t4wsd.priors import PriorStore, top_sense_p_freq
+from t4wsd.scoring import Batch
+from t4wsd.vocab import Vocab
+
+# index.sense lines (sense_key synset_offset sense_number tag_cnt), not sorted by lemma_pos; bank%1:14:00:: is
+# repeated (keeps its position and its last count), fast%5 is a satellite adjective, fast%4 an adverb with count 0
+INDEX_SENSE = """bank%1:17:01:: 09213565 1 25
+run%2:38:00:: 01926311 1 11
+bank%1:14:00:: 08420278 2 20
+bank%2:40:00:: 02312478 1 2
+fast%5:00:00:quick:00 00976508 1 9
+fast%3:00:01:: 00978754 2 3
+bank%1:14:00:: 08420278 2 21
+fast%4:02:00:: 00086000 1 0
+run%2:38:04:: 01927447 2 7
+"""
+
+
+@pytest.fixture
+def index_sense(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    file_path = tmp_path / "index.sense"
+    file_path.write_text(INDEX_SENSE)
+    return str(file_path)
+
+
+@pytest.mark.parametrize("smoothing", [0.01, 0.5])
+def test_smoothed_priors_match_reference(index_sense, smoothing):
+
+    expected = reference.load_wordnet_p_freq(index_sense, smoothing)
+    priors = PriorStore.load(index_sense).smoothed(smoothing)
+
+    for lemma_pos, sense_freq in expected.items():
+        assert lemma_pos in priors
+        assert list(priors[lemma_pos].items()) == list(sense_freq.items())
+    assert "walk v" not in priors and priors.get("walk v") is None
+    assert PriorStore.load(index_sense).find_many(["run v", "walk v", "bank n", "fast a"]).tolist() == [4, -1, 0, 2]
+
+
+@pytest.mark.parametrize("smoothing", [0.01, 0.5])
+def test_top_sense_p_freq_matches_reference(index_sense, smoothing):
+
+    # p_freq from the lemma_pos of the top sense; one-sense instances and unknown lemma_pos get 0
+    ranked = [["bank%1:14:00::", "bank%1:17:01::", "bank%2:40:00::"],
+              ["fast%5:00:00:quick:00", "fast%3:00:01::", "fast%4:02:00::", "bank%1:14:00::"],
+              ["run%2:38:04::"],
+              ["walk%2:38:00::", "run%2:38:00::"],
+              ["run%2:38:00::", "run%2:38:99::"]]
+    vocab = Vocab()
+    offsets = [0]
+    sense_ids = []
+    for senses in ranked:
+        sense_ids.extend(vocab.intern(s) for s in senses)
+        offsets.append(len(sense_ids))
+    batch = Batch(["d." + str(k) for k in range(len(ranked))], offsets, sense_ids, [0.5] * len(sense_ids), vocab)
+
+    expected_freq = reference.load_wordnet_p_freq(index_sense, smoothing)
+    expected = []
+    for senses in ranked:
+        sense_freq = expected_freq.get(reference.sense_lemma_pos(senses[0]), {}) if len(senses) > 1 else {}
+        expected.extend(sense_freq.get(sense, 0.0) for sense in senses)
+
+    assert top_sense_p_freq(batch, PriorStore.load(index_sense).smoothed(smoothing)).tolist() == expected
+    assert top_sense_p_freq(batch, expected_freq).tolist() == expected
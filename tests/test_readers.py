@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+
+import bz2
+import gzip
+import lzma
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import reference
+from t4wsd import bundle
+from t4wsd.readers import compression_of, file_compression, glob_sources, iter_lines, resolve_path, zstandard
+from t4wsd.stream import line_key
+
+BASE = "base_outputs/ALL.ukb_plain.ranked.out"
+
+COMPRESSORS = [("gz", gzip.compress), ("xz", lzma.compress), ("bz2", bz2.compress),
+               pytest.param("zst", lambda data: zstandard.ZstdCompressor().compress(data),
+                            marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed"))]
+
+
+def base_bytes():
+
+    with open(BASE, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("compression,compress", COMPRESSORS)
+def test_compressed_source_round_trip(tmp_path, monkeypatch, compression, compress):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    file_path = str(tmp_path / "ALL.ukb_plain.ranked.out")
+    with open(file_path + "." + compression, "wb") as f:
+        f.write(compress(base_bytes()))
+
+    # the plain name resolves to the stored file, which is recognized by its magic bytes
+    assert resolve_path(file_path) == file_path + "." + compression
+    assert glob_sources(str(tmp_path / "ALL.*.ranked.out")) == [file_path]
+    assert file_compression(file_path) == compression
+    assert list(iter_lines(file_path)) == list(iter_lines(BASE))
+
+    compressed_table = bundle.load_ranked(file_path)
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "plain_bundle"))
+    plain_table = bundle.load_ranked(BASE)
+    assert compressed_table.ids.tolist() == plain_table.ids.tolist()
+    assert compressed_table.vocab.tolist() == plain_table.vocab.tolist()
+    assert np.array_equal(compressed_table.senses, plain_table.senses)
+    assert np.array_equal(compressed_table.scores, plain_table.scores, equal_nan=True)
+
+
+@pytest.mark.parametrize("compression,compress", COMPRESSORS)
+def test_compressed_file_without_suffix(tmp_path, compression, compress):
+
+    file_path = tmp_path / "ranked.txt"
+    file_path.write_bytes(compress("d.1\tä%1 0.5\nd.2\tb%1\n".encode("utf-8")))
+
+    assert compression_of(file_path.read_bytes()[:6]) == compression
+    assert list(iter_lines(str(file_path))) == ["d.1\tä%1 0.5", "d.2\tb%1"]
+
+
+def test_plain_file_has_no_compression():
+
+    assert file_compression(BASE) is None
+
+
+def run_stream(input_path, stdin_bytes=None):
+
+    command = [sys.executable, "translations4wsd.py", "-s", "ukb_plain", "-t", "semeval2007", "-m", "hard", "--stream", "-i", input_path]
+    return subprocess.run(command, input=stdin_bytes, stdout=subprocess.PIPE, check=True).stdout
+
+
+@pytest.mark.parametrize("compression,compress", COMPRESSORS)
+def test_stream_reads_compressed_stdin(tmp_path, compression, compress):
+
+    # --stream -i - decompresses stdin like a file, by its magic bytes
+    sorted_lines = "".join(line + "\n" for line in sorted(reference.read_lines(BASE), key=line_key))
+    plain_path = tmp_path / "sorted.out"
+    plain_path.write_text(sorted_lines, encoding="utf-8")
+    expected = run_stream(str(plain_path))
+
+    assert expected
+    assert run_stream("-", compress(sorted_lines.encode("utf-8"))) == expected
+    assert run_stream("-", sorted_lines.encode("utf-8")) == expected
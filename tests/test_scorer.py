@@ -0,0 +1,108 @@
+#-*- coding: utf-8 -*-
+
+import codecs
+
+import pytest
+
+from t4wsd.scorer import ScorerError, evaluate, format_scores, java_percent, load_key, merge_counts, score, score_counts, scores_from_counts
+
+GOLD = {"d.1": {"a%1", "b%1"}, "d.2": {"c%1"}, "d.3": {"d%1"}, "d.4": {"e%1"}}
+
+# P / R / F1 of the committed prediction files, pinned so a scorer change shows up as a diff
+OUTPUTS = [
+    ("outputs/ALL.babelfy_full.hard.out", "gold_keys/ALL.gold.key.txt", "64.9", "64.9", "64.9"),
+    ("outputs/ALL.babelfy_full.soft.out", "gold_keys/ALL.gold.key.txt", "65.4", "65.4", "65.4"),
+    ("outputs/ALL.babelfy_plain.hard.out", "gold_keys/ALL.gold.key.txt", "56.0", "49.1", "52.3"),
+    ("outputs/ALL.babelfy_plain.soft.out", "gold_keys/ALL.gold.key.txt", "61.4", "53.7", "57.3"),
+    ("outputs/ALL.ims.hard.out", "gold_keys/ALL.gold.key.txt", "67.1", "67.1", "67.1"),
+    ("outputs/ALL.ims.soft.out", "gold_keys/ALL.gold.key.txt", "69.0", "69.0", "69.0"),
+    ("outputs/ALL.lmms.hard.out", "gold_keys/ALL.gold.key.txt", "73.6", "73.6", "73.6"),
+    ("outputs/ALL.lmms.soft.out", "gold_keys/ALL.gold.key.txt", "76.4", "76.4", "76.4"),
+    ("outputs/ALL.ukb_full.hard.out", "gold_keys/ALL.gold.key.txt", "66.1", "66.1", "66.1"),
+    ("outputs/ALL.ukb_full.soft.out", "gold_keys/ALL.gold.key.txt", "68.9", "68.9", "68.9"),
+    ("outputs/ALL.ukb_plain.hard.out", "gold_keys/ALL.gold.key.txt", "61.5", "61.5", "61.5"),
+    ("outputs/ALL.ukb_plain.soft.out", "gold_keys/ALL.gold.key.txt", "64.0", "64.0", "64.0"),
+    ("mwsd_outputs/semeval2013.de.ims.soft.clubert.tst.out", "mwsd_gold_keys/semeval2013_de.gold.tst.key", "83.9", "65.9", "73.8"),
+    ("mwsd_outputs/semeval2013.de.sensembert.soft.clubert.temb.tst.out", "mwsd_gold_keys/semeval2013_de.gold.tst.key", "80.4", "78.8", "79.6"),
+    ("mwsd_outputs/semeval2015.es.ims.soft.clubert.tst.out", "mwsd_gold_keys/semeval2015_es.gold.tst.key", "76.3", "63.1", "69.1"),
+    ("mwsd_outputs/semeval2015.it.sensembert.soft.clubert.temb.tst.out", "mwsd_gold_keys/semeval2015_it.gold.tst.key", "81.3", "76.2", "78.7"),
+]
+
+
+def read_predictions(out_path):
+
+    with codecs.open(out_path, "r", encoding="utf-8") as f:
+        return [(fields[0], fields[1:]) for fields in (line.rstrip("\n").split(" ") for line in f)]
+
+
+@pytest.mark.parametrize("out_path,key_file,precision,recall,f1", OUTPUTS)
+def test_committed_outputs(out_path, key_file, precision, recall, f1):
+
+    assert evaluate(key_file, read_predictions(out_path)) == "P=\t" + precision + "%\nR=\t" + recall + "%\nF1=\t" + f1 + "%"
+
+
+def test_answers_with_several_senses_count_fractionally():
+
+    # d.1: one of two senses right (1/2 ok, 1/2 notok), d.2: both right, d.3: wrong, d.4: not answered
+    predictions = [("d.1", ["a%1", "x%1"]), ("d.2", "c%1"), ("d.3", ["x%1"])]
+    ok, notok, n_gold = score_counts(GOLD, predictions)
+
+    assert (ok, notok, n_gold) == (1.5, 1.5, 4)
+    assert scores_from_counts(ok, notok, n_gold) == score(GOLD, dict(predictions))
+    assert format_scores(*score(GOLD, predictions)) == "P=\t50.0%\nR=\t37.5%\nF1=\t42.9%"
+
+
+def test_answers_are_sets_per_id():
+
+    # like Scorer.java: d.1 answered on two lines is one answer {a%1, x%1}, a repeated sense counts once
+    predictions = [("d.1", "a%1"), ("d.2", ["c%1", "c%1"]), ("d.1", ["x%1", "a%1"]), ("d.3", ["x%1", "x%1", "d%1"])]
+
+    assert score_counts(GOLD, predictions) == score_counts(GOLD, [("d.1", ["a%1", "x%1"]), ("d.2", "c%1"), ("d.3", ["x%1", "d%1"])])
+    assert score_counts(GOLD, predictions) == (2.0, 1.0, 4)
+
+
+def test_repeated_gold_ids_are_united(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    key_path = tmp_path / "repeated.gold.key.txt"
+    key_path.write_text("d.1 a%1\nd.2 c%1\nd.1 b%1\n")
+    gold = load_key(str(key_path))
+
+    assert gold == {"d.1": {"a%1", "b%1"}, "d.2": {"c%1"}}
+    assert score_counts(gold, [("d.1", "a%1"), ("d.2", "c%1")]) == (2.0, 0.0, 2)
+    assert score_counts(gold, [("d.1", "b%1")]) == (1.0, 0.0, 2)
+
+
+def test_counts_of_parts_add_up():
+
+    parts = [[("d.1", ["a%1", "x%1"])], [("d.2", "c%1"), ("d.3", "x%1")]]
+    merged = merge_counts([score_counts({i_id: GOLD[i_id] for i_id, _ in part}, part) for part in parts])
+
+    assert merged == (1.5, 1.5, 3)
+
+
+def test_java_rounding():
+
+    # String.format("%.1f") rounds the shortest decimal form half up: 12.25 -> 12.3 (Python's "%.1f" gives 12.2)
+    assert java_percent(0.1225) == "12.3"
+    assert java_percent(0.0005) == "0.1"
+    assert java_percent(0.99995) == "100.0"
+    assert java_percent(2 / 3) == "66.7"
+
+
+def test_no_answers_divide_to_nan():
+
+    # 0 / 0 is NaN in Java, and String.format prints it as NaN
+    assert format_scores(*score(GOLD, [])) == "P=\tNaN%\nR=\t0.0%\nF1=\tNaN%"
+
+
+def test_unknown_instance(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    key_path = tmp_path / "gold.key.txt"
+    key_path.write_text("d.1 a%1 b%1\nd.2 c%1\n")
+
+    assert load_key(str(key_path)) == {"d.1": {"a%1", "b%1"}, "d.2": {"c%1"}}
+    with pytest.raises(ScorerError):
+        score_counts(load_key(str(key_path)), [("d.1", "a%1"), ("x.1", "a%1")])
+    assert evaluate(str(key_path), [("d.1", "a%1"), ("x.1", "a%1")]) == "Sense key 'x.1' not present in the gold standard file."
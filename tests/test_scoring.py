@@ -0,0 +1,134 @@
+#-*- coding: utf-8 -*-
+
+import functools
+import os
+
+import pytest
+
+import reference
+import translations4wsd
+import translations4wsd_mwsd
+from conftest import needs
+from t4wsd.scoring import hard_decisions, soft_decisions, answers
+
+EN_SYSTEMS = ["babelfy_plain", "babelfy_full", "ukb_plain", "ukb_full", "ims", "lmms"]
+EN_TESTS = ["ALL", "senseval2", "senseval3", "semeval2007", "semeval2013", "semeval2015"]
+EN_LANGS = ["FR", "DE", "RU"]
+MWSD_SYSTEMS = ["ims", "sensembert", "sensembert.temb"]
+MWSD_CASES = [("semeval2013", "de"), ("semeval2013", "es"), ("semeval2013", "fr"), ("semeval2013", "it"),
+              ("semeval2015", "es"), ("semeval2015", "it")]
+MWSD_TYPES = ["dev", "tst", "all"]
+
+
+# --- reference inputs, parsed once ---
+
+@functools.lru_cache(maxsize=None)
+def en_reference_base(system, test):
+    return reference.load_ranked(["base_outputs/ALL." + system + ".ranked.out"], test)
+
+
+@functools.lru_cache(maxsize=None)
+def en_reference_mappings(test):
+    return tuple(reference.load_mapping(translations4wsd.MAPPING_NAMES[lang], 5, test) for lang in EN_LANGS)
+
+
+@functools.lru_cache(maxsize=None)
+def wordnet_p_freq(smoothing):
+    return reference.load_wordnet_p_freq("index.sense", smoothing)
+
+
+@functools.lru_cache(maxsize=None)
+def mwsd_reference_mappings(test, lang):
+    return tuple(reference.load_mapping(path, 4) for path in translations4wsd_mwsd.get_mapping_path_list(test, lang))
+
+
+@functools.lru_cache(maxsize=None)
+def clubert_p_freq(test, lang):
+    return reference.load_clubert_p_freq(clubert_path(lang), lemma_map_path(test, lang))
+
+
+def clubert_path(lang):
+    return "clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt"
+
+
+def lemma_map_path(test, lang):
+    return "mwsd_mappings/" + test + "_" + lang + "_lemma_bnsyn_mapping.txt"
+
+
+# --- the engine on the real base outputs against the original loops ---
+
+@pytest.mark.parametrize("test", EN_TESTS)
+@pytest.mark.parametrize("system", EN_SYSTEMS)
+def test_hard_matches_reference(system, test):
+
+    batch = translations4wsd.get_p_wsd(system, test)
+    indexes = [translations4wsd.load_trans_sense_constraint(test, lang) for lang in EN_LANGS]
+    engine = dict(answers(batch, hard_decisions(batch, indexes)))
+
+    expected = reference.hard_constraint(en_reference_base(system, test), reference.get_intersect(en_reference_mappings(test)))
+    assert engine == expected
+
+
+@pytest.mark.parametrize("test", EN_TESTS)
+@pytest.mark.parametrize("system", [pytest.param(system, marks=needs("index.sense")) if translations4wsd.PARAMETERS[system]["c"] else system
+                                    for system in EN_SYSTEMS])
+def test_soft_matches_reference(system, test):
+
+    parameters = translations4wsd.PARAMETERS[system]
+    a, b, c, smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+    batch = translations4wsd.get_p_wsd(system, test)
+    indexes = [translations4wsd.load_trans_sense_constraint(test, lang) for lang in EN_LANGS]
+    if c:
+        p_freq = translations4wsd.get_pair_p_freq(batch, translations4wsd.get_p_freq(parameters["s_smoothing"]))
+        sense_freq = wordnet_p_freq(parameters["s_smoothing"])
+        sense_freq_of = lambda i_id, top_sense: sense_freq[reference.sense_lemma_pos(top_sense)]
+    else:
+        p_freq = None
+        sense_freq_of = None
+    engine = dict(answers(batch, soft_decisions(batch, indexes, p_freq, a, b, c, smoothing)))
+
+    expected = reference.soft_constraint(en_reference_base(system, test), en_reference_mappings(test), sense_freq_of, a, b, c, smoothing)
+    assert engine == expected
+
+
+@pytest.mark.parametrize("t_type", MWSD_TYPES)
+@pytest.mark.parametrize("test,lang", MWSD_CASES)
+@pytest.mark.parametrize("system", MWSD_SYSTEMS)
+def test_mwsd_hard_matches_reference(system, test, lang, t_type):
+
+    batch = translations4wsd_mwsd.get_p_wsd(system, test, lang, t_type)
+    paths = translations4wsd_mwsd.get_mapping_path_list(test, lang)
+    indexes = [translations4wsd_mwsd.load_trans_sense_constraint(test, path) for path in paths]
+    engine = dict(answers(batch, hard_decisions(batch, indexes)))
+
+    base = reference.load_ranked(translations4wsd_mwsd.get_base_path_list(system, test, lang, t_type))
+    expected = reference.hard_constraint(base, reference.get_intersect(mwsd_reference_mappings(test, lang)))
+    assert engine == expected
+
+
+@pytest.mark.parametrize("clubert", [False, True])
+@pytest.mark.parametrize("t_type", MWSD_TYPES)
+@pytest.mark.parametrize("test,lang", MWSD_CASES)
+@pytest.mark.parametrize("system", MWSD_SYSTEMS)
+def test_mwsd_soft_matches_reference(system, test, lang, t_type, clubert):
+
+    if clubert and not os.path.exists(clubert_path(lang)):
+        pytest.skip("missing " + clubert_path(lang))
+    parameters = translations4wsd_mwsd.PARAMETERS[system + (".clubert" if clubert else "")][test + " " + lang.upper()]
+    a, b, c, smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+    batch = translations4wsd_mwsd.get_p_wsd(system, test, lang, t_type)
+    paths = translations4wsd_mwsd.get_mapping_path_list(test, lang)
+    indexes = [translations4wsd_mwsd.load_trans_sense_constraint(test, path) for path in paths]
+    if clubert:
+        sense_freq_dict = translations4wsd_mwsd.get_p_freq(clubert_path(lang), translations4wsd_mwsd.load_id_lemma_map(lemma_map_path(test, lang)))
+        p_freq = translations4wsd_mwsd.get_pair_p_freq(batch, sense_freq_dict)
+        sense_freq = clubert_p_freq(test, lang)
+        sense_freq_of = lambda i_id, top_sense: sense_freq[i_id]
+    else:
+        p_freq = None
+        sense_freq_of = None
+    engine = dict(answers(batch, soft_decisions(batch, indexes, p_freq, a, b, c, smoothing, zero_sum_one=True)))
+
+    base = reference.load_ranked(translations4wsd_mwsd.get_base_path_list(system, test, lang, t_type))
+    expected = reference.soft_constraint(base, mwsd_reference_mappings(test, lang), sense_freq_of, a, b, c, smoothing, zero_sum_one=True)
+    assert engine == expected
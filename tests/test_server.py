@@ -0,0 +1,76 @@
+#-*- coding: utf-8 -*-
+
+import http.client
+import json
+import threading
+
+import pytest
+
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.readers import is_sense_key
+from t4wsd.server import SoftModel, make_server
+
+
+@pytest.fixture
+def server():
+
+    # FR constrains d.1 to b%1; a micro-batching server on a free port
+    fr = ConstraintIndex.from_lists(["d.1", "d.2"], [["b%1"], None])
+    model = SoftModel(["FR"], [fr], 0.5, 0.5, None, 0.1, is_sense=is_sense_key)
+    server = make_server(model, port=0, max_wait=0.001)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, obj):
+
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    body = obj if isinstance(obj, bytes) else json.dumps(obj).encode("utf-8")
+    connection.request("POST", "/disambiguate", body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read().decode("utf-8"))
+    connection.close()
+
+    return result
+
+
+def test_answers_with_loaded_and_request_candidates(server):
+
+    status, result = post(server, {"instances": [
+        {"line": "d.1\ta%1 0.6\tb%1 0.4"},
+        {"id": "d.2", "senses": [["a%1", 0.6], ["b%1", 0.4]]},
+        {"id": "x.1", "senses": [["a%1", 0.6], ["b%1", 0.4]], "candidates": {"FR": ["b%1"]}}]})
+
+    assert status == 200
+    assert result == {"answers": [{"id": "d.1", "sense": "b%1"}, {"id": "d.2", "sense": "a%1"}, {"id": "x.1", "sense": "b%1"}]}
+
+
+@pytest.mark.parametrize("obj", [
+    b"{not json",
+    {"line": 5},
+    {"instances": 5},
+    {"instances": [5]},
+    {"id": "d.1", "senses": "a%1"},
+    {"id": "d.1", "senses": [[5, 0.5]]},
+    {"id": "d.1", "senses": [["a%1", "high"]]},
+    {"id": 1, "senses": [["a%1", 0.5]]},
+    {"id": "d.1", "senses": []},
+    {"id": "d.1", "senses": [["a%1", 0.5]], "candidates": 5},
+    {"id": "d.1", "senses": [["a%1", 0.5]], "candidates": {"FR": 5}},
+    {"id": "d.1", "senses": [["a%1", 0.5]], "candidates": [["b%1", 3]]},
+    {"id": "d.1", "senses": [["foo", 0.5], ["bar%1:01:00::", 0.4]]},
+    {"id": "d.1", "senses": [["x%", 0.5], ["bar%1:01:00::", 0.4]]},
+    {"line": "d.1\tx%9:01:00:: 0.5\tbar%1:01:00:: 0.4"},
+])
+def test_malformed_requests_get_400(server, obj):
+
+    status, result = post(server, obj)
+    assert status == 400
+    assert "error" in result
+
+    # the server keeps answering
+    status, result = post(server, {"line": "d.1\ta%1 0.6\tb%1 0.4"})
+    assert (status, result) == (200, {"id": "d.1", "sense": "b%1"})
@@ -0,0 +1,42 @@
+#-*- coding: utf-8 -*-
+
+import os
+
+import translations4wsd
+from t4wsd import shard
+from t4wsd.readers import iter_lines
+from t4wsd.scorer import load_key, score_counts
+from t4wsd.scoring import answers, hard_decisions
+
+EN_LANGS = ["FR", "DE", "RU"]
+
+
+def test_shards_hold_whole_documents(tmp_path):
+
+    paths = shard.split(".", str(tmp_path / "shards"), 3)
+    documents = [set(shard.document_of(line.split("\t", 1)[0]) for line in iter_lines(os.path.join(shard_path, "base_outputs/ALL.ims.ranked.out")))
+                 for shard_path in paths]
+
+    assert sum(len(d) for d in documents) == len(set.union(*documents))
+    assert all(shard.shard_of(document, 3) == k for k, d in enumerate(documents) for document in d)
+    assert paths == shard.split(".", str(tmp_path / "shards"), 3) # kept while the sources do not change
+
+
+def test_merged_shards_match_unsharded_run(tmp_path):
+
+    paths = shard.split(".", str(tmp_path / "shards"), 3)
+    command = shard.shard_command("translations4wsd.py", ["-s", "ukb_plain", "-t", "semeval2007", "-m", "hard", "-o", "sharded.out"])
+    for shard_path in paths:
+        assert shard.run_shard(shard_path, command, os.path.join(shard_path, "sharded.out.log")) == 0
+    merged_path = str(tmp_path / "sharded.out")
+    merged = shard.merge([os.path.join(shard_path, "outputs", "sharded.out") for shard_path in paths], merged_path)
+
+    batch = translations4wsd.get_p_wsd("ukb_plain", "semeval2007")
+    indexes = [translations4wsd.load_trans_sense_constraint("semeval2007", lang) for lang in EN_LANGS]
+    predictions = answers(batch, hard_decisions(batch, indexes))
+    ok, notok, n_gold = score_counts(load_key("gold_keys/semeval2007.gold.key.txt"), predictions)
+
+    assert sorted(iter_lines(merged_path)) == sorted(i_id + " " + sense for i_id, sense in predictions)
+    assert merged["shards"] == 3
+    assert merged["score"]["gold"] == n_gold
+    assert abs(merged["score"]["ok"] - ok) < 1e-9 and abs(merged["score"]["notok"] - notok) < 1e-9
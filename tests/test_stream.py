@@ -0,0 +1,73 @@
+#-*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+import pytest
+
+import reference
+import translations4wsd
+from t4wsd.scoring import answers, hard_decisions, soft_decisions
+from t4wsd.stream import line_key, mapping_records, merge_join, ranked_records, rerank_stream
+
+EN_LANGS = ["FR", "DE", "RU"]
+
+
+def sorted_base_lines(system):
+
+    return sorted(reference.read_lines("base_outputs/ALL." + system + ".ranked.out"), key=line_key)
+
+
+def test_merge_join():
+
+    records = [("a", 1), ("b", 2), ("b", 3), ("d", 4)]
+    side = [("a", "x"), ("c", "y"), ("d", "z1"), ("d", "z2")]
+
+    assert list(merge_join(records, [side, []])) == [("a", 1, ["x", None]), ("b", 2, [None, None]), ("b", 3, [None, None]),
+                                                     ("d", 4, ["z2", None])]
+    with pytest.raises(ValueError):
+        list(merge_join([("b", 1), ("a", 2)], [side]))
+
+
+@pytest.mark.parametrize("method", ["hard", "soft"])
+def test_stream_matches_batch(method):
+
+    # ukb_plain needs no index.sense; batches of 500 cross data set and document boundaries
+    parameters = translations4wsd.PARAMETERS["ukb_plain"]
+    a, b, smoothing = parameters["a"], parameters["b"], parameters["t_smoothing"]
+    lines = sorted_base_lines("ukb_plain")
+    sides = [mapping_records(translations4wsd.get_mapping_name(lang), 5) for lang in EN_LANGS]
+    streamed = list(rerank_stream(ranked_records(lines), sides, method, a, b, None, smoothing, batch_size=500))
+
+    batch = translations4wsd.get_p_wsd("ukb_plain", "ALL")
+    indexes = [translations4wsd.load_trans_sense_constraint("ALL", lang) for lang in EN_LANGS]
+    if method == "hard":
+        best = hard_decisions(batch, indexes)
+    else:
+        best = soft_decisions(batch, indexes, None, a, b, None, smoothing)
+
+    assert [i_id for i_id, _ in streamed] == [line_key(line) for line in lines]
+    assert dict(streamed) == dict(answers(batch, best))
+
+
+def test_stream_skips_instances_without_senses():
+
+    lines = ["x.1\ta%1 0.4\tb%1 0.6", "x.2", "x.3\tc%1 1.0"]
+    streamed = list(rerank_stream(ranked_records(lines), [[("x.1", ["a%1"])]], "hard", batch_size=2))
+
+    assert streamed == [("x.1", "a%1"), ("x.3", "c%1")]
+
+
+def test_stream_to_closed_pipe(tmp_path):
+
+    # a reader that stops after one line (like `| head -1`) ends the script without a traceback
+    input_path = tmp_path / "ALL.ukb_plain.sorted.out"
+    input_path.write_text("".join(line + "\n" for line in sorted_base_lines("ukb_plain")))
+    process = subprocess.Popen([sys.executable, "translations4wsd.py", "-s", "ukb_plain", "-t", "ALL", "-m", "hard", "--stream", "-i", str(input_path)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.stdout.readline().startswith(b"semeval2007.d000.s000.t000 ")
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.wait(timeout=60)
+
+    assert stderr == b""
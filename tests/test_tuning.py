@@ -0,0 +1,64 @@
+#-*- coding: utf-8 -*-
+
+import argparse
+
+import numpy as np
+import pytest
+
+from t4wsd.bundle import load_gold
+from t4wsd.constraints import ConstraintIndex, SENSE_VOCAB
+from t4wsd.scoring import Batch
+from t4wsd.tuning import TuningProblem, add_tune_arguments, parse_values, segment_argmax_2d
+
+
+@pytest.fixture
+def gold(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("T4WSD_BUNDLE", str(tmp_path / "bundle"))
+    key_path = tmp_path / "gold.key.txt"
+    key_path.write_text("d.1 a%1\nd.2 c%1\nd.3 x%1\nd.4 e%1\nd.5 y%1\n")
+    return load_gold(str(key_path))
+
+
+def empty_instance_problem(gold):
+
+    # d.3 (middle) and d.5 (last) have no ranked senses; the constraint on d.4 moves its answer to e%1
+    ids = ["d.1", "d.2", "d.3", "d.4", "d.5"]
+    senses = ["a%1", "b%1", "b%1", "c%1", "d%1", "e%1"]
+    offsets = [0, 2, 4, 4, 6, 6]
+    p_wsd = [0.7, 0.3, 0.6, 0.4, 0.8, 0.2]
+    batch = Batch(ids, offsets, [SENSE_VOCAB.intern(s) for s in senses], p_wsd)
+    index = ConstraintIndex.from_lists(ids, [None, None, None, ["e%1"], None])
+
+    return TuningProblem(batch, [index], gold)
+
+
+def test_segment_argmax_2d_skips_empty_segments():
+
+    scores = np.array([[0.1, 0.9, 0.5, 0.5, 0.2], [0.3, 0.1, 0.2, 0.4, 0.7]])
+    best = segment_argmax_2d(scores, np.array([0, 2, 2, 4, 5, 5]))
+
+    assert best.tolist() == [[1, 0, 0, 0, 0], [0, 0, 1, 0, 0]]
+
+
+def test_tuning_ignores_instances_without_senses(gold):
+
+    problem = empty_instance_problem(gold)
+    point = {"a": 0.5, "b": 0.5, "c": None, "t_smoothing": 0.1, "s_smoothing": None}
+
+    # answers: d.1 a%1 (correct), d.2 b%1, d.4 e%1 (correct); P = 2/3, R = 2/5
+    expected = 2 * (2 / 3) * (2 / 5) / (2 / 3 + 2 / 5)
+    assert problem.evaluate([point])[0] == pytest.approx(expected)
+    assert problem.exact_f1(point) == pytest.approx(expected)
+    assert problem.evaluate([point], np.array([0, 1, 2]))[0] == pytest.approx(2 * 0.5 * (1 / 3) / (0.5 + 1 / 3))
+
+
+def test_mwsd_default_t_grid_includes_zero():
+
+    parser = argparse.ArgumentParser()
+    add_tune_arguments(parser, zero_sum_one=True)
+    assert parse_values(parser.parse_args([]).t_grid)[0] == 0.0
+
+    parser = argparse.ArgumentParser()
+    add_tune_arguments(parser)
+    assert parse_values(parser.parse_args([]).t_grid)[0] == 0.01
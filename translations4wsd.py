@@ -1,12 +1,23 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import codecs
-from collections import defaultdict
-import subprocess
 import sys
 import argparse
 
+from t4wsd import bundle
+from t4wsd.cache import cache_from_args, add_cache_arguments, cached_masks, cached_hard_decisions, cached_soft_decisions, cached_pair_p_freq, file_fingerprint
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.fusion import align, fusion_decisions, add_fusion_arguments
+from t4wsd.instrument import recorder_from_args, add_instrument_arguments
+from t4wsd.output import AtomicWriter, open_output, write_predictions, jsonl_path, write_details, hard_details, soft_details, fusion_details, add_output_arguments
+from t4wsd.priors import PriorStore, top_sense_p_freq
+from t4wsd.readers import is_sense_key
+from t4wsd.scoring import ranked_batch, answers
+from t4wsd.scorer import report, counts_dict
+from t4wsd.server import SoftModel, serve, add_server_arguments
+from t4wsd.stream import input_lines, ranked_records, mapping_records, rerank_stream
+from t4wsd.tuning import TuningProblem, tune, load_parameters, save_parameters, parse_values, check_tune_arguments, add_tune_arguments
+
 '''
 # HardConstraint
 
@@ -26,389 +37,364 @@ p_freq = prior knowledge about sense frequency distribution
 a, b, c, smoothing weights are tunable parameter
 '''
 
+# sense-translation mapping of every pivot language (any number of languages can be combined with -L)
+MAPPING_NAMES = {"FR": "mappings/ALL_bnsyn_trans_mapping.wmt14.en-fr.txt",
+                 "DE": "mappings/ALL_bnsyn_trans_mapping.wmt16.en-de.txt",
+                 "RU": "mappings/ALL_bnsyn_trans_mapping.wmt19.en-ru.txt"}
+
+
+# SoftConstraint parameters of every base system (overridden by a tuned entry with -p)
+PARAMETERS = {"babelfy_plain": {"s_smoothing": None, "t_smoothing": 0.01, "a": 0.1, "b": 0.9, "c": None},
+              "babelfy_full": {"s_smoothing": 0.01, "t_smoothing": 0.01, "a": 0.1, "b": 0.4, "c": 0.5},
+              "ukb_plain": {"s_smoothing": None, "t_smoothing": 0.01, "a": 0.3, "b": 0.7, "c": None},
+              "ukb_full": {"s_smoothing": 0.02, "t_smoothing": 1.00, "a": 0.1, "b": 0.8, "c": 0.1},
+              "ims": {"s_smoothing": 0.01, "t_smoothing": 0.48, "a": 0.5, "b": 0.4, "c": 0.1},
+              "lmms": {"s_smoothing": 0.01, "t_smoothing": 0.87, "a": 0.8, "b": 0.1, "c": 0.1}
+            }
+
+
 def get_p_freq(smoothing):
 
-    # p_freq
-
-    with codecs.open("index.sense", "r", encoding="utf-8") as f:
-        sense_info = f.readlines()
-
-    sense_count_dict = defaultdict(dict)
-    for s_i in sense_info:
-        s_i = s_i.rstrip("\n").rstrip("\r")
-        sense_key = s_i.split(" ")[0]
-        lemma = sense_key.split("%")[0]
-        num_pos = sense_key.split("%")[1][0]
-        if num_pos == "1":
-            pos = "n"
-        elif num_pos == "2":
-            pos = "v"
-        elif num_pos == "3" or num_pos == "5":
-            pos = "a" 
-        elif num_pos == "4":
-            pos = "r" 
-        sense_count = int(s_i.split(" ")[-1])
-        lemma_pos = lemma + " " + pos
-        sense_count_dict[lemma_pos][sense_key] = sense_count + smoothing
-
-
-    sense_freq_dict = defaultdict(dict)
-    for lemma_pos, sense_counts in sense_count_dict.items():
-        sum_count = 0
-        for sense, count in sense_counts.items():
-            sum_count += count
-        for sense, count in sense_counts.items():
-            sense_freq = float(count) / sum_count
-            sense_freq_dict[lemma_pos][sense] = sense_freq
+    # p_freq: WordNet sense frequencies from the compiled index.sense, smoothed and normalized per lemma_pos on demand
+
+    sense_freq_dict = PriorStore.load("index.sense").smoothed(smoothing)
 
     return sense_freq_dict
 
 
-def load_trans_sense_constraint(test_name, lang):
+def get_parameters(system_name, test_name, params_path=""):
 
-    if lang == "FR":
-        mapping_name = "mappings/ALL_bnsyn_trans_mapping.wmt14.en-fr.txt"
-    elif lang == "DE":
-        mapping_name = "mappings/ALL_bnsyn_trans_mapping.wmt16.en-de.txt"
-    elif lang == "RU":
-        mapping_name = "mappings/ALL_bnsyn_trans_mapping.wmt19.en-ru.txt"
-    
+    # hard-coded parameters of the system, or its entry for test_name in a table written by -m tune
 
-    with codecs.open(mapping_name, "r", encoding="utf-8") as f:
-        t_s_map = f.readlines()
+    parameters = PARAMETERS[system_name]
+    if params_path:
+        tuned = load_parameters(params_path)
+        if test_name in tuned.get(system_name, {}):
+            parameters = tuned[system_name][test_name]
 
-    t_s_constraint = {}
-    for t_s_l in t_s_map:
-        t_s_l = t_s_l.rstrip("\n")
-        t_s_info_list = t_s_l.split("\t")
-        i_id = t_s_info_list[0] 
+    return parameters
 
-        if test_name != "ALL":
-            if i_id.split(".")[0] != test_name:
-                continue
-            i_id = ".".join(i_id.split(".")[1:])
 
-        if len(t_s_info_list) != 5: # no sense trans mapping or sense trans mapping for babel senses only (don't exist in wordnet)
-            target_lemma_pos = t_s_info_list[1]
-            t_s_constraint[i_id] = target_lemma_pos
+def get_fusion_parameters(systems, test_name, weights="", params_path=""):
 
-        elif len(t_s_info_list) == 5: # valid sense trans mapping
-            target_lemma_pos = t_s_info_list[1]
-            aligned_trans = t_s_info_list[2]
-            if aligned_trans == "MONOSEMOUS":
-                target_lemma_pos = t_s_info_list[1]
-                t_s_constraint[i_id] = target_lemma_pos
+    # parameters of the first system, with one p_wsd exponent per system: weights, or its a split evenly
 
-            else:
-                bn_syn_candidates = t_s_info_list[3].split(" ")
-                wn_sense_candidates = t_s_info_list[4].split(" ")
-                t_s_constraint[i_id] = [target_lemma_pos, wn_sense_candidates]
+    parameters = dict(get_parameters(systems[0], test_name, params_path))
+    parameters["a"] = parse_values(weights) or [parameters["a"] / len(systems)] * len(systems)
 
-    return t_s_constraint
+    return parameters
 
 
-def get_intersect(t_s_constraint1, t_s_constraint2, t_s_constraint3):
+def get_mapping_name(lang):
 
-    # HardConstraint (intersection among 3 languages)
+    mapping_name = MAPPING_NAMES[lang]
 
-    t_s_constraint_intersect = {}
+    return mapping_name
 
-    for i_id, info1 in t_s_constraint1.items():
-        if type(info1) == str:
-            target_lemma_pos = info1
-        else:
-            target_lemma_pos = info1[0]
-        info2 = t_s_constraint2[i_id]
-        info3 = t_s_constraint3[i_id]
-
-        if type(info1) == list and type(info2) == list and type(info3) == list:
-            intersection = list(set(info1[1]).intersection(set(info2[1]), set(info3[1])))
-            if intersection == []:
-                t_s_constraint_intersect[i_id] = target_lemma_pos
-            else:
-                t_s_constraint_intersect[i_id] = [target_lemma_pos, intersection]
-        
-        else:
-            t_s_constraint_intersect[i_id] = target_lemma_pos
-
-    return t_s_constraint_intersect
-
-
-def get_p_trans(ranked_sense_scores, trans_constraint_candidates1, trans_constraint_candidates2, trans_constraint_candidates3, smoothing):
-
-    # p_trans with 3 languages
-
-    # get sum for normalization first
-    all_sum = 0.0
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        if sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3)
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2)
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3)
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates1)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates2)
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            all_sum += 1/len(trans_constraint_candidates3)
-
-    # preparing scores from constraint
-    constraint_scores = {}
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        if sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates1) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates2) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3:
-            cons_score = float(1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        else:
-            cons_score = float(smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
 
-    return constraint_scores
+def load_trans_sense_constraint(test_name, lang):
+
+    mapping_name = get_mapping_name(lang)
 
+    t_s_constraint = ConstraintIndex.load(mapping_name, 5, test_name)
 
-def get_p_wsd(system_name, test_name):
+    return t_s_constraint
 
-    f_path = "base_outputs/ALL." + system_name + ".ranked.out"
 
-    with codecs.open(f_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+def get_p_wsd(system_name, test_name):
+
+    # ranked senses and scores of every instance as a Batch (interned sense ids, float64 scores, offsets)
 
-    base = {}
-    for line in lines:
-        line = line.rstrip("\n")
-        full_i_id = line.split("\t")[0]
-        test_id = full_i_id.split(".")[0]
-        i_id = ".".join(full_i_id.split(".")[1:])
+    f_path = "base_outputs/ALL." + system_name + ".ranked.out"
 
+    def select(full_i_id):
         if test_name == "ALL":
-            ranked_sense_scores = line.split("\t")[1:]
-            base[full_i_id] = [pair.split(" ") for pair in ranked_sense_scores]
+            return full_i_id
+        if full_i_id.split(".")[0] == test_name:
+            return ".".join(full_i_id.split(".")[1:])
+        return None
 
-        if test_name != "ALL" and test_id == test_name:
-            ranked_sense_scores = line.split("\t")[1:]
-            base[i_id] = [pair.split(" ") for pair in ranked_sense_scores]
+    # only the rows of the data set are read (partition index of the bundle)
+    table = bundle.load_ranked(f_path)
+    rows = None if test_name == "ALL" else bundle.partition_rows(table, test_name)
+    base = ranked_batch([table], select, rows=[rows])
 
     return base
 
 
-def combine_all_experts_plain(ranked_sense_scores, trans_cons_factor, a, b):
+def get_pair_p_freq(batch, sense_freq_dict):
 
-    # culculate p(sense) = p(wsd)^a * p(translation)^b 
-    new_ranked_sense_scores = []
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        p_wsd = float(sense_score[1])
-        p_trans = trans_cons_factor[sense]
-        new_score = pow(p_wsd, a) * pow(p_trans, b)
-        new_ranked_sense_scores.append([sense, new_score])
+    # p_freq of every (instance, sense) pair, from the sense frequencies of the lemma_pos of the top sense
 
-    new_ranked_sense_scores.sort(key=lambda x:x[1], reverse=True)
+    return top_sense_p_freq(batch, sense_freq_dict)
 
-    return new_ranked_sense_scores
 
+def write_answers(out_path, batch, best):
 
-def combine_all_experts(ranked_sense_scores, trans_cons_factor, sense_freq, a, b, c):
+    # written to a temporary file renamed over out_path (compressed when out_path ends with .gz, .xz, .bz2 or .zst)
+    predictions = answers(batch, best)
+    with AtomicWriter(out_path) as newf:
+        write_predictions(newf, predictions)
 
-    # culculate p(sense) = p(wsd)^a * p(translation)^b * p(prior)^c
-    new_ranked_sense_scores = []
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        p_wsd = float(sense_score[1])
-        p_trans = trans_cons_factor[sense]
-        if sense not in sense_freq:
-            p_freq = 0
-        else:
-            p_freq = sense_freq[sense]
-        new_score = pow(p_wsd, a) * pow(p_trans, b) * pow(p_freq, c)
-        new_ranked_sense_scores.append([sense, new_score])
+    return predictions
 
-    new_ranked_sense_scores.sort(key=lambda x:x[1], reverse=True)
 
-    return new_ranked_sense_scores
+def write_jsonl(out_path, batch, best, langs, masks, details):
 
+    # <out>.jsonl: every ranked sense of each instance with its expert scores
+    with AtomicWriter(jsonl_path(out_path)) as newf:
+        write_details(newf, batch, best, langs, masks, details)
 
-def HardConstraint(test_name, out_name, base, t_s_constraint_intersect):
+
+def HardConstraint(test_name, out_name, batch, t_s_constraints, recorder, cache, java_scorer=False, jsonl_langs=None):
 
     out_path = "outputs/" + out_name
-    newf = codecs.open(out_path, "w", encoding="utf-8")
 
-    for i_id, ranked_sense_scores in base.items():
+    # first sense in rank order that survives the intersection among all languages
+    # (predictions from WN1st sense backoff or monosemous words and unconstrained instances keep the top sense)
+    with recorder.stage("decide", hot=True):
+        best = cached_hard_decisions(cache, batch, t_s_constraints, recorder.counters)
 
-        ans_sense = ranked_sense_scores[0][0]
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            masks = cached_masks(cache, batch, t_s_constraints)
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, hard_details(batch, t_s_constraints, masks))
 
-        if len(ranked_sense_scores) == 1: 
-            # predictions from WN1st sense backoff or monosemous words
-            line = i_id + " " + ans_sense + "\n"
-            newf.write(line)
-            continue
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
-        constraint = t_s_constraint_intersect[i_id]
-        if type(constraint) == str:
-            ans_sense_with_trans = ans_sense
 
-        elif type(constraint) == list:
-            remain_sense_candidates = constraint[1]
-            if ans_sense in remain_sense_candidates:
-                ans_sense_with_trans = ans_sense
-            else:
-                find_flag = 0
-                for pair in ranked_sense_scores[1:]:
-                    sense = pair[0]
-                    if sense in remain_sense_candidates:
-                        ans_sense_with_trans = sense
-                        find_flag += 1
-                        break
-                if find_flag == 0:
-                    ans_sense_with_trans = ans_sense
+def SoftConstraint(test_name, out_name, batch, sense_freq_dict, p_freq_key, t_s_constraints, a, b, c, smoothing, recorder, cache, java_scorer=False, jsonl_langs=None):
+
+    out_path = "outputs/" + out_name
 
-        line = i_id + " " + ans_sense_with_trans + "\n"
-        newf.write(line)
+    # p_freq_key: fingerprint of the sense frequencies (index.sense and s_smoothing), for the stage cache
+    with recorder.stage("p_freq", hot=True):
+        if c: # use p_freq
+            p_freq = cached_pair_p_freq(cache, batch, p_freq_key, lambda: get_pair_p_freq(batch, sense_freq_dict), recorder.counters)
+        else:
+            p_freq = None
+    with recorder.stage("decide", hot=True):
+        best = cached_soft_decisions(cache, batch, t_s_constraints, p_freq, p_freq_key, a, b, c, smoothing, counters=recorder.counters)
 
-    newf.close()
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            masks = cached_masks(cache, batch, t_s_constraints)
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, soft_details(batch, t_s_constraints, p_freq, a, b, c, smoothing, masks=masks))
 
-    evaluate_wsd(test_name, out_path)
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
 
-def SoftConstraint(test_name, out_name, base, sense_freq_dict, t_s_constraint1, t_s_constraint2, t_s_constraint3, a, b, c, smoothing):
+def Fuse(test_name, out_name, systems, batch, p_wsd, sense_freq_dict, p_freq_key, t_s_constraints, weights, b, c, smoothing, recorder, cache, java_scorer=False, jsonl_langs=None):
 
     out_path = "outputs/" + out_name
-    newf = codecs.open(out_path, "w", encoding="utf-8")
-
-    for i_id, p_wsd in base.items():
-
-        ans_sense = p_wsd[0][0]
-
-        if len(p_wsd) == 1: 
-            # predictions from WN1st sense backoff or monosemous words
-            line = i_id + " " + ans_sense + "\n"
-            newf.write(line)
-            continue
-
-        lemma = ans_sense.split("%")[0]
-        num_pos = ans_sense.split("%")[1][0]
-        if num_pos == "1":
-            pos = "n"
-        elif num_pos == "2":
-            pos = "v"
-        elif num_pos == "3" or num_pos == "5":
-            pos = "a" 
-        elif num_pos == "4":
-            pos = "r" 
-        lemma_pos = lemma + " " + pos
-
-        if type(t_s_constraint1[i_id]) == str:
-            remain_sense_candidates1 = []
-        elif type(t_s_constraint1[i_id]) == list:
-            remain_sense_candidates1 = t_s_constraint1[i_id][1]
-        if type(t_s_constraint2[i_id]) == str:
-            remain_sense_candidates2 = []
-        elif type(t_s_constraint2[i_id]) == list:
-            remain_sense_candidates2 = t_s_constraint2[i_id][1]
-        if type(t_s_constraint3[i_id]) == str:
-            remain_sense_candidates3 = []
-        elif type(t_s_constraint3[i_id]) == list:
-            remain_sense_candidates3 = t_s_constraint3[i_id][1]
-
-        if remain_sense_candidates1 == [] and remain_sense_candidates2 == [] and remain_sense_candidates3 == []:
-            ans_sense_with_trans = ans_sense
+
+    # SoftConstraint with one p_wsd expert per system, over their outputs aligned by fusion.align
+    with recorder.stage("p_freq", hot=True):
+        if c: # use p_freq
+            p_freq = cached_pair_p_freq(cache, batch, p_freq_key, lambda: get_pair_p_freq(batch, sense_freq_dict), recorder.counters)
         else:
-            p_trans = get_p_trans(p_wsd, remain_sense_candidates1, remain_sense_candidates2, remain_sense_candidates3, smoothing)
-            if c: # use p_freq
-                p_freq = sense_freq_dict[lemma_pos]
-                ranked_sense_scores = combine_all_experts(p_wsd, p_trans, p_freq, a, b, c)
-            else:
-                ranked_sense_scores = combine_all_experts_plain(p_wsd, p_trans, a, b)
-            ans_sense_with_trans = ranked_sense_scores[0][0]
+            p_freq = None
+    with recorder.stage("decide", hot=True):
+        masks = cached_masks(cache, batch, t_s_constraints, recorder.counters)
+        best = fusion_decisions(batch, p_wsd, t_s_constraints, p_freq, weights, b, c, smoothing, counters=recorder.counters, masks=masks)
 
-        tst_line = i_id + " " + ans_sense_with_trans + "\n"
-        newf.write(tst_line)
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, fusion_details(batch, p_wsd, systems, t_s_constraints, p_freq, weights, b, c, smoothing, masks=masks))
 
-    newf.close()
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
-    evaluate_wsd(test_name, out_path)
 
+def Tune(test_name, system_name, batch, t_s_constraints, use_freq, recorder, args):
 
-def evaluate_wsd(test_name, out_path):
+    # search (a, b, c, t_smoothing, s_smoothing) against the gold key and store the best in the parameter table
 
-    key_file = "gold_keys/" + test_name + ".gold.key.txt"
+    with recorder.stage("load_gold"):
+        gold = bundle.load_gold("gold_keys/" + test_name + ".gold.key.txt")
 
-    cmd = [
-        "java", 
-        "Scorer", 
-        key_file,
-        out_path,
-        ]
+    def p_freq_for(s_smoothing):
+        return get_pair_p_freq(batch, get_p_freq(s_smoothing))
 
-    b_out = subprocess.check_output(cmd)
-    s_out = b_out.decode()
+    with recorder.stage("tune", hot=True):
+        problem = TuningProblem(batch, t_s_constraints, gold, p_freq_for)
+        best, n_points = tune(problem, args.search, args.step, parse_values(args.t_grid), parse_values(args.s_grid), use_freq, args.trials, args.seed)
+    recorder.count("points", n_points)
 
-    print(s_out.rstrip("\r\n"))
+    params_path = args.params or "parameters.json"
+    save_parameters(params_path, system_name, test_name, best)
+    recorder.save(params_path)
+
+    print(system_name + " " + test_name + ": " + str(n_points) + " points, best F1=" + "%.4f" % best["f1"])
+    print(" ".join(key + "=" + str(best[key]) for key in ["a", "b", "c", "t_smoothing", "s_smoothing"]) + " -> " + params_path)
+
+
+def Stream(test_name, method, lines, newf, langs, sense_freq_dict, a, b, c, smoothing, recorder, batch_size=1024):
+
+    # HardConstraint / SoftConstraint over ranked-output lines sorted by id, merge-joined with the mappings
+    # batch by batch (memory does not grow with the number of lines)
+
+    records = ranked_records(lines)
+    if test_name != "ALL":
+        records = ((full_i_id, ranked) for full_i_id, ranked in records if full_i_id.split(".")[0] == test_name)
+    mapping_sides = [mapping_records(get_mapping_name(lang), 5) for lang in langs]
+
+    def pair_p_freq(batch, i_ids, extras):
+        return get_pair_p_freq(batch, sense_freq_dict)
+
+    with recorder.stage("stream", hot=True):
+        for full_i_id, ans_sense_with_trans in rerank_stream(records, mapping_sides, method, a, b, c, smoothing, pair_p_freq, batch_size=batch_size, counters=recorder.counters):
+            i_id = full_i_id if test_name == "ALL" else ".".join(full_i_id.split(".")[1:])
+            newf.write(i_id + " " + ans_sense_with_trans + "\n")
+
+
+def Serve(langs, t_s_constraints, sense_freq_dict, a, b, c, smoothing, args):
+
+    # SoftConstraint service: constraints and p_freq are loaded once, requests bring the ranked senses
+    # (WordNet sense keys: the p_freq of an instance is looked up by the lemma_pos of its top sense)
+
+    def pair_p_freq(batch, i_ids):
+        return get_pair_p_freq(batch, sense_freq_dict)
+
+    model = SoftModel(langs, t_s_constraints, a, b, c, smoothing, pair_p_freq, is_sense=is_sense_key)
+    serve(model, args)
+
+
+def Fusion(test_name, systems, langs, recorder, cache, args):
+
+    # -m soft with several systems: load and align their outputs, then Fuse
+
+    parameters = get_fusion_parameters(systems, test_name, args.weights, args.params)
+    if len(parameters["a"]) != len(systems):
+        sys.exit("--weights needs one exponent per system (" + ", ".join(systems) + ")")
+
+    with recorder.stage("load_base"):
+        batch, p_wsd = align([get_p_wsd(system, test_name) for system in systems], args.fill)
+    with recorder.stage("load_constraints"):
+        t_s_constraints = [load_trans_sense_constraint(test_name, lang) for lang in langs]
+    with recorder.stage("load_p_freq"):
+        if parameters["s_smoothing"]:
+            sense_freq_dict = get_p_freq(parameters["s_smoothing"])
+            p_freq_key = [file_fingerprint("index.sense"), parameters["s_smoothing"]]
+        else:
+            sense_freq_dict = None
+            p_freq_key = None
+    recorder.info["weights"] = parameters["a"]
+
+    b, c, t_smoothing = parameters["b"], parameters["c"], parameters["t_smoothing"]
+    Fuse(test_name, args.out, systems, batch, p_wsd, sense_freq_dict, p_freq_key, t_s_constraints, parameters["a"], b, c, t_smoothing, recorder, cache, args.java_scorer, langs if args.jsonl else None)
+
+
+def evaluate_wsd(test_name, out_path, predictions, java_scorer=False, cache=None):
+
+    key_file = "gold_keys/" + test_name + ".gold.key.txt"
+
+    # prints P / R / F1 and returns their score counts
+    return report(key_file, predictions, out_path, java_scorer, cache)
 
 
 def main():
 
     parser = argparse.ArgumentParser(description="Test and evaluate translations for WSD methods (English all-words WSD)")
 
-    parser.add_argument("-s", "--system", default="", help="name of the base WSD system (babelfy_plain, babelfy_full, ukb_plain, ukb_full, ims, lmms)")
+    parser.add_argument("-s", "--system", default="", help="name of the base WSD system (babelfy_plain, babelfy_full, ukb_plain, ukb_full, ims, lmms), or comma-separated systems fused by -m soft")
     parser.add_argument("-t", "--test", default="", help="name of test data set (senseval2, senseval3, semeval2007, semeval2013, semeval2015, ALL)") 
-    parser.add_argument("-m", "--method", default="", help="name of the method (hard or soft)")
+    parser.add_argument("-m", "--method", default="", help="name of the method (hard, soft, tune or serve)")
     parser.add_argument("-o", "--out", default="", help="name of the output file")
+    parser.add_argument("-L", "--langs", default="FR,DE,RU", help="comma-separated pivot languages whose mappings are combined (default: FR,DE,RU)")
+    parser.add_argument("--java-scorer", default=False, action="store_true", help="flag to score with Scorer.java instead of the in-process scorer, as a cross-check (default: False)")
+    parser.add_argument("--stream", default=False, action="store_true", help="flag to rerank ranked-output lines sorted by id from --input with bounded memory (-m hard or soft, default: False)")
+    parser.add_argument("-i", "--input", default="-", help="ranked output read by --stream (default: - for stdin)")
+    parser.add_argument("--batch-size", default=1024, type=int, help="instances reranked per batch by --stream (default: 1024)")
+    add_tune_arguments(parser)
+    add_server_arguments(parser)
+    add_instrument_arguments(parser)
+    add_cache_arguments(parser)
+    add_output_arguments(parser)
+    add_fusion_arguments(parser)
     
     args = parser.parse_args()
 
-    parameters = {"babelfy_plain": {"s_smoothing": None, "t_smoothing": 0.01, "a": 0.1, "b": 0.9, "c": None}, 
-                  "babelfy_full": {"s_smoothing": 0.01, "t_smoothing": 0.01, "a": 0.1, "b": 0.4, "c": 0.5},
-                  "ukb_plain": {"s_smoothing": None, "t_smoothing": 0.01, "a": 0.3, "b": 0.7, "c": None},
-                  "ukb_full": {"s_smoothing": 0.02, "t_smoothing": 1.00, "a": 0.1, "b": 0.8, "c": 0.1},
-                  "ims": {"s_smoothing": 0.01, "t_smoothing": 0.48, "a": 0.5, "b": 0.4, "c": 0.1},
-                  "lmms": {"s_smoothing": 0.01, "t_smoothing": 0.87, "a": 0.8, "b": 0.1, "c": 0.1}
-                }
-
     system_name = args.system
     test_name = args.test
+    langs = args.langs.split(",")
+    recorder = recorder_from_args(args, script="translations4wsd", system=system_name, test=test_name, method=args.method, languages=langs)
+    cache = cache_from_args(args)
+
+    systems = system_name.split(",")
+    if len(systems) > 1:
+        if args.method != "soft" or args.stream:
+            parser.error("several systems (-s " + system_name + ") are fused by -m soft only")
+        Fusion(test_name, systems, langs, recorder, cache, args)
+        return
+    if args.weights:
+        parser.error("--weights is for several systems fused by -m soft (-s SYSTEM1,SYSTEM2,...)")
+
+    parameters = get_parameters(system_name, test_name, args.params if args.method != "tune" else "")
+    if args.method == "tune":
+        check_tune_arguments(parser, args, parameters["c"] is not None)
+
+    if args.stream: # output goes to stdout unless -o is given
+        if args.method == "soft" and parameters["s_smoothing"]:
+            sense_freq_dict = get_p_freq(parameters["s_smoothing"])
+        else:
+            sense_freq_dict = None
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        with open_output("outputs/" + args.out if args.out else "") as newf:
+            Stream(test_name, args.method, input_lines(args.input), newf, langs, sense_freq_dict, a, b, c, t_smoothing, recorder, args.batch_size)
+        if args.out:
+            recorder.save("outputs/" + args.out)
+        return
+
+    if args.method == "serve": # ranked senses come with the requests
+        if not test_name:
+            parser.error("-m serve needs the test data set of the requests (-t ALL, -t senseval2, ...)")
+        t_s_constraints = [load_trans_sense_constraint(test_name, lang) for lang in langs]
+        empty = [lang for lang, t_s_constraint in zip(langs, t_s_constraints) if len(t_s_constraint) == 0]
+        if empty:
+            parser.error("no instance of " + test_name + " in the mapping of " + ", ".join(empty))
+        if parameters["s_smoothing"]:
+            sense_freq_dict = get_p_freq(parameters["s_smoothing"])
+        else:
+             sense_freq_dict = None
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        Serve(langs, t_s_constraints, sense_freq_dict, a, b, c, t_smoothing, args)
+        return
 
-    base = get_p_wsd(system_name, test_name)
+    with recorder.stage("load_base"):
+        base = get_p_wsd(system_name, test_name)
 
     if args.method == "hard":
-        t_s_constraint1 = load_trans_sense_constraint(test_name, "FR")
-        t_s_constraint2 = load_trans_sense_constraint(test_name, "DE")
-        t_s_constraint3 = load_trans_sense_constraint(test_name, "RU")
-        t_s_constraint_intersect = get_intersect(t_s_constraint1, t_s_constraint2, t_s_constraint3)
-        HardConstraint(test_name, args.out, base, t_s_constraint_intersect)
+        with recorder.stage("load_constraints"):
+            t_s_constraints = [load_trans_sense_constraint(test_name, lang) for lang in langs]
+        HardConstraint(test_name, args.out, base, t_s_constraints, recorder, cache, args.java_scorer, langs if args.jsonl else None)
 
     elif args.method == "soft":
-        t_s_constraint1 = load_trans_sense_constraint(test_name, "FR")
-        t_s_constraint2 = load_trans_sense_constraint(test_name, "DE")
-        t_s_constraint3 = load_trans_sense_constraint(test_name, "RU")
-        if parameters[system_name]["s_smoothing"]:
-            sense_freq_dict = get_p_freq(parameters[system_name]["s_smoothing"])
-        else:
-             sense_freq_dict = None
-        a, b, c, t_smoothing = parameters[system_name]["a"], parameters[system_name]["b"], parameters[system_name]["c"], parameters[system_name]["t_smoothing"]
-        SoftConstraint(test_name, args.out, base, sense_freq_dict, t_s_constraint1, t_s_constraint2, t_s_constraint3, a, b, c, t_smoothing)
+        with recorder.stage("load_constraints"):
+            t_s_constraints = [load_trans_sense_constraint(test_name, lang) for lang in langs]
+        with recorder.stage("load_p_freq"):
+            if parameters["s_smoothing"]:
+                sense_freq_dict = get_p_freq(parameters["s_smoothing"])
+                p_freq_key = [file_fingerprint("index.sense"), parameters["s_smoothing"]]
+            else:
+                 sense_freq_dict = None
+                 p_freq_key = None
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        SoftConstraint(test_name, args.out, base, sense_freq_dict, p_freq_key, t_s_constraints, a, b, c, t_smoothing, recorder, cache, args.java_scorer, langs if args.jsonl else None)
+
+    elif args.method == "tune":
+        with recorder.stage("load_constraints"):
+            t_s_constraints = [load_trans_sense_constraint(test_name, lang) for lang in langs]
+        use_freq = parameters["c"] is not None # plain systems are tuned without p_freq, like the defaults
+        Tune(test_name, system_name, base, t_s_constraints, use_freq, recorder, args)
         
 
 if __name__ == "__main__":
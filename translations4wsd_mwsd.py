@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-import codecs
-from collections import defaultdict
-import subprocess
 import sys
 import argparse
-import glob
+
+from t4wsd import bundle
+from t4wsd.cache import cache_from_args, add_cache_arguments, cached_masks, cached_hard_decisions, cached_soft_decisions, cached_pair_p_freq, cached_lemma_sense_distributions, file_fingerprint
+from t4wsd.constraints import ConstraintIndex
+from t4wsd.features import mapping_language
+from t4wsd.fusion import align, fusion_decisions, add_fusion_arguments
+from t4wsd.priors import read_lemma_sense_distributions, instance_sense_freq, instance_p_freq
+from t4wsd.instrument import recorder_from_args, add_instrument_arguments
+from t4wsd.loader import load_tables, add_loader_arguments
+from t4wsd.output import AtomicWriter, open_output, write_predictions, jsonl_path, write_details, hard_details, soft_details, fusion_details, add_output_arguments
+from t4wsd.readers import glob_sources
+from t4wsd.scoring import ranked_batch, answers
+from t4wsd.scorer import report, counts_dict
+from t4wsd.server import SoftModel, serve, add_server_arguments
+from t4wsd.stream import input_lines, ranked_records, mapping_records, lemma_records, rerank_stream
+from t4wsd.tuning import TuningProblem, tune, load_parameters, save_parameters, parse_values, check_tune_arguments, add_tune_arguments
 
 '''
 # HardConstraint
@@ -27,494 +39,395 @@ p_freq = prior knowledge about sense frequency distribution
 a, b, c, smoothing weights are tunable parameter
 '''
 
-def get_p_freq(file_path, id_lemma_map):
+# SoftConstraint parameters of every base system and test case (overridden by a tuned entry with -p)
+PARAMETERS = {"ims": {"semeval2013 DE": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None},
+                      "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                      "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.5, "b": 0.5, "c": None},
+                      "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                      "semeval2015 ES": {"t_smoothing": 0.56, "a": 0.3, "b": 0.7, "c": None},
+                      "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
+                     },
+              "ims.clubert": {"semeval2013 DE": {"t_smoothing": 0.01, "a": 0.1, "b": 0.3, "c": 0.6},
+                              "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.5, "c": 0.4},
+                              "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.5, "b": 0.4, "c": 0.1},
+                              "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.8, "c": 0.1},
+                              "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.2, "b": 0.3, "c": 0.5},
+                              "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.8, "c": 0.1}
+                             },
+              "sensembert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                             "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                             "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                             "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                             "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None},
+                             "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
+                            },
+              "sensembert.temb": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                                  "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                                  "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                                  "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
+                                  "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None},
+                                  "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
+                                 },
+              "sensembert.clubert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.8, "b": 0.1, "c": 0.1},
+                                     "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.8, "b": 0.1, "c": 0.1},
+                                     "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.7, "c": 0.2},
+                                     "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.3, "c": 0.6},
+                                     "semeval2015 ES": {"t_smoothing": 0.03, "a": 0.6, "b": 0.1, "c": 0.3},
+                                     "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8}
+                                    },
+              "sensembert.temb.clubert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8},
+                                          "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.2, "c": 0.7},
+                                          "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.7, "c": 0.2},
+                                          "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.4, "b": 0.5, "c": 0.1},
+                                          "semeval2015 ES": {"t_smoothing": 0.02, "a": 0.7, "b": 0.1, "c": 0.2},
+                                          "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8}
+                                         }
+             }
+
+
+def get_p_freq(file_path, id_lemma_map, cache=None):
+
+    # p_freq: CluBERT sense distribution of the lemma_pos of every instance
+    # (only the lines of these lemma_pos are parsed; with a cache, they are kept per lemma map in bundle/cache)
+
+    lemma_pos_set = set(id_lemma_map.values())
+    if cache is not None:
+        lemma_sense_freq = cached_lemma_sense_distributions(cache, file_path, lemma_pos_set)
+    else:
+        lemma_sense_freq = get_lemma_sense_freq(file_path, lemma_pos_set)
+
+    return instance_sense_freq(lemma_sense_freq, id_lemma_map)
+
+
+def load_p_freq(file_path, id_lemma_path, cache=None):
+
+    # get_p_freq from file paths (run in a worker process by load_resources)
+
+    return get_p_freq(file_path, load_id_lemma_map(id_lemma_path), cache)
+
+
+def get_lemma_sense_freq(file_path, lemma_pos_set=None):
+
+    # CluBERT sense distribution of every lemma_pos (or of the lemma_pos in lemma_pos_set)
 
-    # p_freq
+    return read_lemma_sense_distributions(file_path, lemma_pos_set)
 
-    with codecs.open(file_path, "r", encoding="utf-8") as f:
-        sense_info = f.readlines()
 
-    tmp_sense_freq_dict = defaultdict(dict)
-    for s_i in sense_info:
-        s_i = s_i.rstrip("\n")
-        lemma_pos = s_i.split("\t")[0].replace("#", " ")
-        sense_prob_list = s_i.split("\t")[1:]
-        for sense_prob in sense_prob_list:
-            if "#" not in sense_prob:
-                sense = sense_prob
-                prob = float(1.0)
-            else:
-                sense = sense_prob.split("#")[0]
-                prob = sense_prob.split("#")[1]
-            tmp_sense_freq_dict[lemma_pos][sense] = float(prob)
+def get_parameters(system_name, test_case, params_path=""):
 
-    sense_freq_dict = {}
-    for i_id, lemma_pos in id_lemma_map.items():
-        sense_prob_dict = tmp_sense_freq_dict[lemma_pos]
-        sense_freq_dict[i_id] = sense_prob_dict
+    # hard-coded parameters of the system for test_case ("semeval2013 DE"), or its entry in a table written by -m tune
 
+    parameters = PARAMETERS[system_name][test_case]
+    if params_path:
+        tuned = load_parameters(params_path)
+        if test_case in tuned.get(system_name, {}):
+            parameters = tuned[system_name][test_case]
 
-    return sense_freq_dict
+    return parameters
+
+
+def get_fusion_parameters(systems, test_case, weights="", params_path="", clubert=False):
+
+    # parameters of the first system (with CluBERT: its .clubert entry), with one p_wsd exponent per system:
+    # weights, or its a split evenly
+
+    parameters = dict(get_parameters(systems[0] + ".clubert" if clubert else systems[0], test_case, params_path))
+    parameters["a"] = parse_values(weights) or [parameters["a"] / len(systems)] * len(systems)
+
+    return parameters
 
 
 def load_id_lemma_map(file_path):    
 
-    with codecs.open(file_path, "r", encoding="utf-8") as f:
-        lemma_lines = f.readlines()
+    table = bundle.load_lemma_map(file_path)
 
-    id_lemma_map = {}
-    for lemma_l in lemma_lines:
-        lemma_l = lemma_l.rstrip("\n")
-        i_id = lemma_l.split("\t")[0]
-        lemma_pos = lemma_l.split("\t")[1]
-        id_lemma_map[i_id] = lemma_pos
+    id_lemma_map = dict(zip(table.ids.tolist(), table.lemma_pos.tolist()))
 
     return id_lemma_map
 
 
-def load_trans_sense_constraint(test_name, file_path):    
+def get_mapping_path_list(test_name, lang):
 
-    with codecs.open(file_path, "r", encoding="utf-8") as f:
-        t_s_map = f.readlines()
+    # every language pair with a mapping for the test language (4 for semeval2013, 2 for semeval2015)
 
-    t_s_constraint = {}
-    for t_s_l in t_s_map:
-        t_s_l = t_s_l.rstrip("\n")
-        t_s_info_list = t_s_l.split("\t")
-        i_id = t_s_info_list[0] 
-        target_lemma_pos = t_s_info_list[1]
+    # sorted, so the languages are always combined in the same order (plain or compressed files)
 
-        if len(t_s_info_list) != 4: # no sense trans mapping or sense trans mapping for babel senses only (don't exist in wordnet)
-            t_s_constraint[i_id] = target_lemma_pos
+    tmp_path = "mwsd_mappings/" + test_name + "_bnsyn_trans_mapping.*." + lang + ".txt"
+    mapping_path_list = glob_sources(tmp_path)
+
+    return mapping_path_list
 
-        elif len(t_s_info_list) == 4: # valid sense trans mapping
-            aligned_trans = t_s_info_list[2]
-            if aligned_trans == "MONOSEMOUS":
-                t_s_constraint[i_id] = target_lemma_pos
 
-            else:
-                bn_syn_candidates = t_s_info_list[3].split(" ")
-                t_s_constraint[i_id] = [target_lemma_pos, bn_syn_candidates]
+def load_trans_sense_constraint(test_name, file_path):    
+
+    t_s_constraint = ConstraintIndex.load(file_path, 4)
 
     return t_s_constraint
 
 
-def get_intersect2(t_s_constraint1, t_s_constraint2):
+def get_base_path_list(system_name, test_name, lang, t_type):
 
-    # HardConstraint (intersection among 2 languages)
+    if t_type == "all":
+        f_path = "mwsd_base_outputs/" + test_name + "." + lang.lower() + "." + system_name + ".ranked.dev.out" # add dev instances first
+    else:
+        f_path = "mwsd_base_outputs/" + test_name + "." + lang.lower() + "." + system_name + ".ranked." + t_type + ".out"
 
-    t_s_constraint_intersect = {}
+    base_path_list = [f_path]
 
-    for i_id, info1 in t_s_constraint1.items():
-        if type(info1) == str:
-            target_lemma_pos = info1
-        else:
-            target_lemma_pos = info1[0]
+    if t_type == "all": 
+        f_path = "mwsd_base_outputs/" + test_name + "." + lang + "." + system_name + ".ranked.tst.out" # add remaining instances
+        base_path_list.append(f_path)
 
-        info2 = t_s_constraint2[i_id]     
+    return base_path_list
 
-        if type(info1) == list and type(info2) == list:
-            intersection = list(set(info1[1]).intersection(set(info2[1])))
-            if intersection == []:
-                t_s_constraint_intersect[i_id] = target_lemma_pos
-            else:
-                t_s_constraint_intersect[i_id] = [target_lemma_pos, intersection]
-        
-        else:
-            t_s_constraint_intersect[i_id] = target_lemma_pos
 
-    return t_s_constraint_intersect
+def get_p_wsd(system_name, test_name, lang, t_type):
 
+    tables = [bundle.load_ranked(f_path) for f_path in get_base_path_list(system_name, test_name, lang, t_type)]
 
-def get_intersect4(t_s_constraint1, t_s_constraint2, t_s_constraint3, t_s_constraint4):
+    # ranked senses and scores of every instance as a Batch (interned sense ids, float64 scores, offsets)
+    base = ranked_batch(tables)
 
-    # HardConstraint (intersection among 4 languages)
+    return base
 
-    t_s_constraint_intersect = {}
 
-    for i_id, info1 in t_s_constraint1.items():
-        if type(info1) == str:
-            target_lemma_pos = info1
-        else:
-            target_lemma_pos = info1[0]
-        info2 = t_s_constraint2[i_id]
-        info3 = t_s_constraint3[i_id]
-        info4 = t_s_constraint4[i_id]
-
-        if type(info1) == list and type(info2) == list and type(info3) == list and type(info4) == list:
-            intersection = list(set(info1[1]).intersection(set(info2[1]), set(info3[1]), set(info4[1])))
-            if intersection == []:
-                t_s_constraint_intersect[i_id] = target_lemma_pos
-            else:
-                t_s_constraint_intersect[i_id] = [target_lemma_pos, intersection]
-        
-        else:
-            t_s_constraint_intersect[i_id] = target_lemma_pos
+def load_resources(system_name, test_name, lang, t_type, mapping_path_list, id_lemma_path, clubert_path, workers, cache=None):
 
-    return t_s_constraint_intersect
+    # base output (None without system_name), constraints and CluBERT p_freq (None without clubert_path), with the files
+    # loaded side by side; the Batch and the constraint indexes are then built in a fixed order, as get_p_wsd and
+    # load_trans_sense_constraint would
 
+    base_path_list = get_base_path_list(system_name, test_name, lang, t_type) if system_name else []
+    processes = [("p_freq", load_p_freq, (clubert_path, id_lemma_path, cache))] if clubert_path else []
 
-def get_p_trans(ranked_sense_scores, trans_constraint_candidates1, trans_constraint_candidates2, trans_constraint_candidates3, trans_constraint_candidates4, smoothing):
+    tables, results = load_tables(base_path_list + mapping_path_list, workers, processes)
 
-    # p_trans with 2 or 4 languages
+    base = ranked_batch([tables[f_path] for f_path in base_path_list]) if system_name else None
+    t_s_constraints = [ConstraintIndex.from_table(tables[mapping_path], 4) for mapping_path in mapping_path_list]
 
-    # get sum for normalization first
-    all_sum = 0.0
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        if sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4)
-        
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3)
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates4)
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4)
-
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2)
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3)
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates4)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates4)
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4)
-
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates1)
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates2)
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates3)
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            all_sum += 1/len(trans_constraint_candidates4)       
-
-    if all_sum == 0.0:
-        constraint_scores = {}
-        for sense_score in ranked_sense_scores:
-            sense = sense_score[0]
-            constraint_scores[sense] = 1
-        return constraint_scores    
-
-    # preparing scores from constraint
-    constraint_scores = {}
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        if sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-
-        elif sense in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates2) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates2) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates3) + 1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-
-        elif sense in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates1) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates2) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense in trans_constraint_candidates3 and sense not in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates3) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
-        elif sense not in trans_constraint_candidates1 and sense not in trans_constraint_candidates2 and sense not in trans_constraint_candidates3 and sense in trans_constraint_candidates4:
-            cons_score = float(1/len(trans_constraint_candidates4) + smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
+    return base, t_s_constraints, results.get("p_freq")
 
-        else:
-            cons_score = float(smoothing) / ((len(ranked_sense_scores) * smoothing)  + all_sum)
-            constraint_scores[sense] = cons_score
 
-    return constraint_scores
+def get_pair_p_freq(batch, sense_freq_dict, i_ids=None):
 
+    # p_freq of every (instance, sense) pair, from the sense distribution of the instance's lemma_pos
+    # (i_ids: instance ids when they are not the batch ids)
 
-def get_p_wsd(system_name, test_name, lang, t_type):
+    return instance_p_freq(batch, sense_freq_dict, i_ids)
 
-    if t_type == "all":
-        f_path = "mwsd_base_outputs/" + test_name + "." + lang.lower() + "." + system_name + ".ranked.dev.out" # add dev instances first
-    else:
-        f_path = "mwsd_base_outputs/" + test_name + "." + lang.lower() + "." + system_name + ".ranked." + t_type + ".out"
 
-    with codecs.open(f_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+def write_answers(out_path, batch, best):
 
-    base = {}
-    for line in lines:
-        line = line.rstrip("\n")
-        i_id = line.split("\t")[0]
-        ranked_sense_scores = line.split("\t")[1:]
-        base[i_id] = [pair.split(" ") for pair in ranked_sense_scores]
+    # written to a temporary file renamed over out_path (compressed when out_path ends with .gz, .xz, .bz2 or .zst)
+    predictions = answers(batch, best)
+    with AtomicWriter(out_path) as newf:
+        write_predictions(newf, predictions)
 
-    if t_type == "all": 
-        f_path = "mwsd_base_outputs/" + test_name + "." + lang + "." + system_name + ".ranked.tst.out" # add remaining instances
-        
-        with codecs.open(f_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            line = line.rstrip("\n")
-            i_id = line.split("\t")[0]
-            ranked_sense_scores = line.split("\t")[1:]
-            base[i_id] = [pair.split(" ") for pair in ranked_sense_scores]
+    return predictions
 
-    return base
 
+def write_jsonl(out_path, batch, best, langs, masks, details):
 
-def combine_all_experts_plain(ranked_sense_scores, trans_cons_factor, a, b):
+    # <out>.jsonl: every ranked sense of each instance with its expert scores
+    with AtomicWriter(jsonl_path(out_path)) as newf:
+        write_details(newf, batch, best, langs, masks, details)
 
-    # culculate p(sense) = p(wsd)^a * p(translation)^b
-    new_ranked_sense_scores = []
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        p_wsd = float(sense_score[1])
-        p_trans = trans_cons_factor[sense]
-        new_score = pow(p_wsd, a) * pow(p_trans, b)
-        new_ranked_sense_scores.append([sense, new_score])
 
-    new_ranked_sense_scores.sort(key=lambda x:x[1], reverse=True)
+def HardConstraint(test_name, t_type, lang, out_name, batch, t_s_constraints, recorder, cache, java_scorer=False, jsonl_langs=None):
+
+    out_path = "mwsd_outputs/" + out_name
+
+    # first sense in rank order that survives the intersection among all languages
+    # (monosemous words and instances without constraint keep the top sense)
+    with recorder.stage("decide", hot=True):
+        best = cached_hard_decisions(cache, batch, t_s_constraints, recorder.counters)
 
-    return new_ranked_sense_scores
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            masks = cached_masks(cache, batch, t_s_constraints)
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, hard_details(batch, t_s_constraints, masks))
 
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, t_type, lang, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
-def combine_all_experts(ranked_sense_scores, trans_cons_factor, sense_freq, a, b, c):
 
-    # culculate p(sense) = p(wsd)^a * p(translation)^b * p(prior)^c
-    new_ranked_sense_scores = []
-    for sense_score in ranked_sense_scores:
-        sense = sense_score[0]
-        p_wsd = float(sense_score[1])
-        p_trans = trans_cons_factor[sense]
-        if sense not in sense_freq:
-            p_freq = 0
+def SoftConstraint(test_name, t_type, lang, out_name, batch, sense_freq_dict, p_freq_key, t_s_constraints, a, b, c, smoothing, recorder, cache, java_scorer=False, jsonl_langs=None):
+
+    out_path = "mwsd_outputs/" + out_name
+
+    # a language can be absent (semeval2015) or miss the instance: no constraint from it
+    # p_trans = 1 for every sense when none of the senses is a translation candidate
+    # p_freq_key: fingerprint of the sense distributions (CluBERT file and lemma map), for the stage cache
+    with recorder.stage("p_freq", hot=True):
+        if c: # use p_freq
+            p_freq = cached_pair_p_freq(cache, batch, p_freq_key, lambda: get_pair_p_freq(batch, sense_freq_dict), recorder.counters)
         else:
-            p_freq = sense_freq[sense]
-        new_score = pow(p_wsd, a) * pow(p_trans, b) * pow(p_freq, c)
-        new_ranked_sense_scores.append([sense, new_score])
+            p_freq = None
+    with recorder.stage("decide", hot=True):
+        best = cached_soft_decisions(cache, batch, t_s_constraints, p_freq, p_freq_key, a, b, c, smoothing, zero_sum_one=True, counters=recorder.counters)
 
-    new_ranked_sense_scores.sort(key=lambda x:x[1], reverse=True)
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            masks = cached_masks(cache, batch, t_s_constraints)
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, soft_details(batch, t_s_constraints, p_freq, a, b, c, smoothing, True, masks))
 
-    return new_ranked_sense_scores
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, t_type, lang, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
 
-def HardConstraint(test_name, t_type, lang, out_name, base, t_s_constraint_intersect):
+def Fuse(test_name, t_type, lang, out_name, systems, batch, p_wsd, sense_freq_dict, p_freq_key, t_s_constraints, weights, b, c, smoothing, recorder, cache, java_scorer=False, jsonl_langs=None):
 
     out_path = "mwsd_outputs/" + out_name
-    newf = codecs.open(out_path, "w", encoding="utf-8")
 
-    for i_id, ranked_sense_scores in base.items():
+    # SoftConstraint with one p_wsd expert per system, over their outputs aligned by fusion.align
+    # (p_trans = 1 for every sense when none of the senses is a translation candidate, as in SoftConstraint)
+    with recorder.stage("p_freq", hot=True):
+        if c: # use p_freq
+            p_freq = cached_pair_p_freq(cache, batch, p_freq_key, lambda: get_pair_p_freq(batch, sense_freq_dict), recorder.counters)
+        else:
+            p_freq = None
+    with recorder.stage("decide", hot=True):
+        masks = cached_masks(cache, batch, t_s_constraints, recorder.counters)
+        best = fusion_decisions(batch, p_wsd, t_s_constraints, p_freq, weights, b, c, smoothing, zero_sum_one=True, counters=recorder.counters, masks=masks)
+
+    with recorder.stage("write"):
+        predictions = write_answers(out_path, batch, best)
+        if jsonl_langs: # --jsonl
+            write_jsonl(out_path, batch, best, jsonl_langs, masks, fusion_details(batch, p_wsd, systems, t_s_constraints, p_freq, weights, b, c, smoothing, True, masks))
 
-        ans_sense = ranked_sense_scores[0][0]
+    with recorder.stage("evaluate"):
+        recorder.info["score"] = counts_dict(evaluate_wsd(test_name, t_type, lang, out_path, predictions, java_scorer, cache))
+    recorder.save(out_path)
 
-        if len(ranked_sense_scores) == 1 or i_id not in t_s_constraint_intersect: 
-            # monosemous words
-            line = i_id + " " + ans_sense + "\n"
-            newf.write(line)
-            continue
 
-        constraint = t_s_constraint_intersect[i_id]
-        if type(constraint) == str:
-            ans_sense_with_trans = ans_sense
+def Tune(test_name, t_type, lang, system_name, test_case, batch, sense_freq_dict, t_s_constraints, recorder, args):
 
-        elif type(constraint) == list:
-            remain_sense_candidates = constraint[1]
-            if ans_sense in remain_sense_candidates:
-                ans_sense_with_trans = ans_sense
-            else:
-                find_flag = 0
-                for pair in ranked_sense_scores[1:]:
-                    sense = pair[0]
-                    if sense in remain_sense_candidates:
-                        ans_sense_with_trans = sense
-                        find_flag += 1
-                        break
-                if find_flag == 0:
-                    ans_sense_with_trans = ans_sense
+    # search (a, b, c, t_smoothing) against the gold key and store the best in the parameter table
+    # (the CluBERT prior has no smoothing, so c is tuned only with --clubert and s_smoothing stays None)
 
-        line = i_id + " " + ans_sense_with_trans + "\n"
-        newf.write(line)
+    with recorder.stage("load_gold"):
+        gold = bundle.load_gold(get_key_file(test_name, t_type, lang))
 
-    newf.close()
+    if sense_freq_dict is not None:
+        p_freq = get_pair_p_freq(batch, sense_freq_dict)
+        p_freq_for = lambda s_smoothing: p_freq
+    else:
+        p_freq_for = None
 
-    evaluate_wsd(test_name, t_type, lang, out_path)
+    with recorder.stage("tune", hot=True):
+        problem = TuningProblem(batch, t_s_constraints, gold, p_freq_for, zero_sum_one=True)
+        best, n_points = tune(problem, args.search, args.step, parse_values(args.t_grid), [], sense_freq_dict is not None, args.trials, args.seed)
+    recorder.count("points", n_points)
+    del best["s_smoothing"]
 
+    params_path = args.params or "parameters_mwsd.json"
+    save_parameters(params_path, system_name, test_case, best)
+    recorder.save(params_path)
 
-def SoftConstraint(test_name, t_type, lang, out_name, base, sense_freq_dict, t_s_constraint1, t_s_constraint2, t_s_constraint3, t_s_constraint4, a, b, c, smoothing):
+    print(system_name + " " + test_case + ": " + str(n_points) + " points, best F1=" + "%.4f" % best["f1"])
+    print(" ".join(key + "=" + str(best[key]) for key in ["a", "b", "c", "t_smoothing"]) + " -> " + params_path)
 
-    out_path = "mwsd_outputs/" + out_name
-    newf = codecs.open(out_path, "w", encoding="utf-8")
-
-    for i_id, p_wsd in base.items():
-
-        ans_sense = p_wsd[0][0]
-
-        if len(p_wsd) == 1: 
-            # monosemous words
-            line = i_id + " " + ans_sense + "\n"
-            newf.write(line)
-            continue
-
-        try:
-            if type(t_s_constraint1[i_id]) == str:
-                remain_sense_candidates1 = []
-            elif type(t_s_constraint1[i_id]) == list:
-                remain_sense_candidates1 = t_s_constraint1[i_id][1]
-        except:
-            remain_sense_candidates1 = []
-        try:
-            if type(t_s_constraint2[i_id]) == str:
-                remain_sense_candidates2 = []
-            elif type(t_s_constraint2[i_id]) == list:
-                remain_sense_candidates2 = t_s_constraint2[i_id][1]
-        except:
-            remain_sense_candidates2 = []
-        try:
-            if type(t_s_constraint3[i_id]) == str:
-                remain_sense_candidates3 = []
-            elif type(t_s_constraint3[i_id]) == list:
-                remain_sense_candidates3 = t_s_constraint3[i_id][1]
-        except:
-            remain_sense_candidates3 = []
-        try:
-            if type(t_s_constraint4[i_id]) == str:
-                remain_sense_candidates4 = []
-            elif type(t_s_constraint4[i_id]) == list:
-                remain_sense_candidates4 = t_s_constraint4[i_id][1]
-        except:
-            remain_sense_candidates4 = []
-        
-        if remain_sense_candidates1 == [] and remain_sense_candidates2 == [] and remain_sense_candidates3 == [] and remain_sense_candidates4 == []:
-            ans_sense_with_trans = ans_sense
-        else:
-            p_trans = get_p_trans(p_wsd, remain_sense_candidates1, remain_sense_candidates2, remain_sense_candidates3, remain_sense_candidates4, smoothing)
-            if c: # use p_freq
-                p_freq = sense_freq_dict[i_id]
-                ranked_sense_scores = combine_all_experts(p_wsd, p_trans, p_freq, a, b, c)
-            else:
-                ranked_sense_scores = combine_all_experts_plain(p_wsd, p_trans, a, b)
-            ans_sense_with_trans = ranked_sense_scores[0][0]
 
-        tst_line = i_id + " " + ans_sense_with_trans + "\n"
-        newf.write(tst_line)
+def Stream(method, lines, newf, mapping_path_list, id_lemma_path, lemma_sense_freq, a, b, c, smoothing, recorder, batch_size=1024):
+
+    # HardConstraint / SoftConstraint over ranked-output lines sorted by id, merge-joined with the mappings
+    # (and the lemma map for CluBERT) batch by batch (memory does not grow with the number of lines)
+
+    mapping_sides = [mapping_records(path, 4) for path in mapping_path_list]
+    extra_sides = [lemma_records(id_lemma_path)] if lemma_sense_freq is not None else []
+
+    def pair_p_freq(batch, i_ids, extras):
+        sense_freq_dict = {i_id: lemma_sense_freq[extra[0]] for i_id, extra in zip(i_ids, extras) if extra[0] is not None}
+        return get_pair_p_freq(batch, sense_freq_dict, i_ids)
+
+    with recorder.stage("stream", hot=True):
+        for i_id, ans_sense_with_trans in rerank_stream(ranked_records(lines), mapping_sides, method, a, b, c, smoothing, pair_p_freq, zero_sum_one=True, extra_sides=extra_sides, batch_size=batch_size, counters=recorder.counters):
+            newf.write(i_id + " " + ans_sense_with_trans + "\n")
+
+
+def Serve(mapping_path_list, t_s_constraints, sense_freq_dict, a, b, c, smoothing, args):
+
+    # SoftConstraint service: constraints and p_freq are loaded once, requests bring the ranked senses
+    # (request candidates are keyed by the language pair of the mapping, e.g. "de-es")
 
-    newf.close()
+    names = [path.split(".")[-3] for path in mapping_path_list]
 
-    evaluate_wsd(test_name, t_type, lang, out_path)
+    def pair_p_freq(batch, i_ids):
+        return get_pair_p_freq(batch, sense_freq_dict, i_ids)
 
+    model = SoftModel(names, t_s_constraints, a, b, c, smoothing, pair_p_freq, zero_sum_one=True)
+    serve(model, args)
 
-def evaluate_wsd(test_name, t_type, lang, out_path):
+
+def get_key_file(test_name, t_type, lang):
 
     if t_type == "all":
         key_file = "mwsd_gold_keys/" + test_name + "_" + lang.lower() + ".gold.key.txt"
     else:
         key_file = "mwsd_gold_keys/" + test_name + "_" + lang.lower() + ".gold." + t_type + ".key"
 
-    cmd = [
-        "java", 
-        "Scorer", 
-        key_file,
-        out_path,
-        ]
+    return key_file
+
+
+def Fusion(test_name, t_type, lang, systems, mapping_path_list, id_lemma_path, recorder, cache, jsonl_langs, args):
+
+    # -m soft with several systems: load the constraints and p_freq, align the systems' outputs, then Fuse
+
+    clubert_path = "clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt" if args.clubert else None
+    parameters = get_fusion_parameters(systems, test_name + " " + lang.upper(), args.weights, args.params, args.clubert)
+    if len(parameters["a"]) != len(systems):
+        sys.exit("--weights needs one exponent per system (" + ", ".join(systems) + ")")
+
+    with recorder.stage("load"):
+        _, t_s_constraints, sense_freq_dict = load_resources(None, test_name, lang, t_type, mapping_path_list, id_lemma_path,
+                                                             clubert_path, args.load_workers, cache)
+        batch, p_wsd = align([get_p_wsd(system, test_name, lang, t_type) for system in systems], args.fill)
+    p_freq_key = [file_fingerprint(clubert_path), file_fingerprint(id_lemma_path)] if clubert_path else None
+    recorder.info["weights"] = parameters["a"]
 
-    b_out = subprocess.check_output(cmd)
-    s_out = b_out.decode()
+    b, c, t_smoothing = parameters["b"], parameters["c"], parameters["t_smoothing"]
+    Fuse(test_name, t_type, lang, args.out, systems, batch, p_wsd, sense_freq_dict, p_freq_key, t_s_constraints, parameters["a"], b, c, t_smoothing,
+         recorder, cache, args.java_scorer, jsonl_langs)
 
-    print(s_out.rstrip("\r\n"))
+
+def evaluate_wsd(test_name, t_type, lang, out_path, predictions, java_scorer=False, cache=None):
+
+    key_file = get_key_file(test_name, t_type, lang)
+
+    # prints P / R / F1 and returns their score counts
+    return report(key_file, predictions, out_path, java_scorer, cache)
 
 
 def main():
 
     parser = argparse.ArgumentParser(description="Test and evaluate translations for WSD methods (Multilingual WSD)")
 
-    parser.add_argument("-s", "--system", default="", help="name of the base WSD system (ims, sensembert)")
+    parser.add_argument("-s", "--system", default="", help="name of the base WSD system (ims, sensembert), or comma-separated systems fused by -m soft (ims, sensembert, sensembert.temb)")
     parser.add_argument("-t", "--test", default="", help="name of test data set (semeval2013, semeval2015)") 
     parser.add_argument("-l", "--lang", default="", help="test language (de, es, fr, it)")
     parser.add_argument("--type", default="", help="type of the test file (dev, tst, all)")
-    parser.add_argument("-m", "--method", default="", help="name of the method (hard or soft)")
+    parser.add_argument("-m", "--method", default="", help="name of the method (hard, soft, tune or serve)")
     parser.add_argument("--clubert", default=False, action="store_true", help="flag to enable CluBERT sense frequency distributions (default: False)")
     parser.add_argument("--temb", default=False, action="store_true", help="flag to enable t_emb method (only for SensEmBERT, default: False)")
     parser.add_argument("-o", "--out", default="", help="name of the output file")
+    parser.add_argument("--java-scorer", default=False, action="store_true", help="flag to score with Scorer.java instead of the in-process scorer, as a cross-check (default: False)")
+    parser.add_argument("--stream", default=False, action="store_true", help="flag to rerank ranked-output lines sorted by id from --input with bounded memory (-m hard or soft, default: False)")
+    parser.add_argument("-i", "--input", default="-", help="ranked output read by --stream (default: - for stdin)")
+    parser.add_argument("--batch-size", default=1024, type=int, help="instances reranked per batch by --stream (default: 1024)")
+    add_tune_arguments(parser, zero_sum_one=True)
+    add_server_arguments(parser)
+    add_instrument_arguments(parser)
+    add_cache_arguments(parser)
+    add_output_arguments(parser)
+    add_fusion_arguments(parser)
+    add_loader_arguments(parser)
     
     args = parser.parse_args()
 
-    parameters = {"ims": {"semeval2013 DE": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None}, 
-                          "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                          "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.5, "b": 0.5, "c": None},
-                          "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                          "semeval2015 ES": {"t_smoothing": 0.56, "a": 0.3, "b": 0.7, "c": None},
-                          "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
-                         },
-                  "ims.clubert": {"semeval2013 DE": {"t_smoothing": 0.01, "a": 0.1, "b": 0.3, "c": 0.6},
-                                  "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.5, "c": 0.4},
-                                  "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.5, "b": 0.4, "c": 0.1},
-                                  "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.8, "c": 0.1},
-                                  "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.2, "b": 0.3, "c": 0.5},
-                                  "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.8, "c": 0.1}
-                                 },
-                  "sensembert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                 "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                 "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                 "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                 "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None},
-                                 "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
-                                },
-                  "sensembert.temb": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                      "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                      "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                      "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None},
-                                      "semeval2015 ES": {"t_smoothing": 0.01, "a": 0.9, "b": 0.1, "c": None},
-                                      "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.9, "c": None}
-                                     },
-                  "sensembert.clubert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.8, "b": 0.1, "c": 0.1},
-                                         "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.8, "b": 0.1, "c": 0.1},
-                                         "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.7, "c": 0.2},
-                                         "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.3, "c": 0.6},
-                                         "semeval2015 ES": {"t_smoothing": 0.03, "a": 0.6, "b": 0.1, "c": 0.3},
-                                         "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8}
-                                        },
-                  "sensembert.temb.clubert": {"semeval2013 DE": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8},
-                                              "semeval2013 ES": {"t_smoothing": 0.00, "a": 0.1, "b": 0.2, "c": 0.7},
-                                              "semeval2013 FR": {"t_smoothing": 0.00, "a": 0.1, "b": 0.7, "c": 0.2},
-                                              "semeval2013 IT": {"t_smoothing": 0.00, "a": 0.4, "b": 0.5, "c": 0.1},
-                                              "semeval2015 ES": {"t_smoothing": 0.02, "a": 0.7, "b": 0.1, "c": 0.2},
-                                              "semeval2015 IT": {"t_smoothing": 0.00, "a": 0.1, "b": 0.1, "c": 0.8}
-                                             }
-                 }
-
     system_name = args.system
     test_name = args.test
     lang = args.lang
@@ -525,43 +438,72 @@ def main():
             print("t_emb is only for sensembert!")
             sys.exit()
         system_name = system_name + ".temb"
+    if args.method == "tune":
+        check_tune_arguments(parser, args, args.clubert, zero_sum_one=True)
 
-    base = get_p_wsd(system_name, test_name, lang, t_type)
-
-    tmp_path = "mwsd_mappings/" + test_name + "_bnsyn_trans_mapping.*." + lang + ".txt"
-    mapping_path_list = glob.glob(tmp_path)
-
-    if len(mapping_path_list) == 4: # semeval2013
-        t_s_constraint1 = load_trans_sense_constraint(test_name, mapping_path_list[0])
-        t_s_constraint2 = load_trans_sense_constraint(test_name, mapping_path_list[1])
-        t_s_constraint3 = load_trans_sense_constraint(test_name, mapping_path_list[2])
-        t_s_constraint4 = load_trans_sense_constraint(test_name, mapping_path_list[3])
-    elif len(mapping_path_list) == 2: # semeval2015
-        t_s_constraint1 = load_trans_sense_constraint(test_name, mapping_path_list[0])
-        t_s_constraint2 = load_trans_sense_constraint(test_name, mapping_path_list[1])
-        t_s_constraint3 = None
-        t_s_constraint4 = None
+    mapping_path_list = get_mapping_path_list(test_name, lang)
+    if args.method == "serve" and not mapping_path_list:
+        parser.error("-m serve needs the test data set and language of the requests (-t semeval2013 -l de, ...)")
+    recorder = recorder_from_args(args, script="translations4wsd_mwsd", system=system_name, test=test_name, lang=lang, type=t_type, method=args.method,
+                                  languages=[path.split(".")[-3] for path in mapping_path_list])
+    cache = cache_from_args(args)
+    jsonl_langs = [mapping_language(path, lang) for path in mapping_path_list] if args.jsonl else None
 
     id_lemma_path = "mwsd_mappings/" + test_name + "_" + lang + "_lemma_bnsyn_mapping.txt"
-    id_lemma_map = load_id_lemma_map(id_lemma_path)
 
-    if args.method == "hard":
-        if test_name == "semeval2013":
-            t_s_constraint_intersect = get_intersect4(t_s_constraint1, t_s_constraint2, t_s_constraint3, t_s_constraint4)
-        elif test_name == "semeval2015":
-            t_s_constraint_intersect = get_intersect2(t_s_constraint1, t_s_constraint2)
-        HardConstraint(test_name, t_type, lang, args.out, base, t_s_constraint_intersect)
+    systems = system_name.split(",")
+    if len(systems) > 1:
+        if args.method != "soft" or args.stream:
+            parser.error("several systems (-s " + system_name + ") are fused by -m soft only")
+        Fusion(test_name, t_type, lang, systems, mapping_path_list, id_lemma_path, recorder, cache, jsonl_langs, args)
+        return
+    if args.weights:
+        parser.error("--weights is for several systems fused by -m soft (-s SYSTEM1,SYSTEM2,...)")
 
-    elif args.method == "soft":
-        if args.clubert:
+    if args.stream: # mappings are read in id order instead of loaded; output goes to stdout unless -o is given
+        test_case = test_name + " " + lang.upper()
+        if args.method == "soft" and args.clubert:
             system_name = system_name + ".clubert"
-            file_path = "clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt"
-            sense_freq_dict = get_p_freq(file_path, id_lemma_map)
+            lemma_pos_set = set(bundle.load_lemma_map(id_lemma_path).lemma_pos.tolist()) # streamed lines only look these up
+            lemma_sense_freq = get_lemma_sense_freq("clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt", lemma_pos_set)
         else:
-            sense_freq_dict = None
-        test_case = test_name + " " + lang.upper()
-        a, b, c, t_smoothing = parameters[system_name][test_case]["a"], parameters[system_name][test_case]["b"], parameters[system_name][test_case]["c"], parameters[system_name][test_case]["t_smoothing"]
-        SoftConstraint(test_name, t_type, lang, args.out, base, sense_freq_dict, t_s_constraint1, t_s_constraint2, t_s_constraint3, t_s_constraint4, a, b, c, t_smoothing)
+            lemma_sense_freq = None
+        parameters = get_parameters(system_name, test_case, args.params)
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        with open_output("mwsd_outputs/" + args.out if args.out else "") as newf:
+            Stream(args.method, input_lines(args.input), newf, mapping_path_list, id_lemma_path, lemma_sense_freq, a, b, c, t_smoothing, recorder, args.batch_size)
+        if args.out:
+            recorder.save("mwsd_outputs/" + args.out)
+        return
+
+    # base output, mappings and CluBERT distributions are independent, so they are loaded side by side
+    clubert_path = "clubert_v1.0/" + lang + "/lexemes_distributions.bnid.txt" if args.clubert and args.method in ("soft", "tune", "serve") else None
+    with recorder.stage("load"):
+        base, t_s_constraints, sense_freq_dict = load_resources(system_name if args.method != "serve" else None, test_name, lang, t_type,
+                                                                mapping_path_list, id_lemma_path, clubert_path, args.load_workers, cache)
+    if clubert_path:
+        system_name = system_name + ".clubert"
+    test_case = test_name + " " + lang.upper()
+
+    if args.method == "hard":
+        HardConstraint(test_name, t_type, lang, args.out, base, t_s_constraints, recorder, cache, args.java_scorer, jsonl_langs)
+
+    elif args.method == "soft":
+        p_freq_key = [file_fingerprint(clubert_path), file_fingerprint(id_lemma_path)] if clubert_path else None
+        parameters = get_parameters(system_name, test_case, args.params)
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        SoftConstraint(test_name, t_type, lang, args.out, base, sense_freq_dict, p_freq_key, t_s_constraints, a, b, c, t_smoothing, recorder, cache, args.java_scorer, jsonl_langs)
+
+    elif args.method == "tune":
+        Tune(test_name, t_type, lang, system_name, test_case, base, sense_freq_dict, t_s_constraints, recorder, args)
+
+    elif args.method == "serve":
+        empty = [path for path, t_s_constraint in zip(mapping_path_list, t_s_constraints) if len(t_s_constraint) == 0]
+        if empty:
+            parser.error("no instance in " + ", ".join(empty))
+        parameters = get_parameters(system_name, test_case, args.params)
+        a, b, c, t_smoothing = parameters["a"], parameters["b"], parameters["c"], parameters["t_smoothing"]
+        Serve(mapping_path_list, t_s_constraints, sense_freq_dict, a, b, c, t_smoothing, args)
         
 
 if __name__ == "__main__":